@@ -0,0 +1,121 @@
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+HOURS = 24
+DAYS = 7
+
+
+def hour_and_weekday(timestamps):
+    """Hour of day and weekday (Monday=0) for an array of wall-clock datetime64 values."""
+    seconds = np.asarray(timestamps).astype('datetime64[s]').astype(np.int64)
+    days = np.floor_divide(seconds, 86400)
+    hours = np.floor_divide(seconds - days * 86400, 3600)
+    # 1970-01-01 was a Thursday
+    weekdays = (days + 3) % 7
+    return hours, weekdays
+
+
+def wall_clock(dt):
+    """Drop the timezone but keep the local wall-clock time, as datetime.hour does."""
+    return np.datetime64(dt.replace(tzinfo=None), 's')
+
+
+class ActivityCube:
+    """Fixed 7x24 (weekday x hour) rollup of one user's activity.
+
+    Holds message counts, sentiment sums (with their own counts, so means are
+    defined when only some messages are scored) and per-mood counts. Updates
+    are a bincount over the flat cell index; every hour or day pattern is a
+    sum over one axis of these arrays.
+    """
+
+    def __init__(self, moods: Optional[List[str]] = None):
+        self.moods = list(moods or [])
+        self.messages = np.zeros((DAYS, HOURS), dtype=np.int64)
+        self.sentiment_sum = np.zeros((DAYS, HOURS))
+        self.sentiment_count = np.zeros((DAYS, HOURS), dtype=np.int64)
+        self.mood_counts = np.zeros((DAYS, HOURS, len(self.moods)), dtype=np.int64)
+
+    def add(self, timestamps, sentiment=None, mood_ids=None, count_messages: bool = True):
+        """Add a batch of events.
+
+        ``sentiment`` may contain NaN for events without a score; ``mood_ids``
+        may contain -1 for events without a dominant mood.
+        """
+        hours, weekdays = hour_and_weekday(timestamps)
+        cells = weekdays * HOURS + hours
+        size = DAYS * HOURS
+
+        if count_messages:
+            self.messages += np.bincount(cells, minlength=size).reshape(DAYS, HOURS)
+
+        if sentiment is not None:
+            sentiment = np.asarray(sentiment, dtype=np.float64)
+            scored = ~np.isnan(sentiment)
+            self.sentiment_sum += np.bincount(cells[scored], weights=sentiment[scored],
+                                              minlength=size).reshape(DAYS, HOURS)
+            self.sentiment_count += np.bincount(cells[scored], minlength=size).reshape(DAYS, HOURS)
+
+        if mood_ids is not None:
+            mood_ids = np.asarray(mood_ids, dtype=np.int64)
+            has_mood = mood_ids >= 0
+            np.add.at(self.mood_counts, (weekdays[has_mood], hours[has_mood], mood_ids[has_mood]), 1)
+
+    def merge(self, other: 'ActivityCube'):
+        """Fold another cube (e.g. from a later batch) into this one."""
+        self.messages += other.messages
+        self.sentiment_sum += other.sentiment_sum
+        self.sentiment_count += other.sentiment_count
+        self.mood_counts += other.mood_counts
+
+    def hourly_counts(self) -> np.ndarray:
+        return self.messages.sum(axis=0)
+
+    def daily_counts(self) -> np.ndarray:
+        return self.messages.sum(axis=1)
+
+    def hourly_activity(self) -> Dict[int, int]:
+        """Messages per hour, only hours with activity."""
+        counts = self.hourly_counts()
+        return {int(h): int(counts[h]) for h in np.flatnonzero(counts)}
+
+    def daily_activity(self) -> Dict[str, int]:
+        """Messages per weekday name, only days with activity."""
+        counts = self.daily_counts()
+        return {DAY_NAMES[d]: int(counts[d]) for d in np.flatnonzero(counts)}
+
+    def top_hours(self, k: int = 3) -> Dict[int, int]:
+        """The k busiest hours, busiest first (like value_counts().head(k))."""
+        counts = self.hourly_counts()
+        order = np.argsort(-counts, kind='stable')[:k]
+        return {int(h): int(counts[h]) for h in order if counts[h] > 0}
+
+    def top_days(self, k: int = 3) -> Dict[str, int]:
+        """The k busiest weekdays, busiest first."""
+        counts = self.daily_counts()
+        order = np.argsort(-counts, kind='stable')[:k]
+        return {DAY_NAMES[d]: int(counts[d]) for d in order if counts[d] > 0}
+
+    def weekday_sentiment_mean(self) -> np.ndarray:
+        """Mean sentiment per weekday (NaN for days without scores)."""
+        sums = self.sentiment_sum.sum(axis=1)
+        counts = self.sentiment_count.sum(axis=1)
+        return np.divide(sums, counts, out=np.full(DAYS, np.nan), where=counts > 0)
+
+    def hourly_moods(self) -> Dict[int, Dict[str, int]]:
+        """Per-hour mood counts, only hours and moods that occurred."""
+        by_hour = self.mood_counts.sum(axis=0)
+        return {
+            int(h): {self.moods[m]: int(by_hour[h, m]) for m in np.flatnonzero(by_hour[h])}
+            for h in np.flatnonzero(by_hour.sum(axis=1))
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'messages': self.messages.tolist(),
+            'sentiment_sum': self.sentiment_sum.tolist(),
+            'sentiment_count': self.sentiment_count.tolist(),
+            'moods': self.moods,
+            'mood_counts': self.mood_counts.tolist()
+        }
@@ -3,19 +3,27 @@ import sys
 import json
 from datetime import datetime, timedelta
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from textblob import TextBlob
 import re
 from collections import defaultdict, Counter
 import warnings
 import statistics
+from typing import Dict, List, Any
 warnings.filterwarnings('ignore')
 
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from instrumentation import metrics, export_metrics_from_env
+from time_index import UserTimeSeriesIndex, to_epoch_ns
+from timeline_pyramid import TimelinePyramid
+from activity_cube import ActivityCube
+from local_time import local_times, calendar_fields, utc_to_local, user_timezone
+from cohort_aggregates import cohort_store_from_env
+from checkpoint import write_json_atomic
+from report_state import ReportState
+from topics import SpaceSavingTopK, topic_words
+from sessions import SessionSegmenter, DEFAULT_GAP_MINUTES
+
 class MentalHealthAnalyzer:
     def __init__(self):
         self.mood_keywords = {
@@ -29,9 +37,22 @@ class MentalHealthAnalyzer:
             'lastimar', 'dolor insoportable', 'no puedo más', 'sin esperanza'
         ]
         
+        # Per-user prefix-sum indexes over the mood timeline
+        self.time_indexes = {}
+        
+        # Per-user hour x weekday rollups
+        self.activity_cubes = {}
+        
+        # Per-user multi-resolution mood timelines for the dashboards
+        self.timeline_pyramids = {}
+        
+        # Population aggregates for the dashboards (None unless ANALYTICS_COHORT_STORE is set)
+        self.cohort_store = cohort_store_from_env()
+        
     def analyze_sentiment(self, text):
         """Analyze sentiment using TextBlob and custom keywords"""
         # TextBlob sentiment analysis
+        from textblob import TextBlob
         blob = TextBlob(text)
         polarity = blob.sentiment.polarity
         
@@ -61,24 +82,35 @@ class MentalHealthAnalyzer:
             'crisis_score': len(indicators_found) / len(self.crisis_indicators)
         }
     
-    def analyze_conversation_patterns(self, messages):
+    def analyze_conversation_patterns(self, messages, user_id=None):
         """Analyze patterns in conversation data"""
         if not messages:
             return {}
-            
+        
+        import pandas as pd
         df = pd.DataFrame(messages)
         df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['hour'] = df['timestamp'].dt.hour
-        df['day_of_week'] = df['timestamp'].dt.day_name()
         
         # Analyze user messages only
         user_messages = df[df['sender'] == 'user']
         
+        timestamps = user_messages['timestamp']
+        zone = user_timezone(user_id, messages)
+        if zone is not None:
+            utc = timestamps.dt.tz_convert('UTC').dt.tz_localize(None) if timestamps.dt.tz is not None else timestamps
+            local = utc_to_local(utc.values.astype('datetime64[ns]').astype(np.int64), zone).astype('datetime64[ns]')
+        else:
+            local = (timestamps.dt.tz_localize(None) if timestamps.dt.tz is not None else timestamps).values
+        activity_cube = ActivityCube()
+        activity_cube.add(local)
+        if user_id is not None:
+            self.activity_cubes[user_id] = activity_cube
+        
         patterns = {
             'total_messages': len(user_messages),
             'avg_message_length': user_messages['content'].str.len().mean(),
-            'most_active_hours': user_messages['hour'].value_counts().head(3).to_dict(),
-            'most_active_days': user_messages['day_of_week'].value_counts().head(3).to_dict(),
+            'most_active_hours': activity_cube.top_hours(3),
+            'most_active_days': activity_cube.top_days(3),
             'conversation_frequency': self._calculate_frequency(user_messages['timestamp'])
         }
         
@@ -135,8 +167,11 @@ class MentalHealthAnalyzer:
         if 'mood_timeline' in analysis_data:
             timeline = analysis_data['mood_timeline']
             if timeline:
-                recent_sentiments = [item['sentiment_score'] for item in timeline[-5:]]
-                avg_recent_sentiment = np.mean(recent_sentiments)
+                time_index = self.time_indexes.get(analysis_data.get('user_id'))
+                if time_index is not None and len(time_index) == len(timeline):
+                    avg_recent_sentiment = time_index.last_n('sentiment_score', 5)['mean']
+                else:
+                    avg_recent_sentiment = np.mean([item['sentiment_score'] for item in timeline[-5:]])
                 
                 if avg_recent_sentiment < -0.3:
                     insights.append({
@@ -155,7 +190,8 @@ class MentalHealthAnalyzer:
         
         # Crisis indicators
         crisis_messages = [item for item in analysis_data.get('mood_timeline', []) if item['crisis_score'] > 0]
-        if crisis_messages:
+        # An incremental report's timeline is a sample; its average still counts every message
+        if crisis_messages or analysis_data.get('summary_stats', {}).get('avg_crisis_score', 0) > 0:
             insights.append({
                 'type': 'alert',
                 'category': 'crisis',
@@ -178,6 +214,9 @@ class MentalHealthAnalyzer:
     
     def create_visualizations(self, analysis_data, output_dir='analysis_output'):
         """Create visualizations for the analysis"""
+        import pandas as pd
+        import matplotlib.pyplot as plt
+        
         os.makedirs(output_dir, exist_ok=True)
         
         # Mood timeline plot
@@ -228,36 +267,110 @@ class MentalHealthAnalyzer:
         
         print(f"Visualizaciones guardadas en: {output_dir}")
     
-    def generate_report(self, user_id, messages, output_file='mental_health_report.json'):
-        """Generate comprehensive analysis report"""
+    def generate_report(self, user_id, messages, output_file='mental_health_report.json', charts=True,
+                        state_dir=None, timeline_points=500):
+        """Generate comprehensive analysis report
+        
+        With ``state_dir``, the user's aggregates and high-water mark are kept
+        there and only messages newer than the last run are scored; the
+        timeline is then the state's bounded sample and its exact levels.
+        
+        Insights use the full timeline, but the saved report and chart keep at
+        most ``timeline_points`` shape-preserving entries, plus hour/day/week
+        min/mean/max levels under ``mood_timeline_levels`` (None keeps all).
+        """
         print(f"Analizando datos para usuario {user_id}...")
         
         # Perform all analyses
-        mood_timeline = self.generate_mood_timeline(messages, user_id)
-        conversation_patterns = self.analyze_conversation_patterns(messages)
+        timeline_levels = None
+        if state_dir is not None:
+            mood_timeline, conversation_patterns, summary_stats, timeline_levels = self._merge_new_messages(
+                user_id, messages, state_dir, timeline_points
+            )
+        else:
+            with metrics.stage('report.sentiment'):
+                mood_timeline = self.generate_mood_timeline(messages, user_id)
+            with metrics.stage('report.conversation_patterns'):
+                conversation_patterns = self.analyze_conversation_patterns(messages, user_id)
+            summary_stats = self._calculate_summary_stats(mood_timeline, conversation_patterns)
+            metrics.count('report.messages_processed', len(messages))
+        
+        self.time_indexes[user_id] = UserTimeSeriesIndex.from_records(
+            mood_timeline, ['sentiment_score', 'crisis_score']
+        )
         
         analysis_data = {
             'user_id': user_id,
             'analysis_date': datetime.now().isoformat(),
             'mood_timeline': mood_timeline,
             'conversation_patterns': conversation_patterns,
-            'summary_stats': self._calculate_summary_stats(mood_timeline, conversation_patterns)
+            'summary_stats': summary_stats
         }
         
         # Generate insights
-        insights = self.generate_insights(analysis_data)
+        with metrics.stage('report.insights'):
+            insights = self.generate_insights(analysis_data)
         analysis_data['insights'] = insights
         
+        if self.cohort_store is not None:
+            self.cohort_store.record_report(analysis_data)
+        
+        # Bound the stored timeline for long-term users
+        with metrics.stage('report.timeline_levels'):
+            pyramid = TimelinePyramid.from_records(mood_timeline, ['sentiment_score', 'crisis_score'])
+            self.timeline_pyramids[user_id] = pyramid
+            if timeline_points is not None:
+                analysis_data['mood_timeline_levels'] = (timeline_levels if timeline_levels is not None
+                                                         else pyramid.to_dict(timeline_points))
+                if len(mood_timeline) > timeline_points:
+                    keep = np.sort(pyramid.downsample('sentiment_score', timeline_points))
+                    analysis_data['mood_timeline'] = [mood_timeline[i] for i in keep.tolist()]
+        
         # Create visualizations
-        self.create_visualizations(analysis_data)
+        if charts:
+            with metrics.stage('report.charts'):
+                self.create_visualizations(analysis_data)
         
         # Save report
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(analysis_data, f, ensure_ascii=False, indent=2, default=str)
+        with metrics.stage('report.write_json'):
+            write_json_atomic(output_file, analysis_data)
         
         print(f"Reporte generado: {output_file}")
         return analysis_data
     
+    def _merge_new_messages(self, user_id, messages, state_dir, timeline_points=None):
+        """Score only messages past the user's watermark and merge them into the saved state"""
+        state = ReportState.load(state_dir, user_id)
+        state.points = timeline_points or state.points
+        user_messages = [{**msg, 'content': msg.get('content', '')}
+                         for msg in messages if msg.get('sender') == 'user']
+        fresh = state.select_new(user_messages)
+        metrics.count('report.messages_skipped', len(user_messages) - len(fresh))
+        
+        with metrics.stage('report.sentiment'):
+            new_entries = self.generate_mood_timeline([msg for _, _, msg in fresh], user_id)
+        with metrics.stage('report.conversation_patterns'):
+            state.merge(fresh, new_entries, user_timezone(user_id, messages))
+            conversation_patterns = state.conversation_patterns()
+        metrics.count('report.messages_processed', len(fresh))
+        
+        with metrics.stage('report.write_state'):
+            state.save(state_dir)
+        
+        self.activity_cubes[user_id] = state.activity_cube()
+        return (state.timeline_sample, conversation_patterns, state.summary_stats(conversation_patterns),
+                state.timeline_levels_dict(state.points))
+    
+    def window_summary(self, user_id, start=None, end=None):
+        """Sentiment and crisis stats for any time range of a reported user"""
+        time_index = self.time_indexes.get(user_id)
+        if time_index is None:
+            return {}
+        return {
+            'sentiment': time_index.range_stats('sentiment_score', start, end),
+            'crisis': time_index.range_stats('crisis_score', start, end)
+        }
+    
     def _calculate_summary_stats(self, mood_timeline, conversation_patterns):
         """Calculate summary statistics"""
         if not mood_timeline:
@@ -321,15 +434,26 @@ def calculate_sentiment_score(sentiment_counts: Dict[str, int]) -> float:
     
     return (positive - total_negative) / (positive + total_negative)
 
-def analyze_message_patterns(messages: List[Dict]) -> Dict[str, Any]:
-    """Analyze patterns in chat messages."""
+def analyze_message_patterns(messages: List[Dict], activity_cube: ActivityCube = None,
+                             topic_capacity: int = 1000, trending=None,
+                             session_gap_minutes: float = DEFAULT_GAP_MINUTES, timezone: str = None) -> Dict[str, Any]:
+    """Analyze patterns in chat messages.
+    
+    Pass a user's ``activity_cube`` to keep its hour x weekday rollup up to date
+    across calls; otherwise a fresh cube is used for this batch. Topics are
+    tracked in at most ``topic_capacity`` counters. A platform-wide
+    ``trending`` tracker (see trending_topics.py) is fed the same topic words.
+    Sessions are split after ``session_gap_minutes`` of inactivity. Hours,
+    days and weeks are local to ``timezone`` (default: see user_timezone).
+    """
     if not messages:
         return {}
     
-    # Time-based analysis
-    hourly_activity = defaultdict(int)
-    daily_activity = defaultdict(int)
-    weekly_activity = defaultdict(int)
+    # Time-based analysis: hour x weekday rollup plus ISO week counts, in the user's zone
+    activity_cube = activity_cube if activity_cube is not None else ActivityCube()
+    zone = timezone or user_timezone(messages=messages)
+    cube_times = []
+    cube_sentiment = []
     
     # Sentiment analysis
     sentiment_scores = []
@@ -337,55 +461,69 @@ def analyze_message_patterns(messages: List[Dict]) -> Dict[str, Any]:
     
     # Message characteristics
     message_lengths = []
-    response_times = []
     
-    # Topic analysis
-    common_topics = Counter()
+    # Session segmentation inputs
+    session_times = []
+    session_from_user = []
     
-    for i, message in enumerate(messages):
-        try:
-            # Parse timestamp
-            timestamp = datetime.fromisoformat(message.get('timestamp', '').replace('Z', '+00:00'))
+    # Topic analysis: fixed-size heavy-hitter summary
+    common_topics = SpaceSavingTopK(topic_capacity)
+    
+    failed = 0
+    with metrics.stage('chat.message_patterns'):
+        for i, message in enumerate(messages):
+            try:
+                # Parse timestamp
+                timestamp = datetime.fromisoformat(message.get('timestamp', '').replace('Z', '+00:00'))
             
-            # Time-based patterns
-            hourly_activity[timestamp.hour] += 1
-            daily_activity[timestamp.strftime('%A')] += 1
-            weekly_activity[timestamp.isocalendar()[1]] += 1
+                # Time-based patterns
+                cube_times.append(timestamp)
+                cube_sentiment.append(np.nan)
+                session_times.append(to_epoch_ns(timestamp))
+                session_from_user.append(message.get('sender') == 'user')
             
-            # Only analyze user messages (not Ana's responses)
-            if message.get('sender') == 'user':
-                content = message.get('message', '')
-                
-                # Sentiment analysis
-                sentiment_counts = analyze_sentiment_keywords(content)
-                sentiment_score = calculate_sentiment_score(sentiment_counts)
-                sentiment_scores.append(sentiment_score)
-                sentiment_over_time.append({
-                    'timestamp': timestamp.isoformat(),
-                    'score': sentiment_score,
-                    'counts': sentiment_counts
-                })
+                # Only analyze user messages (not Ana's responses)
+                if message.get('sender') == 'user':
+                    content = message.get('message', '')
                 
-                # Message characteristics
-                message_lengths.append(len(content))
+                    # Sentiment analysis
+                    sentiment_counts = analyze_sentiment_keywords(content)
+                    sentiment_score = calculate_sentiment_score(sentiment_counts)
+                    sentiment_scores.append(sentiment_score)
+                    cube_sentiment[-1] = sentiment_score
+                    sentiment_over_time.append({
+                        'timestamp': timestamp.isoformat(),
+                        'score': sentiment_score,
+                        'counts': sentiment_counts
+                    })
                 
-                # Simple topic extraction (common words)
-                words = re.findall(r'\b\w+\b', content.lower())
-                # Filter out common stop words
-                stop_words = {'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'es', 'se', 'no', 'te', 'lo', 'le', 'da', 'su', 'por', 'son', 'con', 'para', 'al', 'del', 'los', 'las', 'me', 'mi', 'tu', 'si', 'yo', 'he', 'ha', 'muy', 'más', 'pero', 'como', 'todo', 'una', 'está', 'ser', 'hacer', 'puede', 'bien', 'ya', 'vez', 'día', 'vida', 'tiempo'}
-                meaningful_words = [word for word in words if len(word) > 3 and word not in stop_words]
-                common_topics.update(meaningful_words)
+                    # Message characteristics
+                    message_lengths.append(len(content))
                 
-                # Calculate response time if there's a previous message
-                if i > 0:
-                    prev_timestamp = datetime.fromisoformat(messages[i-1].get('timestamp', '').replace('Z', '+00:00'))
-                    response_time = (timestamp - prev_timestamp).total_seconds() / 60  # in minutes
-                    if response_time < 60:  # Only consider responses within an hour
-                        response_times.append(response_time)
+                    # Simple topic extraction (common words, without stop words)
+                    words = topic_words(content)
+                    common_topics.update(words)
+                    if trending is not None:
+                        trending.add_terms(words, timestamp)
         
-        except Exception as e:
-            print(f"Error processing message {i}: {e}")
-            continue
+            except Exception as e:
+                failed += 1
+                metrics.record_error('chat.message_patterns', e, i)
+                continue
+    
+    metrics.count('chat.messages_processed', len(messages) - failed)
+    if failed:
+        print(f"⚠️ {failed} mensajes no pudieron procesarse")
+    
+    local = local_times(cube_times, zone)
+    activity_cube.add(local, sentiment=cube_sentiment)
+    weekly_activity = Counter(calendar_fields(local)['iso_week'].tolist())
+    hourly_activity = activity_cube.hourly_activity()
+    daily_activity = activity_cube.daily_activity()
+    
+    with metrics.stage('chat.sessions'):
+        segmenter = SessionSegmenter(session_gap_minutes)
+        session_patterns = segmenter.summarize(segmenter.segment(session_times, session_from_user))
     
     # Calculate statistics
     analysis_results = {
@@ -393,8 +531,8 @@ def analyze_message_patterns(messages: List[Dict]) -> Dict[str, Any]:
         'user_messages': len([m for m in messages if m.get('sender') == 'user']),
         'ana_responses': len([m for m in messages if m.get('sender') == 'ana']),
         'time_patterns': {
-            'hourly_activity': dict(hourly_activity),
-            'daily_activity': dict(daily_activity),
+            'hourly_activity': hourly_activity,
+            'daily_activity': daily_activity,
             'weekly_activity': dict(weekly_activity),
             'most_active_hour': max(hourly_activity.items(), key=lambda x: x[1])[0] if hourly_activity else None,
             'most_active_day': max(daily_activity.items(), key=lambda x: x[1])[0] if daily_activity else None
@@ -409,9 +547,11 @@ def analyze_message_patterns(messages: List[Dict]) -> Dict[str, Any]:
         'message_characteristics': {
             'average_length': statistics.mean(message_lengths) if message_lengths else 0,
             'median_length': statistics.median(message_lengths) if message_lengths else 0,
-            'average_response_time': statistics.mean(response_times) if response_times else 0,
-            'median_response_time': statistics.median(response_times) if response_times else 0
+            # Response time is the user's reply latency to Ana within sessions (0 without exchanges)
+            'average_response_time': session_patterns.get('avg_user_latency_minutes') or 0,
+            'median_response_time': session_patterns.get('median_user_latency_minutes') or 0
         },
+        'session_patterns': session_patterns,
         'common_topics': dict(common_topics.most_common(10)),
         'analysis_timestamp': datetime.now().isoformat()
     }
@@ -422,8 +562,10 @@ def main():
     """Main function to run chat data analysis."""
     print("🔍 Iniciando análisis de datos de chat...")
     
-    # Sample data for demonstration (in a real scenario, this would come from MongoDB)
-    sample_messages = [
+    # History from the message log when one is configured, else sample data for demonstration
+    # (in a real scenario, this would come from MongoDB)
+    from message_log import messages_from_env
+    sample_messages = messages_from_env() or [
         {
             'sender': 'user',
             'message': 'Hola Ana, me siento muy triste hoy',
@@ -486,7 +628,7 @@ def main():
         mc = results['message_characteristics']
         print(f"\n📝 Características de Mensajes:")
         print(f"  • Longitud promedio: {mc.get('average_length', 0):.1f} caracteres")
-        print(f"  • Tiempo de respuesta promedio: {mc.get('average_response_time', 0):.1f} minutos")
+        print(f"  • Tiempo de respuesta promedio (usuario a Ana): {mc.get('average_response_time', 0):.1f} minutos")
     
     if results.get('common_topics'):
         print(f"\n🏷️ Temas Comunes:")
@@ -497,10 +639,12 @@ def main():
     
     # Save results to file
     output_file = 'chat_analysis_results.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    with metrics.stage('chat.write_json'):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
     
     print(f"📄 Resultados guardados en: {output_file}")
+    export_metrics_from_env()
 
 if __name__ == "__main__":
     main()
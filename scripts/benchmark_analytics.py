@@ -0,0 +1,490 @@
+import os
+import sys
+import io
+import gc
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+from datetime import datetime
+from collections import Counter
+from typing import Dict, List, Any, Callable, Optional
+import numpy as np
+
+# Make the sibling analysis scripts importable when run from any directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Data scales: chat corpus size and user population (mood benchmarks sample from the same users)
+SCALES = {
+    'small': {'messages': 1_000, 'users': 1_000},
+    'medium': {'messages': 100_000, 'users': 100_000},
+    'large': {'messages': 10_000_000, 'users': 1_000_000},
+}
+
+# Cold-start budget for importing crisis_detection and scoring one message.
+# TextBlob (and the NLTK import it triggers) accounts for most of it.
+STARTUP_BUDGET_SECONDS = 2.5
+
+_STARTUP_PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {scripts_dir!r})
+from crisis_detection import CrisisDetectionSystem
+imported = time.perf_counter()
+heavy = sorted(m for m in ('pandas', 'sklearn', 'matplotlib', 'seaborn', 'scipy', 'textblob') if m in sys.modules)
+CrisisDetectionSystem().analyze_text_for_crisis('No puedo más con esta situación')
+scored = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'total': scored - start, 'modules': heavy}}))
+'''
+
+# Corpus scorer vs per-message scan: sampled messages plus texts that stress tokenization
+PARITY_SAMPLE = 2000
+PARITY_EDGE_CASES = [
+    '',
+    'no  puedo más',
+    'no puedo   más, de verdad',
+    'no,puedo más',
+    '¡¡No puedo más!!... sin esperanza.',
+    'no\tpuedo más',
+    'xno puedo másss y todo está perdidooo',
+    'quiero matarme;suicidarme?',
+    'desesperanza: sin-esperanza, sin  esperanza',
+    'nadie me entiende...nadie  me entiende',
+    '  mejor muerto  ',
+    'mi familia/amigos me dan apoyo; quiero mejorar mañana'
+]
+
+# Fixed end date so every run generates the same corpus
+CORPUS_END = datetime(2024, 2, 1)
+CORPUS_DAYS = 30
+
+
+def corpus_users(n_messages: int, n_users: int, limit: Optional[int] = None, seed: int = 42) -> np.ndarray:
+    """User ids whose chats make up the benchmark corpus.
+
+    The whole population when it fits in ``limit`` messages; otherwise a
+    random subset of users expected to hold about ``limit`` messages.
+    Each user's data only depends on its id, so the subset is a fair sample.
+    """
+    population = np.arange(1, n_users + 1)
+    if not limit or n_messages <= limit:
+        return population
+    size = max(1, int(n_users * limit / n_messages))
+    return np.sort(np.random.default_rng(seed).choice(population, size=size, replace=False))
+
+
+def build_chat_corpus(n_messages: int, n_users: int = 100, crisis_rate: float = 0.05, seed: int = 42,
+                      limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Build a deterministic synthetic chat corpus of message dicts, sorted by time.
+
+    Messages come from SyntheticDataGenerator with a per-user rate chosen so
+    that ``n_users`` users produce about ``n_messages`` messages (user plus
+    Ana) over CORPUS_DAYS. With ``limit`` only a random sample of users is
+    materialized (see corpus_users), so large scales stay runnable.
+    """
+    from synthetic_data import SyntheticDataGenerator
+
+    generator = SyntheticDataGenerator(seed=seed, crisis_rate=crisis_rate)
+    generator.messages_per_day = n_messages / (n_users * CORPUS_DAYS * (1 + generator.ana_reply_rate))
+
+    chunks = list(generator.iter_chunks('chat', corpus_users(n_messages, n_users, limit, seed).tolist(),
+                                        CORPUS_DAYS, end=CORPUS_END))
+    if not chunks:
+        return []
+    timestamps = np.concatenate([chunk['timestamp'].values for chunk in chunks]).astype('datetime64[s]')
+    order = np.argsort(timestamps, kind='stable')
+    user_ids = np.concatenate([chunk['user_id'].values for chunk in chunks])[order].tolist()
+    senders = np.concatenate([chunk['sender'].values for chunk in chunks])[order].tolist()
+    texts = np.concatenate([chunk['message'].values.astype(object) for chunk in chunks])[order].tolist()
+    iso = (np.datetime_as_string(timestamps[order], unit='s').astype(object) + 'Z').tolist()
+
+    return [
+        {
+            'id': str(i),
+            'user_id': user_ids[i],
+            'sender': senders[i],
+            'content': texts[i],
+            'message': texts[i],
+            'timestamp': iso[i]
+        }
+        for i in range(len(order))
+    ]
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds"""
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    arr = np.asarray(samples) * 1000.0
+    return {
+        'p50': float(np.percentile(arr, 50)),
+        'p95': float(np.percentile(arr, 95)),
+        'p99': float(np.percentile(arr, 99)),
+        'max': float(arr.max())
+    }
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence the analyzers' progress prints while timing."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def check_crisis_parity(detector, texts: List[str]) -> Dict[str, Any]:
+    """Compare CrisisCorpusScorer with score_text (the analyze_text_for_crisis scan), sentiment off.
+
+    Indicators and protective factors must match exactly and scores within
+    float tolerance; returns the number checked and the mismatching texts.
+    """
+    from crisis_corpus import CrisisCorpusScorer
+    scorer = CrisisCorpusScorer(detector)
+    batch = scorer.to_message_results(scorer.score_corpus(texts, include_sentiment=False))
+    mismatches = []
+    for text, corpus_result in zip(texts, batch):
+        expected = detector.score_text(text, sentiment=False)
+        same = (corpus_result['indicators_found'] == expected['indicators_found']
+                and corpus_result['protective_factors'] == expected['protective_factors']
+                and corpus_result['risk_level'] == expected['risk_level']
+                and np.isclose(corpus_result['risk_score'], expected['risk_score'])
+                and all(np.isclose(corpus_result['crisis_scores'][c], expected['crisis_scores'][c])
+                        for c in expected['crisis_scores']))
+        if not same:
+            mismatches.append(text)
+    return {'checked': len(texts), 'mismatches': len(mismatches), 'examples': mismatches[:5]}
+
+
+class BenchmarkRunner:
+    """Time analytics hot paths and collect throughput, latency and memory."""
+
+    def __init__(self, seed=42, sample_limit=20_000, repeats=3, measure_memory=True,
+                 corpus_limit=500_000, user_sample=200):
+        self.seed = seed
+        self.sample_limit = sample_limit
+        # Message dicts materialized per scale, and users sampled for the per-user mood benchmarks
+        self.corpus_limit = corpus_limit
+        self.user_sample = user_sample
+        self.repeats = repeats
+        self.measure_memory = measure_memory
+        self.results = []
+        self.parity = []
+
+    def _peak_memory_mb(self, fn: Callable[[], Any]) -> Optional[float]:
+        """Run fn once under tracemalloc and report the peak allocation."""
+        if not self.measure_memory:
+            return None
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with _quiet():
+                fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return peak / (1024 * 1024)
+
+    def bench_per_item(self, name, scale, unit, fn, items, population=None):
+        """Benchmark a function called once per item (message or user)."""
+        population = population or len(items)
+        items = items[:self.sample_limit] if self.sample_limit else items
+        latencies = []
+        with _quiet():
+            # Warm-up call so lazy imports are not counted as per-item latency
+            if items:
+                fn(items[0])
+            start = time.perf_counter()
+            for item in items:
+                t0 = time.perf_counter()
+                fn(item)
+                latencies.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - start
+
+        peak = self._peak_memory_mb(lambda: [fn(item) for item in items[:1000]])
+        self._record(name, scale, unit, len(items), elapsed, latencies, peak, population)
+
+    def bench_batch(self, name, scale, unit, fn, n_items, population=None):
+        """Benchmark a function that processes a whole corpus per call."""
+        latencies = []
+        with _quiet():
+            for _ in range(self.repeats):
+                t0 = time.perf_counter()
+                fn()
+                latencies.append(time.perf_counter() - t0)
+
+        peak = self._peak_memory_mb(fn)
+        self._record(name, scale, unit, n_items, min(latencies), latencies, peak, population)
+
+    def _record(self, name, scale, unit, n_items, elapsed, latencies, peak, population=None):
+        """Store one result; ``items`` is the effective sample, ``population`` what the scale asked for."""
+        result = {
+            'benchmark': name,
+            'scale': scale,
+            'unit': unit,
+            'items': n_items,
+            'population': population or n_items,
+            'seconds': elapsed,
+            'throughput': n_items / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': _percentiles(latencies),
+            'peak_memory_mb': peak
+        }
+        self.results.append(result)
+        print(f"  • {name:<45} {result['throughput']:>12.1f} {unit}/s  "
+              f"p95={result['latency_ms']['p95']:.3f} ms  n={n_items:,}/{result['population']:,}")
+
+    def run_scale(self, scale, benchmarks=None):
+        """Run every selected benchmark at one data scale."""
+        from crisis_detection import CrisisDetectionSystem
+        from analyze_chat_data import MentalHealthAnalyzer, analyze_message_patterns
+        from mood_pattern_analysis import MoodPatternAnalyzer
+        from generate_insights import InsightGenerator
+
+        size = SCALES[scale]
+        print(f"\n⏱️ Escala '{scale}': {size['messages']:,} mensajes, {size['users']:,} usuarios")
+
+        corpus = build_chat_corpus(size['messages'], size['users'], seed=self.seed, limit=self.corpus_limit)
+        user_texts = [m['content'] for m in corpus if m['sender'] == 'user']
+        # Messages and user messages the full scale would hold, for the effective-sample columns
+        sampled = len(corpus_users(size['messages'], size['users'], self.corpus_limit, self.seed))
+        scale_factor = size['users'] / sampled
+        population_messages = int(len(corpus) * scale_factor)
+        population_user_messages = int(len(user_texts) * scale_factor)
+        print(f"   Corpus: {len(corpus):,} mensajes de {sampled:,} usuarios")
+        # Per-user corpus for the report paths: the most active user's slice of the stream
+        report_user = Counter(m['user_id'] for m in corpus).most_common(1)[0][0] if corpus else None
+        user_history = [m for m in corpus if m['user_id'] == report_user] or corpus[:50]
+
+        detector = CrisisDetectionSystem()
+        analyzer = MentalHealthAnalyzer()
+        mood_analyzer = MoodPatternAnalyzer()
+        insight_generator = InsightGenerator()
+
+        def selected(name):
+            return benchmarks is None or any(name.startswith(b) for b in benchmarks)
+
+        if selected('crisis.analyze_text_for_crisis'):
+            self.bench_per_item('crisis.analyze_text_for_crisis', scale, 'messages',
+                                detector.analyze_text_for_crisis, user_texts, population_user_messages)
+
+        if selected('crisis.analyze_corpus_for_crisis'):
+            parity = check_crisis_parity(detector, PARITY_EDGE_CASES + user_texts[:PARITY_SAMPLE])
+            self.parity.append({'scale': scale, **parity})
+            if parity['mismatches']:
+                print(f"  ❌ Paridad corpus vs. mensaje: {parity['mismatches']} de {parity['checked']} difieren")
+            else:
+                print(f"  ✅ Paridad corpus vs. mensaje: {parity['checked']:,} textos idénticos")
+            self.bench_batch('crisis.analyze_corpus_for_crisis', scale, 'messages',
+                             lambda: detector.analyze_corpus_for_crisis(user_texts), len(user_texts),
+                             population_user_messages)
+
+        if selected('crisis.parallel_shared_corpus'):
+            from shared_corpus import SharedCorpus, run_parallel
+            # Same per-message scorer as the per-item benchmark, so sample the same way
+            shared = SharedCorpus.create(user_texts[:self.sample_limit])
+            try:
+                self.bench_batch('crisis.parallel_shared_corpus', scale, 'messages',
+                                 lambda: run_parallel(shared, 'crisis'), len(shared), population_user_messages)
+            finally:
+                shared.close()
+
+        if selected('chat.analyze_sentiment'):
+            self.bench_per_item('chat.analyze_sentiment', scale, 'messages',
+                                analyzer.analyze_sentiment, user_texts, population_user_messages)
+
+        if selected('chat.analyze_message_patterns'):
+            self.bench_batch('chat.analyze_message_patterns', scale, 'messages',
+                             lambda: analyze_message_patterns(corpus), len(corpus), population_messages)
+
+        if selected('mood.analyze_mood_patterns_from_chat'):
+            self.bench_batch('mood.analyze_mood_patterns_from_chat', scale, 'messages',
+                             lambda: mood_analyzer.analyze_mood_patterns_from_chat(corpus), len(corpus),
+                             population_messages)
+
+        # Mood check-in analyses run per user, on a random sample of the scale's population
+        rng = np.random.default_rng(self.seed)
+        sample_users = sorted(rng.choice(np.arange(1, size['users'] + 1), replace=False,
+                                         size=min(size['users'], self.user_sample)).tolist())
+        mood_frames = {uid: mood_analyzer.load_user_data(uid, 30) for uid in sample_users}
+
+        if selected('mood.analyze_mood_trends'):
+            self.bench_per_item('mood.analyze_mood_trends', scale, 'users',
+                                lambda uid: mood_analyzer.analyze_mood_trends(mood_frames[uid]), sample_users,
+                                size['users'])
+
+        if selected('mood.identify_mood_patterns'):
+            self.bench_per_item('mood.identify_mood_patterns', scale, 'users',
+                                lambda uid: mood_analyzer.identify_mood_patterns(mood_frames[uid]), sample_users,
+                                size['users'])
+
+        if selected('crisis.detect_anomalies'):
+            analyses = [detector.analyze_text_for_crisis(t) for t in user_texts[:2000]]
+            self.bench_batch('crisis.detect_anomalies', scale, 'messages',
+                             lambda: detector.detect_anomalies(analyses), len(analyses), population_user_messages)
+
+        # Full report paths write files, so run them in a scratch directory
+        with tempfile.TemporaryDirectory() as workdir:
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                if selected('report.comprehensive_crisis_assessment'):
+                    self.bench_batch('report.comprehensive_crisis_assessment', scale, 'messages',
+                                     lambda: detector.comprehensive_crisis_assessment(1, user_history),
+                                     len(user_history))
+
+                if selected('report.generate_report'):
+                    self.bench_batch('report.generate_report', scale, 'messages',
+                                     lambda: analyzer.generate_report(1, user_history), len(user_history))
+
+                if selected('report.generate_comprehensive_report'):
+                    self.bench_batch('report.generate_comprehensive_report', scale, 'users',
+                                     lambda: mood_analyzer.generate_comprehensive_report(1, 30), 1)
+
+                if selected('report.generate_comprehensive_insights'):
+                    with _quiet():
+                        chat_analysis = analyze_message_patterns(user_history)
+                        mood_analysis = mood_analyzer.analyze_mood_patterns_from_chat(user_history)
+                        crisis_analysis = detector.analyze_conversation_patterns(user_history)
+                    self.bench_batch('report.generate_comprehensive_insights', scale, 'users',
+                                     lambda: insight_generator.generate_comprehensive_insights(
+                                         chat_analysis, mood_analysis, crisis_analysis), 1)
+            finally:
+                os.chdir(cwd)
+
+    def to_dict(self):
+        return {
+            'meta': {
+                'timestamp': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': self.seed,
+                'sample_limit': self.sample_limit,
+                'corpus_limit': self.corpus_limit,
+                'user_sample': self.user_sample,
+                'repeats': self.repeats
+            },
+            'results': self.results,
+            'parity': self.parity
+        }
+
+
+def measure_startup(runs: int = 3) -> Dict[str, Any]:
+    """Time a cold import of crisis_detection plus one scored message in fresh interpreters.
+
+    The import itself must not load any heavy dependency; the first score may,
+    since TextBlob is needed for the sentiment term.
+    """
+    probe = _STARTUP_PROBE.format(scripts_dir=os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', probe], capture_output=True,
+                                text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    total = min(sample['total'] for sample in samples)
+    return {
+        'import_seconds': min(sample['import'] for sample in samples),
+        'total_seconds': total,
+        'budget_seconds': STARTUP_BUDGET_SECONDS,
+        'within_budget': total <= STARTUP_BUDGET_SECONDS,
+        'heavy_modules_loaded': samples[0]['modules']
+    }
+
+
+def compare_to_baseline(current: Dict, baseline: Dict, tolerance: float = 0.10) -> List[Dict[str, Any]]:
+    """Compare two benchmark result files and list regressions beyond tolerance."""
+    baseline_index = {(r['benchmark'], r['scale']): r for r in baseline.get('results', [])}
+    regressions = []
+
+    for result in current.get('results', []):
+        key = (result['benchmark'], result['scale'])
+        base = baseline_index.get(key)
+        if not base:
+            continue
+
+        throughput_ratio = result['throughput'] / base['throughput'] if base['throughput'] else 1.0
+        p95_ratio = (result['latency_ms']['p95'] / base['latency_ms']['p95']
+                     if base['latency_ms']['p95'] else 1.0)
+
+        if throughput_ratio < 1 - tolerance or p95_ratio > 1 + tolerance:
+            regressions.append({
+                'benchmark': result['benchmark'],
+                'scale': result['scale'],
+                'throughput_ratio': throughput_ratio,
+                'p95_ratio': p95_ratio
+            })
+
+    return regressions
+
+
+def main(argv=None):
+    """Main function to run the analytics benchmark suite."""
+    parser = argparse.ArgumentParser(description='Benchmark de los scripts de análisis')
+    parser.add_argument('--scales', default='small', help='Escalas separadas por coma: small,medium,large')
+    parser.add_argument('--benchmarks', default=None, help='Prefijos de benchmarks a ejecutar, separados por coma')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None, help='Archivo de resultados previo para comparar')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--sample-limit', type=int, default=20_000)
+    parser.add_argument('--corpus-limit', type=int, default=500_000,
+                        help='Mensajes generados como máximo por escala (muestra aleatoria de usuarios)')
+    parser.add_argument('--user-sample', type=int, default=200,
+                        help='Usuarios muestreados para los benchmarks de estado de ánimo por usuario')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-memory', action='store_true', help='Omitir la medición de memoria pico')
+    parser.add_argument('--check-startup', action='store_true',
+                        help='Verificar solo el tiempo de arranque de la detección de crisis')
+    args = parser.parse_args(argv)
+
+    if args.check_startup:
+        startup = measure_startup()
+        print(f"🚀 Arranque de detección de crisis: importación {startup['import_seconds']:.3f} s, "
+              f"total {startup['total_seconds']:.3f} s (presupuesto {startup['budget_seconds']:.1f} s)")
+        if not startup['within_budget']:
+            print(f"❌ Arranque fuera de presupuesto: {startup['total_seconds']:.3f} s > "
+                  f"{startup['budget_seconds']:.1f} s")
+        if startup['heavy_modules_loaded']:
+            print(f"❌ Dependencias pesadas cargadas al importar: {', '.join(startup['heavy_modules_loaded'])}")
+        if startup['within_budget'] and not startup['heavy_modules_loaded']:
+            print("✅ Arranque dentro del presupuesto")
+            return 0
+        return 1
+
+    print("🏁 Iniciando benchmark de análisis...")
+    runner = BenchmarkRunner(seed=args.seed, sample_limit=args.sample_limit,
+                             repeats=args.repeats, measure_memory=not args.no_memory,
+                             corpus_limit=args.corpus_limit, user_sample=args.user_sample)
+    benchmarks = args.benchmarks.split(',') if args.benchmarks else None
+
+    for scale in args.scales.split(','):
+        runner.run_scale(scale.strip(), benchmarks)
+
+    results = runner.to_dict()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 Resultados guardados en: {args.output}")
+
+    if any(check['mismatches'] for check in runner.parity):
+        print("\n❌ El puntuador por corpus no coincide con analyze_text_for_crisis")
+        return 1
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n⚠️ Regresiones detectadas ({len(regressions)}):")
+            for reg in regressions:
+                print(f"  • {reg['benchmark']} [{reg['scale']}]: "
+                      f"throughput x{reg['throughput_ratio']:.2f}, p95 x{reg['p95_ratio']:.2f}")
+            return 1
+        print("\n✅ Sin regresiones respecto a la línea base")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Optional, Callable
+
+from instrumentation import metrics, export_metrics_from_env
+
+# Process umask, read once (os.umask can only be queried by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_json_atomic(path: str, data: Any, **dump_kwargs):
+    """Write JSON to a unique temporary file, fsync it and rename it into place.
+
+    Readers (and resumed runs) only ever see a complete file or no file, and
+    concurrent writers of the same path never share a temporary file.
+    """
+    dump_kwargs.setdefault('ensure_ascii', False)
+    dump_kwargs.setdefault('indent', 2)
+    dump_kwargs.setdefault('default', str)
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'{name}.', suffix='.tmp')
+    try:
+        # mkstemp creates the file 0600; give it the permissions a plain open() would
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CompletionJournal:
+    """Append-only record of users a batch run has finished.
+
+    One JSON line per completed user, flushed (and optionally fsynced) before
+    moving on, so after a crash the journal never claims a user whose output
+    was not already renamed into place.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self.completed = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line from an interrupted write
+                        continue
+                    self.completed[entry['user_id']] = entry
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, user_id) -> bool:
+        return str(user_id) in self.completed
+
+    def mark_done(self, user_id, output: str, elapsed: float):
+        entry = {'user_id': str(user_id), 'output': output, 'elapsed_seconds': round(elapsed, 4),
+                 'completed_at': datetime.now().isoformat()}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.completed[entry['user_id']] = entry
+
+    def close(self):
+        self._file.close()
+
+
+class BatchRunner:
+    """Resumable population sweep over one of the per-user analyses.
+
+    Each user's output is written atomically into ``run_dir`` and then
+    recorded in ``run_dir/journal.jsonl``. Rerunning with the same
+    ``run_dir`` skips users already in the journal and removes temporary
+    files left by an interrupted write.
+    """
+
+    KINDS = ('crisis', 'report', 'mood')
+
+    def __init__(self, kind: str, run_dir: str, fsync: bool = True, charts: bool = False,
+                 state_dir: Optional[str] = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Tipo de análisis desconocido: {kind}")
+        self.kind = kind
+        self.run_dir = run_dir
+        self.charts = charts
+        self.state_dir = state_dir
+        os.makedirs(run_dir, exist_ok=True)
+
+        # Partial outputs from a crashed run are never valid
+        for stale in glob.glob(os.path.join(run_dir, '*.tmp')):
+            os.remove(stale)
+
+        self.journal = CompletionJournal(os.path.join(run_dir, 'journal.jsonl'), fsync=fsync)
+        self._analyzer = None
+
+    def _output_path(self, user_id) -> str:
+        prefix = {'crisis': 'crisis_assessment', 'report': 'mental_health_report', 'mood': 'mood_analysis'}
+        return os.path.join(self.run_dir, f'{prefix[self.kind]}_user_{user_id}.json')
+
+    def _analyze(self, user_id, messages, output_file: str, days_back: int):
+        if self.kind == 'crisis':
+            if self._analyzer is None:
+                from crisis_detection import CrisisDetectionSystem
+                self._analyzer = CrisisDetectionSystem()
+            self._analyzer.comprehensive_crisis_assessment(user_id, messages, output_file=output_file)
+        elif self.kind == 'report':
+            if self._analyzer is None:
+                from analyze_chat_data import MentalHealthAnalyzer
+                self._analyzer = MentalHealthAnalyzer()
+            self._analyzer.generate_report(user_id, messages, output_file, charts=self.charts,
+                                           state_dir=self.state_dir)
+        else:
+            if self._analyzer is None:
+                from mood_pattern_analysis import MoodPatternAnalyzer
+                self._analyzer = MoodPatternAnalyzer()
+            self._analyzer.generate_comprehensive_report(user_id, days_back, output_file=output_file,
+                                                         charts=self.charts)
+
+    def run(self, users: Iterable, messages_by_user: Optional[Dict[Any, List[Dict]]] = None,
+            days_back: int = 30, on_user: Optional[Callable] = None) -> Dict[str, Any]:
+        """Analyze every user not yet in the journal."""
+        processed = skipped = failed = 0
+        start_time = time.perf_counter()
+
+        try:
+            for user_id in users:
+                if self.journal.is_done(user_id):
+                    skipped += 1
+                    continue
+
+                output_file = self._output_path(user_id)
+                user_start = time.perf_counter()
+                try:
+                    with metrics.stage(f'batch.{self.kind}'):
+                        messages = messages_by_user.get(user_id, []) if messages_by_user is not None else None
+                        self._analyze(user_id, messages, output_file, days_back)
+                except Exception as e:
+                    failed += 1
+                    metrics.record_error(f'batch.{self.kind}', e, user_id)
+                    continue
+
+                with metrics.stage('batch.checkpoint'):
+                    self.journal.mark_done(user_id, os.path.basename(output_file),
+                                           time.perf_counter() - user_start)
+                processed += 1
+                if on_user is not None:
+                    on_user(user_id)
+        finally:
+            self.journal.close()
+
+        metrics.count('batch.users_processed', processed)
+        metrics.count('batch.users_skipped', skipped)
+        return {
+            'kind': self.kind,
+            'processed': processed,
+            'skipped': skipped,
+            'failed': failed,
+            'completed_total': len(self.journal.completed),
+            'elapsed_seconds': time.perf_counter() - start_time
+        }
+
+
+def load_messages_by_user(path: str) -> Dict[int, List[Dict]]:
+    """Group a chat dataset (synthetic_data.py JSONL or Parquet, or a message log) by user."""
+    if path.endswith('.mhlog'):
+        from message_log import MessageLogReader
+        reader = MessageLogReader(path)
+        try:
+            return {int(user_id): reader.user_messages(int(user_id)) for user_id in reader.users()}
+        finally:
+            reader.close()
+    
+    import pandas as pd
+
+    df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_json(path, lines=True)
+    if not pd.api.types.is_string_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+    messages_by_user = {}
+    for user_id, group in df.groupby('user_id', sort=True):
+        messages_by_user[int(user_id)] = [
+            {'id': f'{user_id}-{i}', 'sender': sender, 'content': text, 'message': text, 'timestamp': ts}
+            for i, (sender, text, ts) in enumerate(zip(group['sender'], group['message'], group['timestamp']))
+        ]
+    return messages_by_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Análisis por lotes reanudable con checkpoints')
+    parser.add_argument('--kind', choices=BatchRunner.KINDS, required=True, help='Análisis a ejecutar')
+    parser.add_argument('--run-dir', required=True, help='Directorio de salida y del journal de la ejecución')
+    parser.add_argument('--input', help='Dataset de chat (JSONL o Parquet) para crisis y report')
+    parser.add_argument('--users', type=int, default=10, help='Número de usuarios para mood (datos simulados)')
+    parser.add_argument('--days', type=int, default=30, help='Días de historial para mood')
+    parser.add_argument('--charts', action='store_true', help='Generar también los gráficos por usuario')
+    parser.add_argument('--state-dir', help='Estado incremental por usuario para report (solo mensajes nuevos)')
+    parser.add_argument('--no-fsync', action='store_true', help='No forzar fsync del journal (más rápido, menos seguro)')
+    args = parser.parse_args()
+
+    if args.kind in ('crisis', 'report'):
+        if not args.input:
+            parser.error('--input es obligatorio para crisis y report')
+        messages_by_user = load_messages_by_user(args.input)
+        users = list(messages_by_user)
+    else:
+        messages_by_user = None
+        users = list(range(1, args.users + 1))
+
+    runner = BatchRunner(args.kind, args.run_dir, fsync=not args.no_fsync, charts=args.charts,
+                         state_dir=args.state_dir)
+    print(f"🔁 Ejecución por lotes '{args.kind}': {len(users)} usuarios, "
+          f"{len(runner.journal.completed)} ya completados")
+    summary = runner.run(users, messages_by_user, days_back=args.days)
+
+    print(f"✅ Procesados: {summary['processed']} | Omitidos (ya completados): {summary['skipped']} | "
+          f"Fallidos: {summary['failed']} | Tiempo: {summary['elapsed_seconds']:.1f}s")
+    if summary['failed']:
+        print("⚠️ Los usuarios fallidos se reintentarán al reanudar la ejecución")
+    export_metrics_from_env()
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import os
+import json
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from instrumentation import metrics
+
+# Dimensions shown on the admin and psychologist dashboards
+DIMENSIONS = ('risk_level', 'escalating', 'sentiment', 'engagement', 'overall_status')
+
+_stores = {}
+
+
+def sentiment_bucket(score: float) -> str:
+    """Same thresholds as MentalHealthAnalyzer.analyze_sentiment."""
+    if score > 0.1:
+        return 'positive'
+    if score < -0.1:
+        return 'negative'
+    return 'neutral'
+
+
+class CohortAggregateStore:
+    """Population counts for the dashboards, maintained by deltas.
+
+    Each user contributes one value per dimension. When an assessment changes,
+    the user's old value is subtracted and the new one added, so totals are
+    always current and every dashboard query is a dictionary read.
+
+    Persistence is a snapshot of per-user contributions plus an append-only
+    journal of changes, so recording an update writes one line instead of
+    rewriting the whole store. ``compact()`` folds the journal into the snapshot.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.contributions = {}
+        self.totals = {dim: Counter() for dim in DIMENSIONS}
+        self.updated_at = None
+        if path:
+            self._load()
+
+    @property
+    def journal_path(self) -> str:
+        return f'{self.path}.journal'
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.updated_at = snapshot.get('updated_at')
+            for user_id, values in snapshot.get('users', {}).items():
+                self._apply(user_id, values)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line from an interrupted write
+                        continue
+                    self._apply(entry['user_id'], entry['values'])
+                    self.updated_at = entry.get('at', self.updated_at)
+
+    def _apply(self, user_id: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply changed values as deltas; returns only what actually changed."""
+        current = self.contributions.setdefault(user_id, {})
+        changed = {}
+        for dim, new in values.items():
+            old = current.get(dim)
+            if old == new:
+                continue
+            totals = self.totals[dim]
+            if old is not None:
+                totals[old] -= 1
+                if totals[old] <= 0:
+                    del totals[old]
+            if new is None:
+                current.pop(dim, None)
+            else:
+                totals[new] += 1
+                current[dim] = new
+            changed[dim] = new
+        if not current:
+            del self.contributions[user_id]
+        return changed
+
+    def update(self, user_id, **values) -> Dict[str, Any]:
+        """Record a user's new values for some dimensions."""
+        unknown = set(values) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Dimensiones desconocidas: {', '.join(sorted(unknown))}")
+
+        changed = self._apply(str(user_id), values)
+        metrics.count('cohort.updates')
+        if changed:
+            metrics.count('cohort.changes', len(changed))
+            self.updated_at = datetime.now().isoformat()
+            if self.path:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'user_id': str(user_id), 'values': changed, 'at': self.updated_at},
+                                       ensure_ascii=False) + '\n')
+        return changed
+
+    def remove_user(self, user_id):
+        """Drop a user from every aggregate."""
+        self.update(user_id, **{dim: None for dim in DIMENSIONS})
+
+    # Adapters for the per-user analyzers
+
+    def record_crisis_assessment(self, assessment: Dict[str, Any]):
+        """Apply a CrisisDetectionSystem.comprehensive_crisis_assessment result."""
+        return self.update(assessment['user_id'],
+                           risk_level=assessment.get('final_risk_level'),
+                           escalating=bool(assessment.get('escalation_detected')))
+
+    def record_report(self, analysis_data: Dict[str, Any]):
+        """Apply a MentalHealthAnalyzer.generate_report result."""
+        stats = analysis_data.get('summary_stats') or {}
+        if 'avg_sentiment' not in stats:
+            return {}
+        return self.update(analysis_data['user_id'], sentiment=sentiment_bucket(float(stats['avg_sentiment'])))
+
+    def record_insights(self, user_id, insights: Dict[str, Any]):
+        """Apply an InsightGenerator.generate_comprehensive_insights result."""
+        values = {}
+        engagement = insights.get('engagement_insights') or {}
+        if not engagement.get('no_data') and engagement.get('activity_level'):
+            values['engagement'] = engagement['activity_level']
+        summary = insights.get('summary') or {}
+        if summary.get('overall_status'):
+            values['overall_status'] = summary['overall_status']
+        return self.update(user_id, **values) if values else {}
+
+    # Dashboard queries
+
+    def total_users(self) -> int:
+        return len(self.contributions)
+
+    def risk_level_counts(self) -> Dict[str, int]:
+        return dict(self.totals['risk_level'])
+
+    def escalating_users(self) -> int:
+        return self.totals['escalating'].get(True, 0)
+
+    def sentiment_distribution(self) -> Dict[str, int]:
+        return dict(self.totals['sentiment'])
+
+    def engagement_levels(self) -> Dict[str, int]:
+        return dict(self.totals['engagement'])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Dashboard payload with every aggregate."""
+        return {
+            'total_users': self.total_users(),
+            'users_by_risk_level': self.risk_level_counts(),
+            'escalating_users': self.escalating_users(),
+            'sentiment_distribution': self.sentiment_distribution(),
+            'engagement_levels': self.engagement_levels(),
+            'overall_status': dict(self.totals['overall_status']),
+            'updated_at': self.updated_at
+        }
+
+    def compact(self):
+        """Write a full snapshot atomically and clear the journal."""
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'users': self.contributions, 'updated_at': self.updated_at}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+def cohort_store_from_env() -> Optional[CohortAggregateStore]:
+    """Shared store at ANALYTICS_COHORT_STORE, or None when cohort tracking is off."""
+    path = os.environ.get('ANALYTICS_COHORT_STORE')
+    if not path:
+        return None
+    if path not in _stores:
+        _stores[path] = CohortAggregateStore(path)
+    return _stores[path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Agregados de cohorte para los dashboards')
+    parser.add_argument('--store', default=os.environ.get('ANALYTICS_COHORT_STORE', 'cohort_aggregates.json'),
+                        help='Archivo del almacén de agregados')
+    parser.add_argument('--output', help='Guardar el resumen para los dashboards en este archivo JSON')
+    parser.add_argument('--compact', action='store_true', help='Consolidar el journal en el snapshot')
+    args = parser.parse_args()
+
+    store = CohortAggregateStore(args.store)
+    if args.compact:
+        store.compact()
+        print(f"🗜️ Almacén consolidado: {args.store}")
+
+    summary = store.snapshot()
+    print("👥 AGREGADOS DE COHORTE")
+    print("=" * 40)
+    print(f"Usuarios: {summary['total_users']}")
+    print(f"Por nivel de riesgo: {summary['users_by_risk_level']}")
+    print(f"Usuarios en escalación: {summary['escalating_users']}")
+    print(f"Distribución de sentimiento: {summary['sentiment_distribution']}")
+    print(f"Niveles de participación: {summary['engagement_levels']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resumen guardado en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import re
+from typing import Dict, List, Any, Iterable
+import numpy as np
+from scipy import sparse
+
+# Same normalization as CrisisDetectionSystem.analyze_text_for_crisis
+_PUNCTUATION = re.compile(r'[^\w\s]')
+# Joins the vocabulary for pattern scans; punctuation never survives tokenization
+_SEPARATOR = '\x00'
+
+
+class CrisisCorpusScorer:
+    """Score whole corpora for crisis risk with one sparse matrix product.
+
+    Messages are tokenized once into a sparse document-term matrix over the
+    crisis and protective vocabulary, then every category score and the
+    protective score come from ``P @ W`` against a (terms x categories+1)
+    weight matrix. Results match ``analyze_text_for_crisis`` per message.
+
+    The scalar path checks ``keyword in text_clean`` (substring), so the
+    matrix keeps the same semantics: a single-word keyword matches any token
+    that contains it, and a multi-word phrase matches consecutive tokens
+    (split on single spaces) where the first ends with its first word, the
+    middle ones are equal and the last starts with its last word.
+    """
+
+    def __init__(self, detector):
+        self.categories = list(detector.crisis_keywords.keys())
+        self.category_weights = np.array([detector.crisis_keywords[c]['weight'] for c in self.categories],
+                                         dtype=np.float64)
+        self.category_severity = [detector.crisis_keywords[c]['severity'] for c in self.categories]
+
+        # Terms in the scalar iteration order: crisis categories, then protective factors
+        self.terms = []
+        for col, category in enumerate(self.categories):
+            for keyword in detector.crisis_keywords[category]['keywords']:
+                self.terms.append({'group': 'crisis', 'category': category, 'keyword': keyword, 'column': col})
+        protective_col = len(self.categories)
+        for category, keywords in detector.protective_factors.items():
+            for keyword in keywords:
+                self.terms.append({'group': 'protective', 'category': category, 'keyword': keyword,
+                                   'column': protective_col})
+
+        # Weight matrix: category score is weight x number of keywords present
+        weights = np.zeros((len(self.terms), len(self.categories) + 1))
+        for i, term in enumerate(self.terms):
+            if term['group'] == 'crisis':
+                weights[i, term['column']] = self.category_weights[term['column']]
+            else:
+                weights[i, protective_col] = 1.0
+        self.weight_matrix = sparse.csr_matrix(weights)
+
+        # Distinct keyword strings; terms sharing a string share a presence column
+        self.keywords = list(dict.fromkeys(term['keyword'] for term in self.terms))
+        keyword_index = {kw: i for i, kw in enumerate(self.keywords)}
+        self.term_keyword = np.array([keyword_index[term['keyword']] for term in self.terms])
+
+        # Patterns are compiled once and run over the whole vocabulary joined into one string
+        # (see keyword_presence): an alternation finds tokens containing any single-word keyword,
+        # and anchored patterns find tokens ending with the first / starting with the last word
+        # of each multi-word phrase
+        self.single_keywords = [(k, kw) for k, kw in enumerate(self.keywords) if ' ' not in kw]
+        self._single_pattern = (re.compile('|'.join(re.escape(kw) for _, kw in self.single_keywords))
+                                if self.single_keywords else None)
+        self._suffix_patterns, self._prefix_patterns = {}, {}
+        for kw in self.keywords:
+            words = kw.split(' ')
+            if len(words) > 1:
+                self._suffix_patterns[words[0]] = re.compile(re.escape(words[0]) + f'(?={_SEPARATOR}|\\Z)')
+                self._prefix_patterns[words[-1]] = re.compile(_SEPARATOR + re.escape(words[-1]))
+
+    def tokenize(self, texts: List[str]):
+        """Tokenize texts into a flat token-id array with document ids."""
+        vocab = {}
+        token_ids = []
+        lengths = np.empty(len(texts), dtype=np.int64)
+        word_counts = np.empty(len(texts), dtype=np.float64)
+
+        for i, text in enumerate(texts):
+            tokens = _PUNCTUATION.sub(' ', text.lower()).split(' ')
+            token_ids.extend(vocab.setdefault(tok, len(vocab)) for tok in tokens)
+            lengths[i] = len(tokens)
+            word_counts[i] = len(text.split())
+
+        token_ids = np.fromiter(token_ids, dtype=np.int64, count=int(lengths.sum()))
+        doc_ids = np.repeat(np.arange(len(texts)), lengths)
+        return list(vocab), token_ids, doc_ids, word_counts
+
+    @staticmethod
+    def _vocab_mask(pattern, joined: str, starts: np.ndarray) -> np.ndarray:
+        """Boolean mask of the vocabulary tokens a pattern matches in the joined vocabulary."""
+        # A match's last character always lies inside the token it matched
+        positions = np.fromiter((m.end() - 1 for m in pattern.finditer(joined)), dtype=np.int64)
+        mask = np.zeros(len(starts), dtype=bool)
+        mask[np.searchsorted(starts, positions, side='right') - 1] = True
+        return mask
+
+    def keyword_presence(self, vocab: List[str], token_ids: np.ndarray, doc_ids: np.ndarray,
+                         n_docs: int) -> sparse.csr_matrix:
+        """Binary (documents x distinct keywords) presence matrix."""
+        rows, cols = [], []
+
+        # Vocabulary as one string, each token preceded by a separator tokens never contain
+        joined = _SEPARATOR + _SEPARATOR.join(vocab)
+        lengths = np.fromiter((len(tok) for tok in vocab), dtype=np.int64, count=len(vocab))
+        starts = np.cumsum(lengths + 1) - lengths
+
+        if self._single_pattern is not None:
+            # Token incidence (documents x vocabulary) times (vocabulary x keywords)
+            incidence = sparse.csr_matrix(
+                (np.ones(len(token_ids), dtype=np.float64), (doc_ids, token_ids)),
+                shape=(n_docs, len(vocab))
+            )
+            # Only tokens the alternation hit can contain a keyword; check those against each one
+            candidates = self._vocab_mask(self._single_pattern, joined, starts)
+            tok_rows, tok_cols = [], []
+            for v in np.flatnonzero(candidates).tolist():
+                token = vocab[v]
+                for j, (_, kw) in enumerate(self.single_keywords):
+                    if kw in token:
+                        tok_rows.append(v)
+                        tok_cols.append(j)
+            token_keyword = sparse.csr_matrix(
+                (np.ones(len(tok_rows)), (tok_rows, tok_cols)), shape=(len(vocab), len(self.single_keywords))
+            )
+            hits = (incidence @ token_keyword).tocoo()
+            single_cols = np.array([k for k, _ in self.single_keywords])
+            rows.append(hits.row)
+            cols.append(single_cols[hits.col])
+
+        vocab_array = np.array(vocab, dtype=object)
+        for k, kw in enumerate(self.keywords):
+            words = kw.split(' ')
+            if len(words) < 2 or len(token_ids) < len(words):
+                continue
+
+            # Per-position masks over the vocabulary, then over consecutive token windows
+            masks = [self._vocab_mask(self._suffix_patterns[words[0]], joined, starts)]
+            for word in words[1:-1]:
+                masks.append(vocab_array == word)
+            masks.append(self._vocab_mask(self._prefix_patterns[words[-1]], joined, starts))
+
+            span = len(words) - 1
+            window = doc_ids[:-span] == doc_ids[span:]
+            for offset, mask in enumerate(masks):
+                window &= mask[token_ids[offset:len(token_ids) - span + offset]]
+            matched_docs = np.unique(doc_ids[:-span][window])
+            rows.append(matched_docs)
+            cols.append(np.full(len(matched_docs), k))
+
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+        presence = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_docs, len(self.keywords)))
+        presence.data[:] = 1.0
+        return presence
+
+    def score_corpus(self, texts: Iterable[str], include_sentiment: bool = True) -> Dict[str, Any]:
+        """Score every message; returns column arrays aligned with the input order."""
+        texts = list(texts)
+
+        # Identical messages get identical scores, so work on distinct texts only
+        unique_index = {}
+        inverse = np.fromiter((unique_index.setdefault(t, len(unique_index)) for t in texts),
+                              dtype=np.int64, count=len(texts))
+        unique_texts = list(unique_index)
+        n_unique = len(unique_texts)
+
+        vocab, token_ids, doc_ids, word_counts = self.tokenize(unique_texts)
+        keyword_presence = self.keyword_presence(vocab, token_ids, doc_ids, n_unique)
+        term_matrix = keyword_presence[:, self.term_keyword].tocsr()
+
+        # One product gives every category score and the protective score
+        scores = np.asarray((term_matrix @ self.weight_matrix).todense())
+        category_scores = scores[:, :-1]
+        protective_scores = scores[:, -1]
+
+        normalized = np.zeros_like(category_scores)
+        present = category_scores > 0
+        np.divide(category_scores, word_counts[:, None], out=normalized, where=present)
+        normalized *= self.category_weights[None, :]
+
+        total_crisis = normalized.sum(axis=1)
+
+        if include_sentiment:
+            from textblob import TextBlob
+            polarity = np.fromiter((TextBlob(t).sentiment.polarity for t in unique_texts),
+                                   dtype=np.float64, count=n_unique)
+        else:
+            polarity = np.zeros(n_unique)
+
+        risk_scores = total_crisis - protective_scores + np.abs(np.minimum(0, polarity))
+        risk_levels = np.select([risk_scores >= 15, risk_scores >= 10, risk_scores >= 5],
+                                ['CRÍTICO', 'ALTO', 'MEDIO'], default='BAJO').astype(object)
+
+        return {
+            'risk_score': risk_scores[inverse],
+            'risk_level': risk_levels[inverse],
+            'crisis_scores': normalized[inverse],
+            'categories': self.categories,
+            'protective_score': protective_scores[inverse],
+            'sentiment_polarity': polarity[inverse],
+            'requires_immediate_attention': risk_scores[inverse] >= 15,
+            'term_matrix': term_matrix[inverse],
+            'terms': self.terms
+        }
+
+    def to_message_results(self, corpus_scores: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Expand corpus scores into per-message dicts shaped like analyze_text_for_crisis."""
+        term_matrix = corpus_scores['term_matrix'].tocsr()
+        term_matrix.sort_indices()
+        results = []
+
+        for i in range(term_matrix.shape[0]):
+            indicators_found = []
+            protective_found = []
+            for t in term_matrix.indices[term_matrix.indptr[i]:term_matrix.indptr[i + 1]]:
+                term = self.terms[t]
+                if term['group'] == 'crisis':
+                    indicators_found.append(f"{term['category']}: {term['keyword']}")
+                else:
+                    protective_found.append({'category': term['category'], 'keyword': term['keyword']})
+
+            crisis_row = corpus_scores['crisis_scores'][i]
+            results.append({
+                'risk_score': float(corpus_scores['risk_score'][i]),
+                'risk_level': corpus_scores['risk_level'][i],
+                'crisis_scores': {c: (float(crisis_row[j]) if crisis_row[j] > 0 else 0)
+                                  for j, c in enumerate(self.categories)},
+                'indicators_found': indicators_found,
+                'protective_factors': protective_found,
+                'sentiment_polarity': float(corpus_scores['sentiment_polarity'][i]),
+                'requires_immediate_attention': bool(corpus_scores['requires_immediate_attention'][i])
+            })
+
+        return results
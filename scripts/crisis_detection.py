@@ -1,14 +1,12 @@
+import os
 import re
 import json
-import numpy as np
 from datetime import datetime, timedelta
-from textblob import TextBlob
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.ensemble import IsolationForest
 import warnings
 from typing import Dict, List, Any, Tuple
 from collections import defaultdict
+from instrumentation import metrics, export_metrics_from_env
+from checkpoint import write_json_atomic
 warnings.filterwarnings('ignore')
 
 class CrisisDetectionSystem:
@@ -63,11 +61,53 @@ class CrisisDetectionSystem:
             'declining_protective'   # Fewer protective factors mentioned
         ]
         
-        # Initialize anomaly detector
-        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
+        # Anomaly detector is created on first use so sklearn only loads when needed
+        self._anomaly_detector = None
+        self._corpus_scorer = None
+        
+        # Per-user risk time indexes for arbitrary window queries
+        self.time_indexes = {}
+        
+        # Population aggregates for the dashboards (None unless ANALYTICS_COHORT_STORE is set)
+        self.cohort_store = None
+        if os.environ.get('ANALYTICS_COHORT_STORE'):
+            from cohort_aggregates import cohort_store_from_env
+            self.cohort_store = cohort_store_from_env()
+        
+        # Cross-user triage queue (None unless ANALYTICS_TRIAGE_QUEUE is set)
+        self.triage_queue = None
+        if os.environ.get('ANALYTICS_TRIAGE_QUEUE'):
+            from triage_queue import triage_queue_from_env
+            self.triage_queue = triage_queue_from_env()
+        
+        # Risk trend: 'window' (last 3 vs previous 3) or 'cusum' (streaming change points per user)
+        self.trend_mode = os.environ.get('ANALYTICS_RISK_TREND_MODE', 'window')
+        self.risk_trackers = {}
+        # Tracker state persists across runs only when ANALYTICS_RISK_TREND_DIR is set
+        self.risk_trend_dir = os.environ.get('ANALYTICS_RISK_TREND_DIR')
+        
+        # Prefilter / load-shedding front end (None unless ANALYTICS_CRISIS_TIERS is set)
+        self.tiers = None
+        if os.environ.get('ANALYTICS_CRISIS_TIERS', '') not in ('', '0'):
+            from crisis_tiers import tiers_from_env
+            self.tiers = tiers_from_env(self)
+    
+    @property
+    def anomaly_detector(self):
+        """IsolationForest used by detect_anomalies"""
+        if self._anomaly_detector is None:
+            from sklearn.ensemble import IsolationForest
+            self._anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
+        return self._anomaly_detector
         
     def analyze_text_for_crisis(self, text):
         """Analyze text for crisis indicators"""
+        if self.tiers is not None:
+            return self.tiers.evaluate(text)
+        return self.score_text(text)
+    
+    def score_text(self, text, sentiment=True):
+        """Full keyword and protective-factor scan, plus TextBlob sentiment unless disabled"""
         text_lower = text.lower()
         
         # Remove punctuation and normalize
@@ -113,9 +153,12 @@ class CrisisDetectionSystem:
                         'keyword': keyword
                     })
         
-        # Sentiment analysis
-        blob = TextBlob(text)
-        sentiment_polarity = blob.sentiment.polarity
+        # Sentiment analysis (skipped by the keyword-only tier under load)
+        sentiment_polarity = 0.0
+        if sentiment:
+            from textblob import TextBlob
+            blob = TextBlob(text)
+            sentiment_polarity = blob.sentiment.polarity
         
         # Calculate final risk score
         risk_score = total_crisis_score - (protective_score * 1) + abs(min(0, sentiment_polarity))
@@ -140,7 +183,48 @@ class CrisisDetectionSystem:
             'requires_immediate_attention': risk_score >= 15
         }
     
-    def analyze_conversation_patterns(self, messages):
+    def analyze_corpus_for_crisis(self, texts, include_sentiment=True):
+        """Score a whole corpus at once (nightly backfills).
+
+        Returns column arrays that match analyze_text_for_crisis per message;
+        see CrisisCorpusScorer.to_message_results for the per-message dicts.
+        """
+        if self._corpus_scorer is None:
+            from crisis_corpus import CrisisCorpusScorer
+            self._corpus_scorer = CrisisCorpusScorer(self)
+
+        with metrics.stage('crisis.corpus_score'):
+            scores = self._corpus_scorer.score_corpus(texts, include_sentiment)
+        metrics.count('crisis.messages_processed', len(scores['risk_score']))
+        return scores
+
+    def _update_time_index(self, user_id, analyses):
+        """Append time-sorted analyses newer than the user's index to it (amortized O(1) each)"""
+        from time_index import UserTimeSeriesIndex, to_epoch_ns
+        index = self.time_indexes.get(user_id)
+        if index is None:
+            index = self.time_indexes[user_id] = UserTimeSeriesIndex(['risk_score', 'crisis'])
+        last = index.timestamps[len(index) - 1] if len(index) else None
+        # Only the unseen tail is converted: walk back from the newest analysis
+        start = len(analyses)
+        while start > 0 and (last is None or to_epoch_ns(analyses[start - 1]['timestamp']) > last):
+            start -= 1
+        for analysis in analyses[start:]:
+            index.append(analysis['timestamp'], risk_score=analysis['risk_score'],
+                         crisis=float(analysis['risk_score'] >= 5))
+        return index
+    
+    def risk_window_stats(self, user_id, start=None, end=None):
+        """Risk statistics for any time range of a user's analyzed messages (O(log n))"""
+        index = self.time_indexes.get(user_id)
+        if index is None:
+            return {'no_data': True}
+        return {
+            'risk_score': index.range_stats('risk_score', start, end),
+            'crisis_messages': index.range_stats('crisis', start, end)
+        }
+    
+    def analyze_conversation_patterns(self, messages, user_id=None):
         """Analyze conversation patterns for crisis indicators"""
         user_messages = [msg for msg in messages if msg.get('sender') == 'user']
         
@@ -149,22 +233,36 @@ class CrisisDetectionSystem:
         
         # Analyze each message
         message_analyses = []
-        for msg in user_messages:
-            try:
-                timestamp = datetime.fromisoformat(msg.get('timestamp', '').replace('Z', '+00:00'))
-                analysis = self.analyze_text_for_crisis(msg.get('content', ''))
-                analysis['timestamp'] = timestamp
-                analysis['message_id'] = msg.get('id', '')
-                message_analyses.append(analysis)
-            except Exception as e:
-                print(f"Error analyzing message: {e}")
-                continue
+        failed = 0
+        with metrics.stage('crisis.score'):
+            for msg in user_messages:
+                try:
+                    timestamp = datetime.fromisoformat(msg.get('timestamp', '').replace('Z', '+00:00'))
+                    analysis = self.analyze_text_for_crisis(msg.get('content', ''))
+                    analysis['timestamp'] = timestamp
+                    analysis['message_id'] = msg.get('id', '')
+                    analysis['content'] = msg.get('content', '')
+                    message_analyses.append(analysis)
+                except Exception as e:
+                    failed += 1
+                    metrics.record_error('crisis.score', e, msg.get('id'))
+                    continue
+        
+        metrics.count('crisis.messages_processed', len(message_analyses))
+        if failed:
+            print(f"⚠️ {failed} mensajes no pudieron analizarse")
+        
+        if not message_analyses:
+            return {'insufficient_data': True}
         
         # Sort by timestamp
         message_analyses.sort(key=lambda x: x['timestamp'])
+        if user_id is not None:
+            self._update_time_index(user_id, message_analyses)
         
         # Detect patterns
-        patterns = self.detect_escalation_patterns(message_analyses)
+        with metrics.stage('crisis.escalation'):
+            patterns = self.detect_escalation_patterns(message_analyses)
         
         # Calculate overall risk assessment
         recent_messages = message_analyses[-5:]  # Last 5 messages
@@ -175,7 +273,7 @@ class CrisisDetectionSystem:
         # Check for immediate intervention needs
         immediate_intervention = any(msg['requires_immediate_attention'] for msg in recent_messages)
         
-        return {
+        result = {
             'total_messages_analyzed': len(message_analyses),
             'average_recent_risk_score': avg_recent_score,
             'highest_risk_score': highest_risk_message['risk_score'],
@@ -186,9 +284,16 @@ class CrisisDetectionSystem:
             },
             'escalation_patterns': patterns,
             'immediate_intervention_required': immediate_intervention,
-            'risk_trend': self.calculate_risk_trend(message_analyses),
+            'risk_trend': None,
             'recommendations': self.generate_recommendations(message_analyses, patterns)
         }
+        if self.trend_mode == 'cusum':
+            tracker = self.risk_tracker(user_id, message_analyses)
+            result['risk_trend'] = tracker.trend()
+            result['risk_change_point'] = tracker.last_change
+        else:
+            result['risk_trend'] = self.calculate_risk_trend(message_analyses)
+        return result
     
     def detect_escalation_patterns(self, analyses):
         """Detect crisis escalation patterns"""
@@ -236,8 +341,20 @@ class CrisisDetectionSystem:
         
         return patterns
 
-    def calculate_risk_trend(self, analyses):
-        """Calculate the overall risk trend."""
+    def calculate_risk_trend(self, analyses, mode=None, user_id=None):
+        """Calculate the overall risk trend.
+        
+        ``mode='window'`` compares the last 3 scores with the 3 before them.
+        ``mode='cusum'`` feeds scores newer than the last call to the user's
+        streaming EWMA/CUSUM tracker (see risk_tracker; without ``user_id`` the
+        scores are replayed from scratch). Defaults to ANALYTICS_RISK_TREND_MODE.
+        """
+        mode = mode or self.trend_mode
+        if mode == 'cusum':
+            return self.risk_tracker(user_id, analyses).trend()
+        if mode != 'window':
+            raise ValueError(f"Modo de tendencia desconocido: {mode}")
+        
         if len(analyses) < 3:
             return 'INSUFFICIENT_DATA'
         
@@ -254,6 +371,54 @@ class CrisisDetectionSystem:
         else:
             return 'STABLE'
 
+    def risk_tracker(self, user_id, analyses=()):
+        """The user's streaming trend tracker, updated with any new analyses (O(1) each).
+
+        Trackers are kept per ``user_id`` for the life of the detector and, when
+        ANALYTICS_RISK_TREND_DIR is set, reloaded from and saved to that
+        directory so the EWMA/CUSUM state carries over between runs. Without a
+        ``user_id`` this is not streaming: a fresh tracker replays ``analyses``
+        and is discarded after the call.
+        """
+        from risk_trend import StreamingRiskTrend
+        tracker = self.risk_trackers.get(user_id)
+        if tracker is None:
+            if user_id is None:
+                tracker = StreamingRiskTrend()
+            else:
+                tracker = (StreamingRiskTrend.load(self.risk_trend_dir, user_id) if self.risk_trend_dir
+                           else StreamingRiskTrend())
+                self.risk_trackers[user_id] = tracker
+        seen = tracker.count
+        changes = tracker.update_many(analyses)
+        metrics.count('crisis.change_points', len(changes))
+        if user_id is not None and self.risk_trend_dir and tracker.count != seen:
+            tracker.save(self.risk_trend_dir, user_id)
+        return tracker
+    
+    def sweep_escalation(self, analyses_by_user):
+        """Escalation patterns and risk trend for many users in one vectorized pass.
+
+        Same results as detect_escalation_patterns and calculate_risk_trend per
+        user, computed over a padded users x 14 risk matrix for nightly sweeps.
+        """
+        from escalation_batch import (escalation_matrices, detect_escalation_batch, risk_trend_batch,
+                                      batch_patterns)
+        categories = list(self.crisis_keywords)
+        with metrics.stage('crisis.escalation_sweep'):
+            matrices = escalation_matrices(analyses_by_user, categories)
+            batch = detect_escalation_batch(matrices['risk'], matrices['mask'], matrices['theme_counts'])
+            trends = risk_trend_batch(matrices['risk'], matrices['mask'])
+        metrics.count('crisis.users_swept', len(matrices['user_ids']))
+
+        return {
+            user_id: {
+                'escalation_patterns': batch_patterns(batch, categories, row),
+                'risk_trend': str(trends[row])
+            }
+            for row, user_id in enumerate(matrices['user_ids'])
+        }
+
     def generate_recommendations(self, analyses, patterns):
         """Generate intervention recommendations based on analysis."""
         recommendations = []
@@ -288,6 +453,8 @@ class CrisisDetectionSystem:
         if len(user_data) < 5:  # Need minimum data points
             return {'anomalies_detected': False, 'reason': 'insufficient_data'}
         
+        import numpy as np
+        
         # Prepare features for anomaly detection
         features = []
         for data_point in user_data:
@@ -302,8 +469,9 @@ class CrisisDetectionSystem:
         features_array = np.array(features)
         
         # Fit anomaly detector
-        anomaly_predictions = self.anomaly_detector.fit_predict(features_array)
-        anomaly_scores = self.anomaly_detector.decision_function(features_array)
+        with metrics.stage('crisis.anomalies'):
+            anomaly_predictions = self.anomaly_detector.fit_predict(features_array)
+            anomaly_scores = self.anomaly_detector.decision_function(features_array)
         
         # Identify anomalies
         anomalies = []
@@ -370,12 +538,12 @@ class CrisisDetectionSystem:
         
         return alert
     
-    def comprehensive_crisis_assessment(self, user_id, messages, user_profile=None):
+    def comprehensive_crisis_assessment(self, user_id, messages, user_profile=None, output_file=None):
         """Perform comprehensive crisis assessment"""
         print(f"Realizando evaluación de crisis para usuario {user_id}...")
         
         # Analyze conversation patterns
-        conversation_analysis = self.analyze_conversation_patterns(messages)
+        conversation_analysis = self.analyze_conversation_patterns(messages, user_id)
         
         # Detect anomalies if we have enough data
         anomaly_analysis = {}
@@ -419,9 +587,14 @@ class CrisisDetectionSystem:
             assessment['crisis_alert'] = crisis_alert
         
         # Save assessment
-        output_file = f'crisis_assessment_user_{user_id}.json'
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(assessment, f, ensure_ascii=False, indent=2, default=str)
+        output_file = output_file or f'crisis_assessment_user_{user_id}.json'
+        with metrics.stage('crisis.write_json'):
+            write_json_atomic(output_file, assessment)
+        
+        if self.cohort_store is not None:
+            self.cohort_store.record_crisis_assessment(assessment)
+        if self.triage_queue is not None:
+            self.triage_queue.record_assessment(assessment)
         
         # Print summary
         self._print_assessment_summary(assessment)
@@ -462,8 +635,9 @@ def run_crisis_detection_demo():
     """Run crisis detection with demo data"""
     detector = CrisisDetectionSystem()
     
-    # Demo messages with varying crisis levels
-    demo_messages = [
+    # History from the message log when one is configured, else demo messages with varying crisis levels
+    from message_log import messages_from_env
+    demo_messages = messages_from_env() or [
         {
             'id': '1',
             'content': 'Hola Ana, me siento un poco triste hoy.',
@@ -508,3 +682,4 @@ if __name__ == "__main__":
     print("Iniciando sistema de detección de crisis...")
     assessment = run_crisis_detection_demo()
     print("\nEvaluación de crisis completada.")
+    export_metrics_from_env()
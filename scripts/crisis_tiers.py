@@ -0,0 +1,116 @@
+import os
+import re
+import time
+from typing import Dict, Any, Optional
+
+from instrumentation import metrics
+
+TIERS = ('prefilter', 'keyword_only', 'full')
+
+
+def _anchor(keyword: str) -> str:
+    # Longest word of the phrase: fewest false positives, and any match of the
+    # phrase in the cleaned text contains it verbatim in the lowercased text
+    return max(re.findall(r'\w+', keyword), key=len)
+
+
+class TieredCrisisEvaluator:
+    """Tiered front end for CrisisDetectionSystem.analyze_text_for_crisis.
+
+    Tier 1 is one compiled regex over the anchor word of every crisis keyword.
+    Messages without any anchor cannot contain a crisis keyword, so they get
+    a low-risk result straight away, with protective factors but no sentiment.
+    Tier 2 candidates get the full analysis. Under overload, candidates drop
+    to keyword-only scoring (no TextBlob): the crisis keyword scan always runs.
+
+    Overload is either declared by the caller (``overloaded = True``, e.g.
+    when a queue backs up) or detected when the moving average latency of
+    full analyses exceeds ``latency_budget_ms``; after ``cooldown`` degraded
+    messages the full path is tried again.
+    """
+
+    def __init__(self, system, latency_budget_ms: Optional[float] = None, cooldown: int = 200):
+        self.system = system
+        self.latency_budget = latency_budget_ms / 1000 if latency_budget_ms else None
+        self.cooldown = cooldown
+        self.overloaded = False
+
+        anchors = sorted({_anchor(k) for data in system.crisis_keywords.values() for k in data['keywords']},
+                         key=len, reverse=True)
+        self.prefilter = re.compile('|'.join(re.escape(a) for a in anchors))
+        self.protective_keywords = [(category, keyword)
+                                    for category, keywords in system.protective_factors.items()
+                                    for keyword in keywords]
+
+        self._latency = 0.0
+        self._degraded_left = 0
+        self.tier_counts = dict.fromkeys(TIERS, 0)
+
+    def is_candidate(self, text_lower: str) -> bool:
+        return self.prefilter.search(text_lower) is not None
+
+    def _shedding(self) -> bool:
+        if self.overloaded:
+            return True
+        if self._degraded_left > 0:
+            self._degraded_left -= 1
+            return True
+        return False
+
+    def _record(self, tier: str):
+        self.tier_counts[tier] += 1
+        metrics.count(f'crisis.tier_{tier}')
+
+    def _low_risk(self, text_lower: str) -> Dict[str, Any]:
+        # Protective keywords are single words, so the raw lowercased text matches like the cleaned one
+        protective_found = [{'category': category, 'keyword': keyword}
+                            for category, keyword in self.protective_keywords if keyword in text_lower]
+        return {
+            'risk_score': -len(protective_found),
+            'risk_level': 'BAJO',
+            'crisis_scores': dict.fromkeys(self.system.crisis_keywords, 0),
+            'indicators_found': [],
+            'protective_factors': protective_found,
+            'sentiment_polarity': 0.0,
+            'requires_immediate_attention': False,
+            'tier': 'prefilter'
+        }
+
+    def evaluate(self, text: str) -> Dict[str, Any]:
+        text_lower = text.lower()
+        if not self.is_candidate(text_lower):
+            self._record('prefilter')
+            return self._low_risk(text_lower)
+
+        if self._shedding():
+            self._record('keyword_only')
+            result = self.system.score_text(text, sentiment=False)
+            result['tier'] = 'keyword_only'
+            return result
+
+        start = time.perf_counter()
+        result = self.system.score_text(text, sentiment=True)
+        elapsed = time.perf_counter() - start
+        self._record('full')
+        result['tier'] = 'full'
+
+        if self.latency_budget is not None:
+            self._latency += 0.1 * (elapsed - self._latency)
+            if self._latency > self.latency_budget:
+                metrics.count('crisis.load_shed')
+                self._degraded_left = self.cooldown
+                self._latency = 0.0
+        return result
+
+    def tier_mix(self) -> Dict[str, float]:
+        """Share of messages handled by each tier so far."""
+        total = sum(self.tier_counts.values())
+        return {tier: (count / total if total else 0.0) for tier, count in self.tier_counts.items()}
+
+
+def tiers_from_env(system) -> Optional[TieredCrisisEvaluator]:
+    """Evaluator configured by ANALYTICS_CRISIS_TIERS (and ANALYTICS_CRISIS_LATENCY_BUDGET_MS), or None."""
+    if os.environ.get('ANALYTICS_CRISIS_TIERS', '') in ('', '0'):
+        return None
+    budget = os.environ.get('ANALYTICS_CRISIS_LATENCY_BUDGET_MS')
+    return TieredCrisisEvaluator(system, float(budget) if budget else None)
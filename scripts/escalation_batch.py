@@ -0,0 +1,127 @@
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+from time_index import to_epoch_ns
+
+# Messages per user the scalar escalation checks ever look at
+WINDOW = 14
+THEME_WINDOW = 10
+TREND_LABELS = np.array(['INSUFFICIENT_DATA', 'STABLE', 'ESCALATING', 'IMPROVING'])
+
+# Same cut-off detect_escalation_patterns uses for a crisis message
+CRISIS_SCORE = 5
+
+
+def escalation_matrices(analyses_by_user: Dict[Any, List[Dict[str, Any]]],
+                        categories: List[str]) -> Dict[str, Any]:
+    """Right-aligned users x WINDOW risk matrix, its mask and per-user theme counts.
+
+    Column WINDOW - 1 holds each user's latest analysis; shorter histories are
+    padded on the left. ``theme_counts[u, c]`` counts indicators of
+    ``categories[c]`` in the user's last THEME_WINDOW analyses.
+    """
+    user_ids = list(analyses_by_user)
+    category_index = {category: i for i, category in enumerate(categories)}
+    risk = np.zeros((len(user_ids), WINDOW))
+    mask = np.zeros((len(user_ids), WINDOW), dtype=bool)
+    theme_counts = np.zeros((len(user_ids), len(categories)), dtype=np.int64)
+
+    for row, user_id in enumerate(user_ids):
+        analyses = analyses_by_user[user_id]
+        # Time order, as the per-user prefix-sum index sees it
+        timestamps = np.fromiter((to_epoch_ns(a['timestamp']) for a in analyses), dtype=np.int64,
+                                 count=len(analyses))
+        latest = np.argsort(timestamps, kind='stable')[-WINDOW:]
+        if len(latest):
+            risk[row, WINDOW - len(latest):] = [analyses[i]['risk_score'] for i in latest.tolist()]
+            mask[row, WINDOW - len(latest):] = True
+        for analysis in analyses[-THEME_WINDOW:]:
+            for indicator in analysis.get('indicators_found', []):
+                column = category_index.get(indicator.split(':')[0])
+                if column is not None:
+                    theme_counts[row, column] += 1
+
+    return {'user_ids': user_ids, 'risk': risk, 'mask': mask, 'theme_counts': theme_counts,
+            'categories': list(categories)}
+
+
+def _window_mean(values: np.ndarray, mask: np.ndarray, lo: int, hi: int):
+    """Masked sum, count and mean over columns [lo, hi) for every row."""
+    window = mask[:, lo:hi]
+    counts = window.sum(axis=1)
+    sums = np.where(window, values[:, lo:hi], 0.0).sum(axis=1)
+    means = np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0)
+    return counts, means
+
+
+def detect_escalation_batch(risk: np.ndarray, mask: np.ndarray,
+                            theme_counts: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Escalation checks for every user at once, with detect_escalation_patterns semantics.
+
+    ``has_patterns`` is False for users with fewer than 3 analyses (the
+    scalar code returns {}); ``has_frequency`` and ``has_severity`` mark
+    which users would get those keys.
+    """
+    lengths = mask.sum(axis=1)
+    has_patterns = lengths >= 3
+    crisis = (risk >= CRISIS_SCORE).astype(np.float64)
+
+    # Last 7 vs the (up to) 7 before them
+    _, recent_rate = _window_mean(crisis, mask, WINDOW - 7, WINDOW)
+    older_count, older_rate = _window_mean(crisis, mask, 0, WINDOW - 7)
+
+    # Last 5 vs the 5 before them, only with 10+ analyses
+    _, recent_avg = _window_mean(risk, mask, WINDOW - 5, WINDOW)
+    _, older_avg = _window_mean(risk, mask, WINDOW - 10, WINDOW - 5)
+
+    result = {
+        'has_patterns': has_patterns,
+        'has_frequency': has_patterns & (older_count > 0),
+        'frequency_escalation': has_patterns & (older_count > 0) & (recent_rate > older_rate * 1.5),
+        'recent_rate': recent_rate,
+        'older_rate': older_rate,
+        'has_severity': has_patterns & (lengths >= 10),
+        'severity_escalation': has_patterns & (lengths >= 10) & (recent_avg > older_avg * 1.3),
+        'recent_avg': recent_avg,
+        'older_avg': older_avg
+    }
+    if theme_counts is not None:
+        persistent = (theme_counts >= 3) & has_patterns[:, None]
+        result['persistent_themes'] = persistent
+        result['persistent_theme_counts'] = persistent.sum(axis=1)
+    return result
+
+
+def risk_trend_batch(risk: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """calculate_risk_trend labels for every user: mean of the last 3 vs the 3 before them."""
+    lengths = mask.sum(axis=1)
+    _, recent_avg = _window_mean(risk, mask, WINDOW - 3, WINDOW)
+    _, older_avg = _window_mean(risk, mask, WINDOW - 6, WINDOW - 3)
+    older_avg = np.where(lengths >= 6, older_avg, 0.0)
+
+    codes = np.where(recent_avg > older_avg * 1.5, 2, np.where(recent_avg < older_avg * 0.7, 3, 1))
+    codes[lengths < 3] = 0
+    return TREND_LABELS[codes]
+
+
+def batch_patterns(batch: Dict[str, np.ndarray], categories: List[str], row: int) -> Dict[str, Any]:
+    """One user's detect_escalation_patterns-shaped dict from batch results."""
+    if not batch['has_patterns'][row]:
+        return {}
+    patterns = {}
+    if batch['has_frequency'][row]:
+        patterns['frequency_escalation'] = {
+            'detected': bool(batch['frequency_escalation'][row]),
+            'recent_rate': float(batch['recent_rate'][row]),
+            'older_rate': float(batch['older_rate'][row])
+        }
+    if batch['has_severity'][row]:
+        patterns['severity_escalation'] = {
+            'detected': bool(batch['severity_escalation'][row]),
+            'recent_avg': float(batch['recent_avg'][row]),
+            'older_avg': float(batch['older_avg'][row])
+        }
+    themes = [categories[c] for c in np.flatnonzero(batch['persistent_themes'][row])] \
+        if 'persistent_themes' in batch else []
+    patterns['persistent_themes'] = {'detected': len(themes) > 0, 'themes': themes}
+    return patterns
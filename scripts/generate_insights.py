@@ -4,11 +4,15 @@ from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 from typing import Dict, List, Any, Tuple
 import os
+import hashlib
+from collections import OrderedDict
+from instrumentation import metrics, export_metrics_from_env
+from cohort_aggregates import cohort_store_from_env
 
 class InsightGenerator:
     """Generate comprehensive insights from mental health platform data."""
     
-    def __init__(self):
+    def __init__(self, section_cache_size: int = 256):
         self.insight_categories = {
             'engagement': 'Patrones de Participación',
             'emotional': 'Análisis Emocional',
@@ -17,26 +21,94 @@ class InsightGenerator:
             'risk': 'Evaluación de Riesgos',
             'recommendations': 'Recomendaciones'
         }
+        
+        # Population aggregates for the dashboards (None unless ANALYTICS_COHORT_STORE is set)
+        self.cohort_store = cohort_store_from_env()
+        
+        # Section results keyed on digests of the inputs each section reads (LRU)
+        self.section_cache = OrderedDict()
+        self.section_cache_size = section_cache_size
     
     def generate_comprehensive_insights(self, 
                                      chat_analysis: Dict = None,
                                      mood_analysis: Dict = None,
-                                     crisis_analysis: Dict = None) -> Dict[str, Any]:
-        """Generate comprehensive insights from all analysis types."""
+                                     crisis_analysis: Dict = None,
+                                     user_id=None,
+                                     versions: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Generate comprehensive insights from all analysis types.
+        
+        Sections are memoized on a content digest of the inputs they read,
+        each input hashed once per call. ``versions`` optionally maps 'chat',
+        'mood' and 'crisis' to a token that the caller guarantees changes
+        with that input (e.g. an analysis timestamp); it replaces the digest.
+        """
+        inputs = {'chat': chat_analysis, 'mood': mood_analysis, 'crisis': crisis_analysis}
+        digests = {}
+        
+        def token(read):
+            if versions and versions.get(read) is not None:
+                return ('version', versions[read])
+            if read not in digests:
+                digests[read] = self._fingerprint(inputs[read])
+            return digests[read]
+        
+        def section(name, method, *reads):
+            return self._section(name, method, [inputs[read] for read in reads],
+                                 tuple(token(read) for read in reads))
         
         insights = {
-            'summary': self.generate_executive_summary(chat_analysis, mood_analysis, crisis_analysis),
-            'engagement_insights': self.analyze_engagement_patterns(chat_analysis),
-            'emotional_insights': self.analyze_emotional_patterns(mood_analysis),
-            'behavioral_insights': self.analyze_behavioral_patterns(chat_analysis, mood_analysis),
-            'therapeutic_insights': self.analyze_therapeutic_progress(chat_analysis, mood_analysis),
-            'risk_insights': self.analyze_risk_factors(crisis_analysis),
-            'recommendations': self.generate_actionable_recommendations(chat_analysis, mood_analysis, crisis_analysis),
+            'summary': section('summary', self.generate_executive_summary, 'chat', 'mood', 'crisis'),
+            'engagement_insights': section('engagement', self.analyze_engagement_patterns, 'chat'),
+            'emotional_insights': section('emotional', self.analyze_emotional_patterns, 'mood'),
+            'behavioral_insights': section('behavioral', self.analyze_behavioral_patterns, 'chat', 'mood'),
+            'therapeutic_insights': section('therapeutic', self.analyze_therapeutic_progress, 'chat', 'mood'),
+            'risk_insights': section('risk', self.analyze_risk_factors, 'crisis'),
+            'recommendations': section('recommendations', self.generate_actionable_recommendations, 'chat', 'mood', 'crisis'),
             'generated_at': datetime.now().isoformat()
         }
+        metrics.count('insights.reports_generated')
+        
+        if self.cohort_store is not None and user_id is not None:
+            self.cohort_store.record_insights(user_id, insights)
         
         return insights
     
+    def _section(self, name, method, args, tokens):
+        """Run one insight section under its own stage timer, memoized on its inputs' tokens.
+        
+        Refreshing one input only recomputes the sections that read it.
+        Cached results are shared: section results are read-only by contract.
+        """
+        key = (name, tokens)
+        cached = self.section_cache.get(key)
+        if cached is not None:
+            self.section_cache.move_to_end(key)
+            metrics.cache_hit('insights.sections')
+            return cached
+        
+        metrics.cache_miss('insights.sections')
+        with metrics.stage(f'insights.{name}'):
+            result = method(*args)
+        
+        self.section_cache[key] = result
+        if len(self.section_cache) > self.section_cache_size:
+            self.section_cache.popitem(last=False)
+        return result
+    
+    @staticmethod
+    def _fingerprint(value) -> str:
+        """Stable digest of one input (key order and dict identity don't matter)."""
+        payload = json.dumps(value, sort_keys=True, default=str, separators=(',', ':'))
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def invalidate_sections(self, name: str = None):
+        """Drop cached sections, all of them or only those of one section name."""
+        if name is None:
+            self.section_cache.clear()
+            return
+        for key in [k for k in self.section_cache if k[0] == name]:
+            del self.section_cache[key]
+    
     def generate_executive_summary(self, chat_analysis, mood_analysis, crisis_analysis) -> Dict[str, Any]:
         """Generate executive summary of user's mental health status."""
         summary = {
@@ -150,6 +222,19 @@ class InsightGenerator:
         elif avg_length < 30:
             insights['recommendations'].append("Mensajes cortos - considerar técnicas para fomentar mayor expresión")
         
+        # Sessions (average_response_time above is their user-to-Ana reply latency)
+        sessions = chat_analysis.get('session_patterns', {})
+        if sessions.get('total_sessions'):
+            insights['response_patterns']['sessions_per_week'] = sessions['sessions_per_week']
+            insights['response_patterns']['avg_session_minutes'] = sessions['avg_session_minutes']
+            insights['response_patterns']['avg_turns_per_session'] = sessions['avg_turns_per_session']
+            insights['response_patterns']['avg_user_latency_minutes'] = sessions['avg_user_latency_minutes']
+            
+            if sessions['sessions_per_week'] < 1:
+                insights['recommendations'].append("Menos de una sesión por semana - considerar recordatorios de seguimiento")
+            if sessions['avg_turns_per_session'] <= 2:
+                insights['recommendations'].append("Sesiones muy breves - fomentar conversaciones más profundas")
+        
         if avg_response_time < 5:
             insights['consistency'] = 'MUY_ACTIVO'
         elif avg_response_time < 30:
@@ -441,13 +526,23 @@ def load_analysis_results() -> Tuple[Dict, Dict, Dict]:
             with open('chat_analysis_results.json', 'r', encoding='utf-8') as f:
                 chat_analysis = json.load(f)
     except Exception as e:
+        metrics.record_error('insights.load', e, 'chat_analysis_results.json')
         print(f"Error loading chat analysis: {e}")
     
+    if not chat_analysis:
+        # Fall back to the message log when no chat analysis was saved
+        from message_log import messages_from_env
+        log_messages = messages_from_env()
+        if log_messages:
+            from analyze_chat_data import analyze_message_patterns
+            chat_analysis = analyze_message_patterns(log_messages)
+    
     try:
         if os.path.exists('mood_analysis_results.json'):
             with open('mood_analysis_results.json', 'r', encoding='utf-8') as f:
                 mood_analysis = json.load(f)
     except Exception as e:
+        metrics.record_error('insights.load', e, 'mood_analysis_results.json')
         print(f"Error loading mood analysis: {e}")
     
     try:
@@ -456,6 +551,7 @@ def load_analysis_results() -> Tuple[Dict, Dict, Dict]:
                 crisis_data = json.load(f)
                 crisis_analysis = crisis_data.get('conversation_analysis', {})
     except Exception as e:
+        metrics.record_error('insights.load', e, 'crisis_detection_results.json')
         print(f"Error loading crisis analysis: {e}")
     
     return chat_analysis, mood_analysis, crisis_analysis
@@ -465,7 +561,8 @@ def main():
     print("💡 Generando insights comprehensivos...")
     
     # Load existing analysis results
-    chat_analysis, mood_analysis, crisis_analysis = load_analysis_results()
+    with metrics.stage('insights.load'):
+        chat_analysis, mood_analysis, crisis_analysis = load_analysis_results()
     
     # Initialize insight generator
     generator = InsightGenerator()
@@ -504,10 +601,6 @@ def main():
         for indicator in positive_indicators:
             print(f"    ✅ {indicator}")
     
-    # Risk Analysis
-    risk_insights = insights.get('risk 
-            print(f"    ✅ {indicator}")
-    
     # Risk Analysis
     risk_insights = insights.get('risk_insights', {})
     if not risk_insights.get('no_data'):
@@ -565,13 +658,15 @@ def main():
     
     # Save comprehensive insights
     output_file = 'comprehensive_insights.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(insights, f, ensure_ascii=False, indent=2)
+    with metrics.stage('insights.write_json'):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(insights, f, ensure_ascii=False, indent=2)
     
     print(f"✅ Insights comprehensivos generados y guardados en: {output_file}")
     
     # Generate summary report
     generate_summary_report(insights)
+    export_metrics_from_env()
 
 def generate_summary_report(insights: Dict[str, Any]) -> None:
     """Generate a human-readable summary report."""
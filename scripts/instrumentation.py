@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from datetime import datetime
+from collections import defaultdict
+from typing import Dict, Any, Optional
+
+# Shared no-op context returned by stage() while metrics are disabled
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _StageTimer:
+    """Context manager that adds its elapsed time to a stage."""
+
+    __slots__ = ('registry', 'stage', 'start')
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.registry._add_stage_time(self.stage, elapsed)
+        if exc_type is not None:
+            self.registry.record_error(self.stage, exc)
+        return False
+
+
+class MetricsRegistry:
+    """Lightweight stage timers, counters and cache statistics for the analyzers.
+
+    All recording methods return immediately while the registry is disabled,
+    so instrumented code paths cost one attribute check when metrics are off.
+    """
+
+    def __init__(self, enabled: bool = False, max_error_samples: int = 20):
+        self.enabled = enabled
+        self.max_error_samples = max_error_samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all collected metrics."""
+        self.stage_seconds = defaultdict(float)
+        self.stage_calls = defaultdict(int)
+        self.stage_max_seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.error_samples = []
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.started_at = datetime.now().isoformat()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name: str):
+        """Time a block of code: ``with metrics.stage('crisis.score'): ...``"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def _add_stage_time(self, name, elapsed):
+        with self._lock:
+            self.stage_seconds[name] += elapsed
+            self.stage_calls[name] += 1
+            if elapsed > self.stage_max_seconds[name]:
+                self.stage_max_seconds[name] = elapsed
+
+    def count(self, name: str, n: int = 1):
+        """Increment a named counter (e.g. messages processed)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += n
+
+    def record_error(self, stage: str, exc: Optional[BaseException] = None, detail: Any = None):
+        """Count an error for a stage and keep a bounded sample of messages."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.errors[stage] += 1
+            if len(self.error_samples) < self.max_error_samples:
+                self.error_samples.append({
+                    'stage': stage,
+                    'error': f"{type(exc).__name__}: {exc}" if exc is not None else None,
+                    'detail': detail
+                })
+
+    def cache_hit(self, cache: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.cache_hits[cache] += 1
+
+    def cache_miss(self, cache: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.cache_misses[cache] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics as a JSON-serializable dict."""
+        with self._lock:
+            caches = {}
+            for cache in set(self.cache_hits) | set(self.cache_misses):
+                hits = self.cache_hits[cache]
+                misses = self.cache_misses[cache]
+                caches[cache] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': hits / (hits + misses) if hits + misses else 0.0
+                }
+
+            return {
+                'started_at': self.started_at,
+                'snapshot_at': datetime.now().isoformat(),
+                'stages': {
+                    name: {
+                        'seconds': self.stage_seconds[name],
+                        'calls': self.stage_calls[name],
+                        'max_seconds': self.stage_max_seconds[name]
+                    }
+                    for name in self.stage_seconds
+                },
+                'counters': dict(self.counters),
+                'errors': dict(self.errors),
+                'error_samples': list(self.error_samples),
+                'caches': caches
+            }
+
+    def to_prometheus(self, prefix: str = 'analytics') -> str:
+        """Render metrics in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+
+        stages = snap['stages']
+        family('stage_seconds_total', 'counter', 'Tiempo acumulado por etapa',
+               [({'stage': s}, d['seconds']) for s, d in stages.items()])
+        family('stage_calls_total', 'counter', 'Ejecuciones por etapa',
+               [({'stage': s}, d['calls']) for s, d in stages.items()])
+        family('stage_max_seconds', 'gauge', 'Duración máxima por etapa',
+               [({'stage': s}, d['max_seconds']) for s, d in stages.items()])
+        family('events_total', 'counter', 'Contadores de eventos procesados',
+               [({'name': n}, v) for n, v in snap['counters'].items()])
+        family('errors_total', 'counter', 'Errores por etapa',
+               [({'stage': s}, v) for s, v in snap['errors'].items()])
+        family('cache_hits_total', 'counter', 'Aciertos de caché',
+               [({'cache': c}, d['hits']) for c, d in snap['caches'].items()])
+        family('cache_misses_total', 'counter', 'Fallos de caché',
+               [({'cache': c}, d['misses']) for c, d in snap['caches'].items()])
+
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str):
+        """Write a JSON metrics snapshot (atomically, so readers never see a partial file)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def write_prometheus(self, path: str):
+        """Write metrics as a Prometheus textfile (atomically, for node_exporter)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def export(self, path: str):
+        """Write metrics to path, choosing the format from its extension."""
+        if path.endswith('.prom'):
+            self.write_prometheus(path)
+        else:
+            self.write_json(path)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide registry used by all analysis scripts. Enable with
+# ANALYTICS_METRICS=1 and set ANALYTICS_METRICS_FILE to a .prom or .json path.
+metrics = MetricsRegistry(enabled=os.environ.get('ANALYTICS_METRICS', '') not in ('', '0'))
+
+
+def export_metrics_from_env():
+    """Export the shared registry to ANALYTICS_METRICS_FILE if metrics are enabled."""
+    path = os.environ.get('ANALYTICS_METRICS_FILE')
+    if metrics.enabled and path:
+        metrics.export(path)
+        print(f"📈 Métricas guardadas en: {path}")
@@ -0,0 +1,147 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+
+from time_index import to_epoch_ns
+from activity_cube import wall_clock
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9: timestamps stay in their written offset
+    ZoneInfo = None
+
+SECOND_NS = 10**9
+HOUR_NS = 3600 * SECOND_NS
+DAY_NS = 86400 * SECOND_NS
+
+
+@lru_cache(maxsize=512)
+def _year_offsets(zone: str, year: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """UTC instants (ns) where ``zone`` changes offset during ``year``, and the offset (ns) from each one.
+
+    The offset is sampled once a day and every change is bisected down to
+    the second, so a year costs about 365 + 2 x 17 utcoffset() calls, once.
+    """
+    tz = ZoneInfo(zone)
+
+    def offset(seconds: int) -> int:
+        return int(datetime.fromtimestamp(seconds, tz).utcoffset().total_seconds())
+
+    start = int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp())
+    end = int(datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp())
+    instants = [start]
+    offsets = [offset(start)]
+    previous = start
+    for current in range(start + 86400, end + 86400, 86400):
+        current = min(current, end)
+        if offset(current) != offsets[-1]:
+            lo, hi = previous, current
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if offset(mid) == offsets[-1]:
+                    lo = mid
+                else:
+                    hi = mid
+            instants.append(hi)
+            offsets.append(offset(hi))
+        previous = current
+    return tuple(s * SECOND_NS for s in instants), tuple(o * SECOND_NS for o in offsets)
+
+
+def offset_table(zone: str, start_ns: int, end_ns: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted transition instants and offsets covering [start_ns, end_ns] for ``zone``."""
+    first = int(np.datetime64(int(start_ns), 'ns').astype('datetime64[Y]').astype(np.int64)) + 1970
+    last = int(np.datetime64(int(end_ns), 'ns').astype('datetime64[Y]').astype(np.int64)) + 1970
+    instants, offsets = [], []
+    for year in range(first, last + 1):
+        year_instants, year_offsets = _year_offsets(zone, year)
+        instants.extend(year_instants)
+        offsets.extend(year_offsets)
+    return np.array(instants, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def utc_to_local(timestamps_ns, zone: Optional[str]) -> np.ndarray:
+    """Local wall-clock epoch ns for UTC epoch ns, via one searchsorted over the zone's offset table."""
+    timestamps = np.asarray(timestamps_ns, dtype=np.int64)
+    if zone is None or not len(timestamps):
+        return timestamps.copy()
+    instants, offsets = offset_table(zone, timestamps.min(), timestamps.max())
+    return timestamps + offsets[np.searchsorted(instants, timestamps, side='right') - 1]
+
+
+def utc_to_local_many(timestamps_ns, zones) -> np.ndarray:
+    """Like utc_to_local with a zone per element (e.g. each message's user zone); None keeps UTC."""
+    timestamps = np.asarray(timestamps_ns, dtype=np.int64)
+    zones = np.asarray(zones, dtype=object)
+    local = timestamps.copy()
+    for zone in set(zones.tolist()):
+        if zone is not None:
+            selected = zones == zone
+            local[selected] = utc_to_local(timestamps[selected], zone)
+    return local
+
+
+def calendar_fields(local) -> Dict[str, np.ndarray]:
+    """Hour, weekday (Monday=0), date, ISO year and ISO week for local wall-clock times."""
+    ns = np.asarray(local).astype('datetime64[ns]').astype(np.int64)
+    days = np.floor_divide(ns, DAY_NS)
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday
+    # The ISO week belongs to the year of its Thursday
+    thursday = days - weekday + 3
+    iso_year = thursday.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+    year_start = (iso_year - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+    return {
+        'hour': np.floor_divide(ns - days * DAY_NS, HOUR_NS),
+        'weekday': weekday,
+        'date': days.astype('datetime64[D]'),
+        'iso_year': iso_year,
+        'iso_week': (thursday - year_start) // 7 + 1
+    }
+
+
+def local_fields(timestamps_ns, zone: Optional[str]) -> Dict[str, np.ndarray]:
+    """calendar_fields for UTC epoch ns seen from ``zone``, plus the local times themselves."""
+    local = utc_to_local(timestamps_ns, zone).astype('datetime64[ns]')
+    return {'local': local, **calendar_fields(local)}
+
+
+def local_times(timestamps: List[datetime], zone: Optional[str] = None) -> np.ndarray:
+    """Wall-clock datetime64[s] for parsed timestamps.
+
+    With a zone, instants are converted to it; without one, each timestamp
+    keeps the wall time it was written in (the previous behaviour).
+    """
+    if zone is None or ZoneInfo is None:
+        return np.array([wall_clock(ts) for ts in timestamps], dtype='datetime64[s]')
+    utc = np.fromiter((to_epoch_ns(ts) for ts in timestamps), dtype=np.int64, count=len(timestamps))
+    return utc_to_local(utc, zone).astype('datetime64[ns]').astype('datetime64[s]')
+
+
+@lru_cache(maxsize=8)
+def _timezone_map(path: str) -> Dict[str, str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return {str(user): zone for user, zone in json.load(f).items()}
+
+
+def user_timezone(user_id=None, messages: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+    """IANA zone for a user: the first non-empty ``timezone`` in the messages, then the
+    ANALYTICS_USER_TIMEZONES JSON map (user id -> zone), then ANALYTICS_TIMEZONE; None keeps
+    timestamps as written."""
+    if ZoneInfo is None:
+        return None
+    if messages:
+        # First message that carries a zone (older messages may predate the field)
+        zone = next((m.get('timezone') for m in messages if m.get('timezone')), None)
+        if zone:
+            return zone
+        if user_id is None:
+            user_id = next((m.get('user_id') for m in messages if m.get('user_id') is not None), None)
+    path = os.environ.get('ANALYTICS_USER_TIMEZONES')
+    if path and user_id is not None:
+        zone = _timezone_map(path).get(str(user_id))
+        if zone:
+            return zone
+    return os.environ.get('ANALYTICS_TIMEZONE') or None
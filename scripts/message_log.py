@@ -0,0 +1,264 @@
+import os
+import mmap
+import struct
+import argparse
+from typing import Dict, List, Any, Iterable, Optional
+import numpy as np
+
+from instrumentation import metrics
+from time_index import to_epoch_ns
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer only
+    fcntl = None
+
+MAGIC = b'MHLOG1\x00\x00'
+SENDERS = ['user', 'ana']
+
+# Record in the log: timestamp_ns, user_id, sender code, text length, then UTF-8 text
+RECORD_HEADER = struct.Struct('<qqBI')
+
+# Fixed-size index entry per record; ``offset`` points at the text bytes
+INDEX_DTYPE = np.dtype([('user_id', '<i8'), ('timestamp', '<i8'), ('offset', '<i8'),
+                        ('length', '<u4'), ('sender', 'u1'), ('_pad', 'V3')])
+
+# Sort key of the per-user offset index; structured arrays compare field by field
+KEY_DTYPE = np.dtype([('user_id', '<i8'), ('timestamp', '<i8')])
+
+
+def _sender_code(sender: str) -> int:
+    return SENDERS.index(sender) if sender in SENDERS else len(SENDERS)
+
+
+class MessageLogWriter:
+    """Appends chat messages to ``<path>`` and its index ``<path>.idx``.
+
+    Each batch writes its records to the log and flushes them before writing
+    the matching index entries, so any index entry a reader can see points at
+    bytes that are already in the log. Writers serialize through an flock on
+    ``<path>.lock``; readers never take it. A partial index entry left by a
+    writer that died mid-write is truncated by the next writer, so later
+    entries stay aligned.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(MAGIC)
+        self._log = open(path, 'ab')
+        self._index = open(f'{path}.idx', 'ab')
+        self._lock = open(f'{path}.lock', 'a')
+
+    def append_many(self, messages: Iterable[Dict[str, Any]]) -> int:
+        """Append message dicts (timestamp, user_id, sender, content or message)."""
+        if fcntl is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_EX)
+        try:
+            self._repair_index()
+            self._log.seek(0, os.SEEK_END)
+            position = self._log.tell()
+            chunks = []
+            entries = []
+            for msg in messages:
+                text = (msg.get('content') or msg.get('message') or '').encode('utf-8')
+                timestamp = to_epoch_ns(msg['timestamp'])
+                sender = _sender_code(msg.get('sender', 'user'))
+                user_id = int(msg['user_id'])
+                chunks.append(RECORD_HEADER.pack(timestamp, user_id, sender, len(text)))
+                chunks.append(text)
+                position += RECORD_HEADER.size
+                entries.append((user_id, timestamp, position, len(text), sender, b''))
+                position += len(text)
+
+            if not entries:
+                return 0
+            self._log.write(b''.join(chunks))
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._index.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+            self._index.flush()
+            if self.fsync:
+                os.fsync(self._index.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._lock, fcntl.LOCK_UN)
+
+        metrics.count('message_log.appended', len(entries))
+        return len(entries)
+
+    def _repair_index(self):
+        """Drop a torn index tail (caller holds the lock). Orphaned log bytes are harmless."""
+        size = os.fstat(self._index.fileno()).st_size
+        torn = size % INDEX_DTYPE.itemsize
+        if torn:
+            os.ftruncate(self._index.fileno(), size - torn)
+            metrics.count('message_log.index_repaired')
+
+    def append(self, timestamp, user_id: int, sender: str, text: str) -> int:
+        return self.append_many([{'timestamp': timestamp, 'user_id': user_id, 'sender': sender, 'content': text}])
+
+    def close(self):
+        self._log.close()
+        self._index.close()
+        self._lock.close()
+
+
+class MessageLogReader:
+    """Memory-mapped, lock-free reader over a message log.
+
+    ``refresh()`` picks up entries appended since the last call (only whole
+    index entries, which always reference complete records). A user's history
+    or time range is a binary search over the (user, timestamp) ordered index
+    followed by slices of the mapped log.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = np.empty(0, dtype=INDEX_DTYPE)
+        self._mm = None
+        self._mapped_size = 0
+        self._order = np.empty(0, dtype=np.int64)
+        self._sorted_users = np.empty(0, dtype=np.int64)
+        self._sorted_timestamps = np.empty(0, dtype=np.int64)
+        self.refresh()
+
+    def refresh(self) -> int:
+        """Load new index entries and remap the log if it grew; returns the number of new messages."""
+        index_path = f'{self.path}.idx'
+        index_size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+        complete = index_size // INDEX_DTYPE.itemsize
+        known = len(self.entries)
+        if complete <= known:
+            return 0
+
+        new_entries = np.fromfile(index_path, dtype=INDEX_DTYPE, count=complete - known,
+                                  offset=known * INDEX_DTYPE.itemsize)
+        self.entries = np.concatenate([self.entries, new_entries])
+
+        log_size = os.path.getsize(self.path)
+        if log_size > self._mapped_size:
+            if self._mm is not None:
+                self._mm.close()
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = log_size
+
+        # Per-user offset index: positions ordered by (user, timestamp, arrival). Only the
+        # new entries are sorted; they are merged in after any equal keys, which arrived first.
+        new_order = known + np.lexsort((np.arange(len(new_entries)), new_entries['timestamp'],
+                                        new_entries['user_id']))
+        new_keys = np.empty(len(new_order), dtype=KEY_DTYPE)
+        new_keys['user_id'] = self.entries['user_id'][new_order]
+        new_keys['timestamp'] = self.entries['timestamp'][new_order]
+        keys = np.empty(known, dtype=KEY_DTYPE)
+        keys['user_id'] = self._sorted_users
+        keys['timestamp'] = self._sorted_timestamps
+        insert_at = np.searchsorted(keys, new_keys, side='right')
+
+        self._order = np.insert(self._order, insert_at, new_order)
+        self._sorted_users = np.insert(self._sorted_users, insert_at, new_keys['user_id'])
+        self._sorted_timestamps = np.insert(self._sorted_timestamps, insert_at, new_keys['timestamp'])
+        return complete - known
+
+    def __len__(self):
+        return len(self.entries)
+
+    def users(self) -> np.ndarray:
+        return np.unique(self.entries['user_id'])
+
+    def user_positions(self, user_id: int, start=None, end=None) -> np.ndarray:
+        """Positions of a user's messages in [start, end), oldest first."""
+        lo = np.searchsorted(self._sorted_users, user_id, side='left')
+        hi = np.searchsorted(self._sorted_users, user_id, side='right')
+        positions = self._order[lo:hi]
+        if start is not None or end is not None:
+            timestamps = self._sorted_timestamps[lo:hi]
+            a = 0 if start is None else np.searchsorted(timestamps, to_epoch_ns(start), side='left')
+            b = len(positions) if end is None else np.searchsorted(timestamps, to_epoch_ns(end), side='left')
+            positions = positions[a:b]
+        return positions
+
+    def text(self, position: int) -> str:
+        entry = self.entries[position]
+        offset = int(entry['offset'])
+        return self._mm[offset:offset + int(entry['length'])].decode('utf-8')
+
+    def user_arrays(self, user_id: int, start=None, end=None) -> Dict[str, Any]:
+        """Timestamps, senders and raw UTF-8 text slices without building message dicts."""
+        positions = self.user_positions(user_id, start, end)
+        entries = self.entries[positions]
+        return {
+            'positions': positions,
+            'timestamps': entries['timestamp'].astype('datetime64[ns]'),
+            'senders': entries['sender'],
+            'texts': [self._mm[o:o + n] for o, n in zip(entries['offset'].tolist(), entries['length'].tolist())]
+        }
+
+    def user_messages(self, user_id: int, start=None, end=None) -> List[Dict[str, Any]]:
+        """A user's history as message dicts, in the shape the analyzers expect."""
+        positions = self.user_positions(user_id, start, end)
+        messages = []
+        for position in positions.tolist():
+            entry = self.entries[position]
+            offset = int(entry['offset'])
+            text = self._mm[offset:offset + int(entry['length'])].decode('utf-8')
+            sender_code = int(entry['sender'])
+            messages.append({
+                'id': str(position),
+                'user_id': int(entry['user_id']),
+                'sender': SENDERS[sender_code] if sender_code < len(SENDERS) else 'other',
+                'content': text,
+                'message': text,
+                'timestamp': np.datetime_as_string(np.datetime64(int(entry['timestamp']), 'ns'), unit='s') + 'Z'
+            })
+        metrics.count('message_log.read', len(messages))
+        return messages
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+def messages_from_env(default_user: int = 1) -> Optional[List[Dict[str, Any]]]:
+    """The history of ANALYTICS_USER_ID from ANALYTICS_MESSAGE_LOG, or None when no log is configured."""
+    path = os.environ.get('ANALYTICS_MESSAGE_LOG')
+    if not path:
+        return None
+    reader = MessageLogReader(path)
+    try:
+        return reader.user_messages(int(os.environ.get('ANALYTICS_USER_ID', default_user)))
+    finally:
+        reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log binario de mensajes de chat (solo anexado)')
+    parser.add_argument('--log', required=True, help='Archivo del log de mensajes')
+    parser.add_argument('--import', dest='import_path', help='Importar un dataset de chat (JSONL o Parquet)')
+    parser.add_argument('--user', type=int, help='Mostrar el historial de este usuario')
+    args = parser.parse_args()
+
+    if args.import_path:
+        from checkpoint import load_messages_by_user
+        writer = MessageLogWriter(args.log)
+        total = 0
+        for user_id, messages in load_messages_by_user(args.import_path).items():
+            total += writer.append_many({**m, 'user_id': user_id} for m in messages)
+        writer.close()
+        print(f"📥 {total:,} mensajes añadidos a {args.log}")
+
+    reader = MessageLogReader(args.log)
+    print(f"📚 Log: {len(reader):,} mensajes de {len(reader.users()):,} usuarios")
+    if args.user is not None:
+        for msg in reader.user_messages(args.user)[-10:]:
+            print(f"  [{msg['timestamp']}] {msg['sender']}: {msg['content']}")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
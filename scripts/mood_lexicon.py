@@ -0,0 +1,121 @@
+import re
+from typing import Dict, List
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Accent folding table applied with str.translate (ñ is kept: "año" != "ano")
+ACCENT_TABLE = str.maketrans('áéíóúüàèìòù', 'aeiouuaeiou')
+
+
+def normalize_token(token: str) -> str:
+    """Lowercase and fold accents so 'Pánico' and 'panico' share a key."""
+    return token.lower().translate(ACCENT_TABLE)
+
+
+def inflections(word: str) -> List[str]:
+    """Gender and number variants of a Spanish adjective or noun.
+
+    'ansioso' -> ansiosa/ansiosos/ansiosas, 'triste' -> tristes,
+    'feliz' -> felices, 'temor' -> temores.
+    """
+    forms = [word]
+    if word.endswith('o'):
+        stem = word[:-1]
+        forms += [stem + 'a', stem + 'os', stem + 'as']
+    elif word.endswith('a'):
+        forms += [word + 's']
+    elif word.endswith('e'):
+        forms += [word + 's']
+    elif word.endswith('z'):
+        forms += [word[:-1] + 'ces']
+    else:
+        forms += [word + 'es']
+    return forms
+
+
+class MoodLexiconIndex:
+    """Inverted index from normalized tokens to mood keywords.
+
+    The lexicon is compiled once: every keyword (and each of its inflected,
+    accent-folded forms) maps to a keyword id, and every keyword id to a
+    mood. Matching a message is then one hash lookup per token, regardless
+    of vocabulary size. Multi-word keywords ('sin esperanza') are indexed by
+    their first token and confirmed against the following tokens.
+    """
+
+    def __init__(self, mood_indicators: Dict[str, List[str]]):
+        self.moods = list(mood_indicators.keys())
+        self.keywords = []
+        self.keyword_mood = []
+        self.token_index = {}
+        self.phrase_index = {}
+
+        for mood_id, mood in enumerate(self.moods):
+            for keyword in mood_indicators[mood]:
+                keyword_id = len(self.keywords)
+                self.keywords.append(keyword)
+                self.keyword_mood.append(mood_id)
+
+                words = [normalize_token(w) for w in keyword.split()]
+                if len(words) == 1:
+                    for form in inflections(words[0]):
+                        self.token_index.setdefault(form, keyword_id)
+                else:
+                    # Inflect only the last word of a phrase: 'sin esperanzas'
+                    for form in inflections(words[-1]):
+                        phrase = tuple(words[1:-1]) + (form,)
+                        self.phrase_index.setdefault(words[0], []).append((phrase, keyword_id))
+
+        self.keyword_mood = np.array(self.keyword_mood, dtype=np.int64)
+
+    def _match_tokens(self, tokens: List[str]) -> List[int]:
+        """Keyword ids present in one normalized token list."""
+        found = []
+        token_index = self.token_index
+        phrase_index = self.phrase_index
+        for i, token in enumerate(tokens):
+            keyword_id = token_index.get(token)
+            if keyword_id is not None:
+                found.append(keyword_id)
+            candidates = phrase_index.get(token)
+            if candidates:
+                for phrase, phrase_id in candidates:
+                    if tuple(tokens[i + 1:i + 1 + len(phrase)]) == phrase:
+                        found.append(phrase_id)
+        return found
+
+    def match_batch(self, texts: List[str]) -> np.ndarray:
+        """Count distinct mood keywords per message.
+
+        Returns an int array of shape (len(texts), len(self.moods)); each
+        keyword counts once per message, as in the original substring check.
+        """
+        # Normalize each distinct token once
+        normalized = {}
+        doc_ids = []
+        keyword_ids = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = []
+            for raw in _TOKEN_RE.findall(text):
+                token = normalized.get(raw)
+                if token is None:
+                    token = normalized[raw] = normalize_token(raw)
+                tokens.append(token)
+            found = self._match_tokens(tokens)
+            if found:
+                keyword_ids.extend(found)
+                doc_ids.extend([doc_id] * len(found))
+
+        counts = np.zeros((len(texts), len(self.moods)), dtype=np.int64)
+        if keyword_ids:
+            # Each keyword counts once per message
+            pairs = np.unique(np.array([doc_ids, keyword_ids], dtype=np.int64), axis=1)
+            np.add.at(counts, (pairs[0], self.keyword_mood[pairs[1]]), 1)
+        return counts
+
+    def match(self, text: str) -> Dict[str, int]:
+        """Mood scores for a single message"""
+        row = self.match_batch([text])[0]
+        return {mood: int(row[i]) for i, mood in enumerate(self.moods)}
@@ -1,21 +1,23 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime, timedelta
 import json
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from scipy import stats
 import warnings
 from collections import defaultdict
 from typing import Dict, List, Any, Tuple
 import statistics
+from instrumentation import metrics, export_metrics_from_env
+from mood_lexicon import MoodLexiconIndex
+from time_index import UserTimeSeriesIndex
+from activity_cube import ActivityCube, DAY_NAMES
+from local_time import local_times, user_timezone
+from mood_statistics import bootstrap_correlations, lagged_correlation_matrix, describe_lags
+from checkpoint import write_json_atomic
 
 warnings.filterwarnings('ignore')
 
 class MoodPatternAnalyzer:
-    def __init__(self):
+    def __init__(self, bootstrap_resamples: int = 0, require_significance: bool = False, max_lag: int = 7):
         self.mood_categories = {
             'very_positive': (0.5, 1.0),
             'positive': (0.1, 0.5),
@@ -32,6 +34,18 @@ class MoodPatternAnalyzer:
             'fear': ['miedo', 'asustado', 'aterrado', 'pánico', 'temor', 'espanto'],
             'calm': ['tranquilo', 'relajado', 'sereno', 'pacífico', 'calmado', 'sosegado']
         }
+        
+        # Token -> mood inverted index with accent and inflection folding
+        self.mood_lexicon = MoodLexiconIndex(self.mood_indicators)
+        
+        # Bootstrap confidence intervals for mood correlations (0 = off). Requiring
+        # significance turns them on and makes correlation rules need a CI excluding 0.
+        self.require_significance = require_significance
+        self.bootstrap_resamples = bootstrap_resamples or (1000 if require_significance else 0)
+        # Days of delay checked by the lagged-effects analysis (factor today -> mood N days later)
+        self.max_lag = max_lag
+        self.lagged_factors = ['anxiety_level', 'sleep_quality', 'energy_level',
+                               'social_interaction', 'exercise', 'medication_taken']
     
     def load_user_data(self, user_id, days_back=30):
         """Load user data for analysis (mock implementation)"""
@@ -41,48 +55,33 @@ class MoodPatternAnalyzer:
     
     def _generate_sample_data(self, user_id, days_back):
         """Generate sample mood data for demonstration"""
-        np.random.seed(user_id)  # For reproducible results
-        
-        dates = pd.date_range(
-            start=datetime.now() - timedelta(days=days_back),
-            end=datetime.now(),
-            freq='D'
-        )
-        
-        # Generate mood patterns with some trends
-        base_mood = np.random.normal(0, 0.3, len(dates))
-        
-        # Add weekly patterns (weekends might be different)
-        weekly_pattern = np.sin(np.arange(len(dates)) * 2 * np.pi / 7) * 0.2
+        from synthetic_data import SyntheticDataGenerator, MOOD_COLUMNS
         
-        # Add some trend (gradual improvement or decline)
-        trend = np.linspace(-0.1, 0.1, len(dates))
-        
-        mood_scores = base_mood + weekly_pattern + trend
-        mood_scores = np.clip(mood_scores, -1, 1)  # Keep within bounds
-        
-        data = []
-        for i, date in enumerate(dates):
-            # Simulate multiple entries per day sometimes
-            entries_today = np.random.poisson(1.5)  # Average 1.5 entries per day
-            
-            for _ in range(max(1, entries_today)):
-                data.append({
-                    'date': date,
-                    'mood_score': mood_scores[i] + np.random.normal(0, 0.1),
-                    'anxiety_level': max(0, min(10, np.random.normal(5, 2))),
-                    'sleep_quality': max(1, min(10, np.random.normal(7, 1.5))),
-                    'energy_level': max(1, min(10, np.random.normal(6, 2))),
-                    'social_interaction': np.random.choice([0, 1], p=[0.3, 0.7]),
-                    'exercise': np.random.choice([0, 1], p=[0.6, 0.4]),
-                    'medication_taken': np.random.choice([0, 1], p=[0.2, 0.8])
-                })
-        
-        return pd.DataFrame(data)
+        # Per-user random stream, so results are reproducible without global seeding
+        columns = SyntheticDataGenerator().generate_mood_checkins(user_id, days_back)
+        return pd.DataFrame({col: columns[col] for col in MOOD_COLUMNS[1:]})
+    
+    def _daily_means(self, df, field):
+        """Per-day means from a prefix-sum index: one searchsorted over day edges"""
+        dates = df['date']
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        valid = df[field].notna().values
+        index = UserTimeSeriesIndex.from_arrays(dates.values[valid], {field: df[field].values[valid]})
+        
+        edges = pd.date_range(dates.min().normalize(), dates.max().normalize() + pd.Timedelta(days=1), freq='D')
+        buckets = index.bucket_stats(field, edges.values)
+        has_data = buckets['count'] > 0
+        
+        daily = pd.Series(buckets['mean'][has_data], index=edges[:-1][has_data].date, name=field)
+        daily.index.name = 'date'
+        return daily
     
     def analyze_mood_trends(self, df):
         """Analyze mood trends over time"""
-        daily_mood = df.groupby(df['date'].dt.date)['mood_score'].mean()
+        from scipy import stats
+        
+        daily_mood = self._daily_means(df, 'mood_score')
         
         # Calculate trend using linear regression
         x = np.arange(len(daily_mood))
@@ -114,15 +113,82 @@ class MoodPatternAnalyzer:
         corr_matrix = df[correlation_vars].corr()
         mood_correlations = corr_matrix['mood_score'].drop('mood_score').sort_values(key=abs, ascending=False)
         
-        return {
+        results = {
             'correlation_matrix': corr_matrix,
             'mood_correlations': mood_correlations,
             'strongest_positive_factor': mood_correlations.idxmax(),
             'strongest_negative_factor': mood_correlations.idxmin()
         }
+        
+        if self.bootstrap_resamples:
+            results['mood_correlation_ci'] = bootstrap_correlations(
+                df['mood_score'].values,
+                {factor: df[factor].values for factor in correlation_vars if factor != 'mood_score'},
+                resamples=self.bootstrap_resamples
+            )
+        
+        return results
+    
+    def _correlation_supports(self, correlation_analysis, factor, holds):
+        """Whether a correlation rule fires: threshold met and, if required, significant."""
+        correlations = correlation_analysis['mood_correlations']
+        if factor not in correlations.index or not holds(correlations[factor]):
+            return False
+        if not self.require_significance:
+            return True
+        interval = correlation_analysis.get('mood_correlation_ci', {}).get(factor)
+        return bool(interval and interval['significant'])
+    
+    def _daily_grid(self, df):
+        """Daily means of mood and every lagged factor on one gap-free date grid (NaN = no data)"""
+        columns = {field: self._daily_means(df, field) for field in ['mood_score'] + self.lagged_factors}
+        first = min(series.index.min() for series in columns.values())
+        last = max(series.index.max() for series in columns.values())
+        days = pd.date_range(first, last, freq='D').date
+        return np.stack([columns[field].reindex(days).values.astype(np.float64) for field in columns])
+    
+    def analyze_lagged_effects(self, df):
+        """Cross-correlate daily mood with each factor 0..max_lag days earlier"""
+        return self.analyze_lagged_effects_batch({None: df})[None]
+    
+    def analyze_lagged_effects_batch(self, dfs_by_user):
+        """Lagged effects for many users in one FFT pass: {user_id: {factor: lags}}"""
+        users = list(dfs_by_user)
+        grids = [self._daily_grid(dfs_by_user[user]) for user in users]
+        
+        # Pad every user to the longest history; missing days are masked out
+        days = max(grid.shape[1] for grid in grids)
+        stacked = np.full((len(users), 1 + len(self.lagged_factors), days), np.nan)
+        for i, grid in enumerate(grids):
+            stacked[i, :, :grid.shape[1]] = grid
+        
+        matrix = lagged_correlation_matrix(stacked[:, 0], stacked[:, 1:], max_lag=self.max_lag)
+        return {
+            user: {factor: describe_lags(matrix['r'][i, k], matrix['pairs'][i, k])
+                   for k, factor in enumerate(self.lagged_factors)}
+            for i, user in enumerate(users)
+        }
+    
+    def _lagged_effect(self, lagged_effects, factor, holds):
+        """Strongest lag >= 1 for a factor when its correlation meets the rule and is significant.
+        
+        best_lag is picked among max_lag candidates, so unlike the same-day rules
+        the (Bonferroni-corrected) significance test is always required here.
+        """
+        effect = (lagged_effects or {}).get(factor)
+        if not effect or effect['best_lag'] is None or not effect['significant']:
+            return None
+        return effect if holds(effect['best_r']) else None
+    
+    @staticmethod
+    def _days_later(lag):
+        return '1 día después' if lag == 1 else f'{lag} días después'
     
     def identify_mood_patterns(self, df):
         """Identify patterns in mood data using clustering"""
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import StandardScaler
+        
         # Prepare features for clustering
         features = ['mood_score', 'anxiety_level', 'sleep_quality', 'energy_level']
         X = df[features].values
@@ -206,9 +272,9 @@ class MoodPatternAnalyzer:
             })
         
         # Correlation-based recommendations
-        correlations = analysis_results['correlations']['mood_correlations']
+        correlations = analysis_results['correlations']
         
-        if 'sleep_quality' in correlations.index and correlations['sleep_quality'] > 0.3:
+        if self._correlation_supports(correlations, 'sleep_quality', lambda r: r > 0.3):
             recommendations.append({
                 'category': 'sleep',
                 'priority': 'medium',
@@ -216,7 +282,7 @@ class MoodPatternAnalyzer:
                 'action': 'improve_sleep_hygiene'
             })
         
-        if 'exercise' in correlations.index and correlations['exercise'] > 0.2:
+        if self._correlation_supports(correlations, 'exercise', lambda r: r > 0.2):
             recommendations.append({
                 'category': 'exercise',
                 'priority': 'medium',
@@ -224,7 +290,7 @@ class MoodPatternAnalyzer:
                 'action': 'increase_physical_activity'
             })
         
-        if 'anxiety_level' in correlations.index and correlations['anxiety_level'] < -0.3:
+        if self._correlation_supports(correlations, 'anxiety_level', lambda r: r < -0.3):
             recommendations.append({
                 'category': 'anxiety',
                 'priority': 'high',
@@ -232,11 +298,57 @@ class MoodPatternAnalyzer:
                 'action': 'practice_relaxation_techniques'
             })
         
+        # Lagged-effect recommendations: factors that predict mood on later days
+        lagged_effects = analysis_results.get('lagged_effects')
+        days_later = self._days_later
+        
+        effect = self._lagged_effect(lagged_effects, 'sleep_quality', lambda r: r > 0.3)
+        if effect:
+            recommendations.append({
+                'category': 'sleep',
+                'priority': 'medium',
+                'recommendation': f'Cómo duermes se refleja sobre todo en tu estado de ánimo {days_later(effect["best_lag"])}. Prioriza el descanso antes de los días exigentes.',
+                'action': 'prioritize_sleep_before_demanding_days',
+                'lag_days': effect['best_lag']
+            })
+        
+        effect = self._lagged_effect(lagged_effects, 'exercise', lambda r: r > 0.2)
+        if effect:
+            recommendations.append({
+                'category': 'exercise',
+                'priority': 'medium',
+                'recommendation': f'El efecto del ejercicio en tu estado de ánimo es más claro {days_later(effect["best_lag"])}. Mantén una actividad física regular para sostenerlo.',
+                'action': 'schedule_regular_exercise',
+                'lag_days': effect['best_lag']
+            })
+        
+        effect = self._lagged_effect(lagged_effects, 'anxiety_level', lambda r: r < -0.3)
+        if effect:
+            recommendations.append({
+                'category': 'anxiety',
+                'priority': 'high',
+                'recommendation': f'La ansiedad de un día afecta sobre todo a tu estado de ánimo {days_later(effect["best_lag"])}. Tras un día de mucha ansiedad, planifica actividades de autocuidado.',
+                'action': 'plan_self_care_after_anxiety',
+                'lag_days': effect['best_lag']
+            })
+        
+        effect = self._lagged_effect(lagged_effects, 'social_interaction', lambda r: r > 0.3)
+        if effect:
+            recommendations.append({
+                'category': 'social',
+                'priority': 'medium',
+                'recommendation': f'El contacto social se refleja en un mejor estado de ánimo {days_later(effect["best_lag"])}. Programa encuentros con personas cercanas con regularidad.',
+                'action': 'schedule_social_activities',
+                'lag_days': effect['best_lag']
+            })
+        
         return recommendations
     
     def create_visualizations(self, df, analysis_results, output_dir='mood_analysis'):
         """Create comprehensive visualizations"""
         import os
+        import matplotlib.pyplot as plt
+        import seaborn as sns
         os.makedirs(output_dir, exist_ok=True)
         
         # Set style
@@ -289,10 +401,12 @@ class MoodPatternAnalyzer:
         plt.close()
         
         # 4. Weekly pattern
-        df['day_of_week'] = df['date'].dt.day_name()
-        weekly_mood = df.groupby('day_of_week')['mood_score'].mean()
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        weekly_mood = weekly_mood.reindex(day_order)
+        dates = df['date']
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        weekly_cube = ActivityCube()
+        weekly_cube.add(dates.values, sentiment=df['mood_score'].values)
+        weekly_mood = pd.Series(weekly_cube.weekday_sentiment_mean(), index=DAY_NAMES)
         
         plt.figure(figsize=(10, 6))
         plt.bar(range(len(weekly_mood)), weekly_mood.values, color='#2196f3', alpha=0.8)
@@ -307,17 +421,24 @@ class MoodPatternAnalyzer:
         
         print(f"Visualizaciones guardadas en: {output_dir}")
     
-    def generate_comprehensive_report(self, user_id, days_back=30):
+    def generate_comprehensive_report(self, user_id, days_back=30, output_file=None, charts=True):
         """Generate comprehensive mood pattern analysis report"""
         print(f"Generando análisis de patrones de estado de ánimo para usuario {user_id}...")
         
         # Load data
-        df = self.load_user_data(user_id, days_back)
+        with metrics.stage('mood.load'):
+            df = self.load_user_data(user_id, days_back)
+        metrics.count('mood.data_points_processed', len(df))
         
         # Perform analyses
-        trend_analysis = self.analyze_mood_trends(df)
-        correlation_analysis = self.analyze_correlations(df)
-        pattern_analysis = self.identify_mood_patterns(df)
+        with metrics.stage('mood.trends'):
+            trend_analysis = self.analyze_mood_trends(df)
+        with metrics.stage('mood.correlation'):
+            correlation_analysis = self.analyze_correlations(df)
+        with metrics.stage('mood.clustering'):
+            pattern_analysis = self.identify_mood_patterns(df)
+        with metrics.stage('mood.lagged'):
+            lagged_effects = self.analyze_lagged_effects(df)
         
         # Combine results
         analysis_results = {
@@ -327,7 +448,8 @@ class MoodPatternAnalyzer:
             'data_points': len(df),
             'trends': trend_analysis,
             'correlations': correlation_analysis,
-            'patterns': pattern_analysis
+            'patterns': pattern_analysis,
+            'lagged_effects': lagged_effects
         }
         
         # Generate recommendations
@@ -335,12 +457,14 @@ class MoodPatternAnalyzer:
         analysis_results['recommendations'] = recommendations
         
         # Create visualizations
-        self.create_visualizations(df, analysis_results)
+        if charts:
+            with metrics.stage('mood.charts'):
+                self.create_visualizations(df, analysis_results)
         
         # Save report
-        output_file = f'mood_analysis_user_{user_id}.json'
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(analysis_results, f, ensure_ascii=False, indent=2, default=str)
+        output_file = output_file or f'mood_analysis_user_{user_id}.json'
+        with metrics.stage('mood.write_json'):
+            write_json_atomic(output_file, analysis_results)
         
         # Print summary
         self._print_summary(analysis_results)
@@ -366,6 +490,12 @@ class MoodPatternAnalyzer:
         print(f"\nFactor más positivo: {correlations.idxmax()} ({correlations.max():.3f})")
         print(f"Factor más negativo: {correlations.idxmin()} ({correlations.min():.3f})")
         
+        lagged = {factor: effect for factor, effect in results.get('lagged_effects', {}).items()
+                  if effect['significant']}
+        if lagged:
+            print("Efectos retardados significativos: " + ", ".join(
+                f"{factor} (+{effect['best_lag']}d, r={effect['best_r']:.2f})" for factor, effect in lagged.items()))
+        
         print(f"\nRecomendaciones generadas: {len(results['recommendations'])}")
         for rec in results['recommendations']:
             print(f"- [{rec['priority'].upper()}] {rec['recommendation']}")
@@ -375,38 +505,52 @@ class MoodPatternAnalyzer:
         
         # Initialize tracking structures
         daily_moods = defaultdict(lambda: defaultdict(int))
-        hourly_moods = defaultdict(lambda: defaultdict(int))
+        activity_cube = ActivityCube(self.mood_lexicon.moods)
         mood_transitions = defaultdict(lambda: defaultdict(int))
         mood_timeline = []
         
         previous_dominant_mood = None
         
-        for message in chat_data:
-            if message.get('sender') != 'user':
-                continue
+        failed = 0
+        with metrics.stage('mood.chat_patterns'):
+            # Parse user messages first so the lexicon can score them as one batch
+            timestamps = []
+            contents = []
+            for message in chat_data:
+                if message.get('sender') != 'user':
+                    continue
                 
-            try:
-                timestamp = datetime.fromisoformat(message.get('timestamp', '').replace('Z', '+00:00'))
-                content = message.get('message', '').lower()
+                try:
+                    timestamp = datetime.fromisoformat(message.get('timestamp', '').replace('Z', '+00:00'))
+                    content = message.get('message', '').lower()
+                except Exception as e:
+                    failed += 1
+                    metrics.record_error('mood.chat_patterns', e)
+                    continue
                 
-                # Count mood indicators in message
-                mood_scores = {}
-                for mood, keywords in self.mood_indicators.items():
-                    score = sum(1 for keyword in keywords if keyword in content)
-                    mood_scores[mood] = score
-                
-                # Determine dominant mood
-                dominant_mood = max(mood_scores.items(), key=lambda x: x[1])
-                if dominant_mood[1] > 0:  # Only if there are mood indicators
-                    mood_name = dominant_mood[0]
+                timestamps.append(timestamp)
+                contents.append(content)
+            
+            # Count mood indicators in all messages at once
+            mood_counts = self.mood_lexicon.match_batch(contents)
+            moods = self.mood_lexicon.moods
+            dominant_ids = mood_counts.argmax(axis=1) if len(contents) else np.empty(0, dtype=np.int64)
+            
+            # Hourly patterns come from the hour x weekday rollup (-1: no mood indicators)
+            has_mood = mood_counts.max(axis=1) > 0 if len(contents) else np.empty(0, dtype=bool)
+            local = local_times(timestamps, user_timezone(messages=chat_data))
+            activity_cube.add(local, mood_ids=np.where(has_mood, dominant_ids, -1))
+            # Daily patterns use the same local calendar days as the hourly rollup
+            local_days = local.astype('datetime64[D]').astype(str).tolist()
+            
+            for i, timestamp in enumerate(timestamps):
+                # Determine dominant mood (first mood wins ties, as with max())
+                intensity = int(mood_counts[i, dominant_ids[i]])
+                if intensity > 0:  # Only if there are mood indicators
+                    mood_name = moods[dominant_ids[i]]
                     
                     # Track daily patterns
-                    day_key = timestamp.strftime('%Y-%m-%d')
-                    daily_moods[day_key][mood_name] += 1
-                    
-                    # Track hourly patterns
-                    hour_key = timestamp.hour
-                    hourly_moods[hour_key][mood_name] += 1
+                    daily_moods[local_days[i]][mood_name] += 1
                     
                     # Track mood transitions
                     if previous_dominant_mood and previous_dominant_mood != mood_name:
@@ -416,21 +560,22 @@ class MoodPatternAnalyzer:
                     mood_timeline.append({
                         'timestamp': timestamp.isoformat(),
                         'mood': mood_name,
-                        'intensity': dominant_mood[1],
-                        'all_scores': mood_scores
+                        'intensity': intensity,
+                        'all_scores': {mood: int(score) for mood, score in zip(moods, mood_counts[i])}
                     })
                     
                     previous_dominant_mood = mood_name
-                    
-            except Exception as e:
-                print(f"Error processing message: {e}")
-                continue
+        
+        metrics.count('mood.messages_processed', len(contents))
+        if failed:
+            print(f"⚠️ {failed} mensajes no pudieron procesarse")
         
         # Calculate patterns and insights
+        hourly_moods = activity_cube.hourly_moods()
         analysis_results = {
             'mood_distribution': self.calculate_mood_distribution(mood_timeline),
             'daily_patterns': dict(daily_moods),
-            'hourly_patterns': dict(hourly_moods),
+            'hourly_patterns': hourly_moods,
             'mood_transitions': dict(mood_transitions),
             'mood_timeline': mood_timeline,
             'insights': self.generate_mood_insights(daily_moods, hourly_moods, mood_timeline),
@@ -529,6 +674,8 @@ class MoodPatternAnalyzer:
     def create_mood_visualization(self, analysis_results: Dict[str, Any]) -> None:
         """Create visualizations for mood patterns."""
         try:
+            import matplotlib.pyplot as plt
+            
             # Mood distribution pie chart
             if analysis_results.get('mood_distribution'):
                 moods = list(analysis_results['mood_distribution'].keys())
@@ -570,4 +717,13 @@ if __name__ == "__main__":
     # Run analysis for demo user
     report = analyzer.generate_comprehensive_report(user_id=1, days_back=30)
     
+    # Mood patterns from chat history when a message log is configured
+    from message_log import messages_from_env
+    chat_messages = messages_from_env()
+    if chat_messages:
+        chat_moods = analyzer.analyze_mood_patterns_from_chat(chat_messages)
+        write_json_atomic('mood_analysis_results.json', chat_moods)
+        print(f"💬 Patrones de ánimo del chat: {len(chat_moods['mood_timeline'])} mensajes con indicadores")
+    
     print("\nAnálisis completado. Revisa los archivos generados para más detalles.")
+    export_metrics_from_env()
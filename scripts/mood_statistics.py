@@ -0,0 +1,150 @@
+import warnings
+from statistics import NormalDist
+from typing import Dict, Any, Optional
+import numpy as np
+
+
+def _batched_correlation(x: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    """Pearson r between x[b] and every factors[b, :, k], for all b at once; NaN where undefined."""
+    x = x - x.mean(axis=-1, keepdims=True)
+    factors = factors - factors.mean(axis=-2, keepdims=True)
+    covariance = np.einsum('...n,...nk->...k', x, factors)
+    scale = np.sqrt(np.einsum('...n,...n->...', x, x)[..., None] * np.einsum('...nk,...nk->...k', factors, factors))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(scale > 0, covariance / scale, np.nan)
+
+
+def bootstrap_correlations(target, factors: Dict[str, Any], resamples: int = 1000, confidence: float = 0.95,
+                           seed: Optional[int] = 42) -> Dict[str, Dict[str, Any]]:
+    """Percentile bootstrap confidence intervals for the correlation of ``target`` with each factor.
+
+    All resamples are drawn as one (resamples x n) index matrix, and every
+    resampled correlation is computed in one batched einsum, so 1,000
+    resamples of a 30-day history cost a few milliseconds. Rows with a
+    missing value in any column are dropped. A factor is ``significant``
+    when its interval excludes zero.
+    """
+    names = list(factors)
+    y = np.asarray(target, dtype=np.float64)
+    X = np.column_stack([np.asarray(factors[name], dtype=np.float64) for name in names]) if names \
+        else np.empty((len(y), 0))
+    complete = np.isfinite(y) & np.isfinite(X).all(axis=1)
+    y, X = y[complete], X[complete]
+    n = len(y)
+    if n < 3 or not names:
+        return {name: {'r': None, 'low': None, 'high': None, 'significant': False, 'n': n} for name in names}
+
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, n, size=(resamples, n))
+    samples = _batched_correlation(y[index], X[index])
+    point = _batched_correlation(y, X)
+
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # Constant factors give all-NaN columns; their interval is simply undefined
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanquantile(samples, [alpha, 1 - alpha], axis=0)
+
+    result = {}
+    for k, name in enumerate(names):
+        defined = np.isfinite(low[k]) and np.isfinite(high[k])
+        result[name] = {
+            'r': float(point[k]) if np.isfinite(point[k]) else None,
+            'low': float(low[k]) if defined else None,
+            'high': float(high[k]) if defined else None,
+            'significant': bool(defined and (low[k] > 0 or high[k] < 0)),
+            'n': n
+        }
+    return result
+
+
+def _lagged_sums(a: np.ndarray, b: np.ndarray, size: int, max_lag: int) -> np.ndarray:
+    """sum_t a[..., t + lag] * b[..., t] for lag 0..max_lag, from one FFT product."""
+    product = np.fft.rfft(a, size) * np.conj(np.fft.rfft(b, size))
+    return np.fft.irfft(product, size)[..., :max_lag + 1]
+
+
+def lagged_correlation_matrix(target, factors, max_lag: int = 7, min_pairs: int = 7) -> Dict[str, np.ndarray]:
+    """Pearson r between target[t] and factor[t - lag] for every lag, factor and user at once.
+
+    ``target`` is (users, days) and ``factors`` (users, factors, days) on a
+    shared daily grid; NaN marks a missing day. The count, sums and sums of
+    squares and products over the overlapping days of every lag are all
+    cross-correlations of masked series, so the exact per-lag correlation
+    comes from a handful of zero-padded FFTs: O(n log n) per series instead
+    of O(n * lags). Returns ``r`` and ``pairs`` shaped (users, factors, lags);
+    r is NaN with fewer than ``min_pairs`` overlapping days or no variance.
+    """
+    y = np.atleast_2d(np.asarray(target, dtype=np.float64))
+    X = np.asarray(factors, dtype=np.float64)
+    if X.ndim == 2:
+        X = X[None]
+    days = y.shape[-1]
+    size = 1 << int(np.ceil(np.log2(max(2 * days, 2))))
+    max_lag = min(max_lag, days - 1)
+
+    # Centering first keeps the sum-of-squares differences below well conditioned
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        y = y - np.nanmean(y, axis=-1, keepdims=True)
+        X = X - np.nanmean(X, axis=-1, keepdims=True)
+    y_mask, X_mask = np.isfinite(y), np.isfinite(X)
+    y, X = np.where(y_mask, y, 0.0)[:, None, :], np.where(X_mask, X, 0.0)
+    y_mask = y_mask[:, None, :].astype(np.float64)
+    X_mask = X_mask.astype(np.float64)
+
+    pairs = np.rint(_lagged_sums(y_mask, X_mask, size, max_lag))
+    sum_y = _lagged_sums(y, X_mask, size, max_lag)
+    sum_x = _lagged_sums(y_mask, X, size, max_lag)
+    sum_yy = _lagged_sums(y * y, X_mask, size, max_lag)
+    sum_xx = _lagged_sums(y_mask, X * X, size, max_lag)
+    sum_xy = _lagged_sums(y, X, size, max_lag)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = sum_xy - sum_x * sum_y / pairs
+        var_y = sum_yy - sum_y ** 2 / pairs
+        var_x = sum_xx - sum_x ** 2 / pairs
+        # FFT round-off leaves ~1e-12 residues where a series is constant over the overlap
+        defined = (pairs >= min_pairs) & (var_y > 1e-9 * np.maximum(sum_yy, 1e-300)) \
+            & (var_x > 1e-9 * np.maximum(sum_xx, 1e-300))
+        r = np.where(defined, covariance / np.sqrt(var_y * var_x), np.nan)
+    return {'r': np.clip(r, -1.0, 1.0), 'pairs': pairs.astype(np.int64)}
+
+
+def lagged_correlations(target, factors: Dict[str, Any], max_lag: int = 7,
+                        min_pairs: int = 7) -> Dict[str, Dict[str, Any]]:
+    """Lagged correlations of one daily ``target`` series with each factor series.
+
+    Lag k pairs the target on day t with the factor on day t - k, so a
+    positive r at lag 1 means high factor values are followed by a high
+    target the next day. ``best_lag`` is the lag >= 1 with the largest |r|;
+    ``significant`` applies a two-sided 95% Fisher z test at that lag,
+    Bonferroni-corrected for the number of lags searched.
+    """
+    names = list(factors)
+    if not names:
+        return {}
+    matrix = lagged_correlation_matrix(target, np.stack([np.asarray(factors[name], dtype=np.float64)
+                                                         for name in names]),
+                                       max_lag=max_lag, min_pairs=min_pairs)
+    return {name: describe_lags(matrix['r'][0, k], matrix['pairs'][0, k]) for k, name in enumerate(names)}
+
+
+def describe_lags(r: np.ndarray, pairs: np.ndarray) -> Dict[str, Any]:
+    """Per-lag correlations of one factor plus its strongest lag >= 1 and whether it is significant."""
+    correlations = [float(value) if np.isfinite(value) else None for value in r]
+    best_lag, best_r, significant = None, None, False
+    lagged = np.abs(np.where(np.isfinite(r[1:]), r[1:], 0.0))
+    if len(lagged) and lagged.max() > 0:
+        best_lag = int(np.argmax(lagged)) + 1
+        best_r = correlations[best_lag]
+        n = int(pairs[best_lag])
+        critical = NormalDist().inv_cdf(1 - 0.025 / len(lagged))
+        significant = bool(n > 3 and np.arctanh(min(abs(best_r), 1 - 1e-12)) * np.sqrt(n - 3) > critical)
+    return {
+        'correlations': correlations,
+        'pairs': [int(count) for count in pairs],
+        'best_lag': best_lag,
+        'best_r': best_r,
+        'significant': significant
+    }
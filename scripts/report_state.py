@@ -0,0 +1,287 @@
+import os
+import json
+import math
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Any
+import numpy as np
+
+from checkpoint import write_json_atomic
+from instrumentation import metrics
+from time_index import to_epoch_ns
+from activity_cube import ActivityCube, hour_and_weekday, DAYS, HOURS
+from local_time import local_times
+from timeline_pyramid import TimelinePyramid, BUCKET_NS, lttb
+
+TIMELINE_FIELDS = ['sentiment_score', 'crisis_score']
+
+# Persisted timeline budget: sampled entries, and buckets per hour/day/week level
+SAMPLE_POINTS = 500
+
+# Newest entries always kept verbatim in the sample (the recent-mood insight reads the last 5)
+RECENT_ENTRIES = 5
+
+# Fields written by save and read back by load; anything else in a state file is ignored
+STATE_FIELDS = ['points', 'watermark_ns', 'watermark_keys', 'timeline_sample', 'timeline_levels',
+                'message_count', 'length_sum', 'first_ns', 'last_ns', 'activity',
+                'sentiment_sum', 'sentiment_sumsq', 'sentiment_min', 'sentiment_max', 'crisis_sum']
+
+
+def _parse(timestamp) -> datetime:
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return timestamp
+
+
+def message_key(message: Dict[str, Any]) -> str:
+    """Stable identity of a message: its id, or a hash of its contents."""
+    if message.get('id'):
+        return str(message['id'])
+    raw = f"{message.get('timestamp', '')}|{message.get('sender', '')}|{message.get('content', '')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class ReportState:
+    """Per-user aggregate state and high-water mark for incremental reports.
+
+    The watermark is the newest processed user-message timestamp, plus the
+    keys of the messages that share it. Anything older than the watermark, or
+    at the watermark with a known key, has already been folded in and is
+    skipped, so replays and duplicate deliveries are idempotent. Everything
+    else needed for the report is kept as running sums.
+
+    The timeline itself is not kept: only its hour/day/week levels (count,
+    sum, min, max per bucket, the last ``points`` buckets of each) and an
+    LTTB sample of at most ``points`` entries, so the state file stays
+    bounded however long the user's history grows.
+    """
+
+    def __init__(self, user_id, points: int = SAMPLE_POINTS):
+        self.user_id = user_id
+        self.points = points
+        self.watermark_ns = None
+        self.watermark_keys = []
+        self.timeline_sample = []
+        self.timeline_levels = {}
+        self.message_count = 0
+        self.length_sum = 0
+        self.first_ns = None
+        self.last_ns = None
+        self.activity = np.zeros((DAYS, HOURS), dtype=np.int64)
+        self.sentiment_sum = 0.0
+        self.sentiment_sumsq = 0.0
+        self.sentiment_min = math.inf
+        self.sentiment_max = -math.inf
+        self.crisis_sum = 0.0
+
+    @staticmethod
+    def path_for(state_dir: str, user_id) -> str:
+        return os.path.join(state_dir, f'report_state_user_{user_id}.json')
+
+    @classmethod
+    def load(cls, state_dir: str, user_id) -> 'ReportState':
+        state = cls(user_id)
+        path = cls.path_for(state_dir, user_id)
+        if not os.path.exists(path):
+            return state
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Missing or null fields keep their defaults (a null sentiment_min/max means no messages yet)
+        for field in STATE_FIELDS:
+            if data.get(field) is not None:
+                setattr(state, field, data[field])
+        state.activity = np.array(state.activity, dtype=np.int64)
+        if data.get('mood_timeline'):
+            # State written before the timeline was bounded
+            state._fold_timeline(data['mood_timeline'])
+        return state
+
+    def save(self, state_dir: str):
+        os.makedirs(state_dir, exist_ok=True)
+        data = {'user_id': self.user_id, **{field: getattr(self, field) for field in STATE_FIELDS}}
+        data['activity'] = self.activity.tolist()
+        data['sentiment_min'] = self.sentiment_min if self.message_count else None
+        data['sentiment_max'] = self.sentiment_max if self.message_count else None
+        write_json_atomic(self.path_for(state_dir, self.user_id), data, indent=None)
+
+    def select_new(self, user_messages: List[Dict[str, Any]]) -> List[tuple]:
+        """(timestamp_ns, key, message) for user messages past the watermark, in arrival order.
+
+        Messages older than the watermark cannot be folded in any more and are
+        counted as ``report.late_messages_dropped`` (when the whole history is
+        passed again this includes the messages earlier runs already merged).
+        """
+        boundary = set(self.watermark_keys)
+        seen = set()
+        fresh = []
+        late = 0
+        for msg in user_messages:
+            ts = to_epoch_ns(msg['timestamp'])
+            key = message_key(msg)
+            if self.watermark_ns is not None:
+                if ts < self.watermark_ns:
+                    late += 1
+                    continue
+                if ts == self.watermark_ns and key in boundary:
+                    continue
+            if key in seen:
+                continue
+            seen.add(key)
+            fresh.append((ts, key, msg))
+        metrics.count('report.late_messages_dropped', late)
+        return fresh
+
+    def _fold_timeline(self, entries: List[Dict[str, Any]]):
+        """Merge scored entries into the bounded levels and sample."""
+        if not entries:
+            return
+        pyramid = TimelinePyramid.from_records(entries, TIMELINE_FIELDS)
+        for name in BUCKET_NS:
+            self.timeline_levels[name] = self._merge_level(self.timeline_levels.get(name), pyramid.levels[name])
+
+        sample = self.timeline_sample + list(entries)
+        order = np.argsort([to_epoch_ns(entry['timestamp']) for entry in sample], kind='stable')
+        sample = [sample[i] for i in order.tolist()]
+        if len(sample) > self.points:
+            head, recent = sample[:-RECENT_ENTRIES], sample[-RECENT_ENTRIES:]
+            times = np.array([to_epoch_ns(entry['timestamp']) for entry in head], dtype=np.int64)
+            keep = lttb(times - times[0], [entry['sentiment_score'] for entry in head],
+                        max(self.points - RECENT_ENTRIES, 2))
+            sample = [head[i] for i in keep.tolist()] + recent
+        self.timeline_sample = sample
+
+    def _merge_level(self, stored, level) -> Dict[str, Any]:
+        """Add one pyramid level's buckets to a stored level, keeping its last ``points`` buckets."""
+        starts = [level['start'].tolist()]
+        counts = [level['count'].tolist()]
+        stats = {field: {'sum': [(level[field]['mean'] * level['count']).tolist()],
+                         'min': [level[field]['min'].tolist()],
+                         'max': [level[field]['max'].tolist()]}
+                 for field in TIMELINE_FIELDS}
+        if stored:
+            starts.insert(0, stored['start'])
+            counts.insert(0, stored['count'])
+            for field in TIMELINE_FIELDS:
+                for stat in ('sum', 'min', 'max'):
+                    stats[field][stat].insert(0, stored[field][stat])
+
+        unique, inverse = np.unique(np.concatenate(starts).astype(np.int64), return_inverse=True)
+        merged = {'start': unique,
+                  'count': np.bincount(inverse, weights=np.concatenate(counts), minlength=len(unique))}
+        for field in TIMELINE_FIELDS:
+            low = np.full(len(unique), math.inf)
+            high = np.full(len(unique), -math.inf)
+            np.minimum.at(low, inverse, np.concatenate(stats[field]['min']))
+            np.maximum.at(high, inverse, np.concatenate(stats[field]['max']))
+            merged[field] = {'sum': np.bincount(inverse, weights=np.concatenate(stats[field]['sum']),
+                                                minlength=len(unique)),
+                             'min': low, 'max': high}
+
+        keep = slice(max(len(unique) - self.points, 0), None)
+        return {
+            'start': merged['start'][keep].tolist(),
+            'count': merged['count'][keep].astype(np.int64).tolist(),
+            **{field: {stat: arr[keep].tolist() for stat, arr in merged[field].items()} for field in TIMELINE_FIELDS}
+        }
+
+    def timeline_levels_dict(self, max_points: int = SAMPLE_POINTS) -> Dict[str, Any]:
+        """The stored levels in TimelinePyramid.to_dict format."""
+        result = {}
+        for name in BUCKET_NS:
+            level = self.timeline_levels.get(name) or {'start': [], 'count': [],
+                                                        **{f: {'sum': [], 'min': [], 'max': []}
+                                                           for f in TIMELINE_FIELDS}}
+            keep = slice(max(len(level['start']) - max_points, 0), None)
+            counts = np.array(level['count'][keep], dtype=np.int64)
+            result[name] = {
+                'start': np.datetime_as_string(np.array(level['start'][keep], dtype='datetime64[ns]'),
+                                               unit='s').tolist(),
+                'count': counts.tolist(),
+                **{field: {'min': np.round(level[field]['min'][keep], 4).tolist(),
+                           'mean': np.round(np.array(level[field]['sum'][keep]) / np.maximum(counts, 1), 4).tolist(),
+                           'max': np.round(level[field]['max'][keep], 4).tolist()}
+                   for field in TIMELINE_FIELDS}
+            }
+        return result
+
+    def merge(self, fresh, timeline_entries: List[Dict[str, Any]], zone: str = None):
+        """Fold newly scored messages into the aggregates and advance the watermark.
+
+        Activity hours and weekdays are local to ``zone`` when given.
+        """
+        if not fresh:
+            return
+        timestamps = np.array([ts for ts, _, _ in fresh], dtype=np.int64)
+
+        self._fold_timeline(timeline_entries)
+        self.message_count += len(fresh)
+        self.length_sum += sum(len(msg.get('content', '')) for _, _, msg in fresh)
+        self.first_ns = int(min(timestamps.min(), self.first_ns if self.first_ns is not None else timestamps.min()))
+        self.last_ns = int(max(timestamps.max(), self.last_ns if self.last_ns is not None else timestamps.max()))
+
+        local = local_times([_parse(msg['timestamp']) for _, _, msg in fresh], zone)
+        hours, weekdays = hour_and_weekday(local)
+        np.add.at(self.activity, (weekdays, hours), 1)
+
+        sentiments = np.array([entry['sentiment_score'] for entry in timeline_entries], dtype=np.float64)
+        self.sentiment_sum += float(sentiments.sum())
+        self.sentiment_sumsq += float((sentiments ** 2).sum())
+        self.sentiment_min = min(self.sentiment_min, float(sentiments.min()))
+        self.sentiment_max = max(self.sentiment_max, float(sentiments.max()))
+        self.crisis_sum += float(sum(entry['crisis_score'] for entry in timeline_entries))
+
+        newest = int(timestamps.max())
+        newest_keys = [key for ts, key, _ in fresh if ts == newest]
+        if newest == self.watermark_ns:
+            self.watermark_keys = list(dict.fromkeys(self.watermark_keys + newest_keys))
+        elif self.watermark_ns is None or newest > self.watermark_ns:
+            self.watermark_ns = newest
+            self.watermark_keys = newest_keys
+
+    def activity_cube(self) -> ActivityCube:
+        cube = ActivityCube()
+        cube.messages = self.activity.copy()
+        return cube
+
+    def conversation_patterns(self) -> Dict[str, Any]:
+        """Same fields as MentalHealthAnalyzer.analyze_conversation_patterns."""
+        if not self.message_count:
+            return {}
+        cube = self.activity_cube()
+        if self.message_count < 2:
+            frequency = {'avg_days_between': 0, 'frequency_pattern': 'insufficient_data'}
+        else:
+            # Mean gap between sorted timestamps is the span over (n - 1)
+            avg_days = (self.last_ns - self.first_ns) / 1e9 / (self.message_count - 1) / (24 * 3600)
+            if avg_days < 1:
+                pattern = 'daily'
+            elif avg_days < 7:
+                pattern = 'weekly'
+            elif avg_days < 30:
+                pattern = 'monthly'
+            else:
+                pattern = 'sporadic'
+            frequency = {'avg_days_between': avg_days, 'frequency_pattern': pattern}
+        return {
+            'total_messages': self.message_count,
+            'avg_message_length': self.length_sum / self.message_count,
+            'most_active_hours': cube.top_hours(3),
+            'most_active_days': cube.top_days(3),
+            'conversation_frequency': frequency
+        }
+
+    def summary_stats(self, conversation_patterns: Dict[str, Any]) -> Dict[str, Any]:
+        """Same fields as MentalHealthAnalyzer._calculate_summary_stats, from running sums."""
+        if not self.message_count:
+            return {}
+        mean = self.sentiment_sum / self.message_count
+        variance = max(self.sentiment_sumsq / self.message_count - mean ** 2, 0.0)
+        return {
+            'avg_sentiment': mean,
+            'sentiment_std': math.sqrt(variance),
+            'min_sentiment': self.sentiment_min,
+            'max_sentiment': self.sentiment_max,
+            'avg_crisis_score': self.crisis_sum / self.message_count,
+            'total_conversations': conversation_patterns.get('total_messages', 0),
+            'avg_message_length': conversation_patterns.get('avg_message_length', 0)
+        }
@@ -0,0 +1,124 @@
+import os
+import json
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+from time_index import to_epoch_ns
+from checkpoint import write_json_atomic
+
+
+class StreamingRiskTrend:
+    """Streaming risk trend for one user: EWMA levels plus a two-sided CUSUM.
+
+    Each scored message updates a fast EWMA (the current level), a slow EWMA
+    (the baseline) and two cumulative sums of deviations from the baseline
+    beyond ``slack``. When the upward sum crosses ``threshold`` an ESCALATING
+    change point is emitted with the message's timestamp; the downward sum
+    emits IMPROVING. Then both sums reset and the baseline jumps to the
+    current level. State is a handful of floats and each update is O(1).
+    """
+
+    def __init__(self, fast_alpha: float = 0.3, slow_alpha: float = 0.05, slack: float = 2.0,
+                 threshold: float = 10.0, warmup: int = 3, hold: int = 10):
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.slack = slack
+        self.threshold = threshold
+        self.warmup = warmup
+        self.hold = hold
+
+        self.count = 0
+        self.level = 0.0
+        self.baseline = 0.0
+        self.cusum_up = 0.0
+        self.cusum_down = 0.0
+        self.last_timestamp = None
+        self.last_change = None
+        self.since_change = 0
+
+    def update(self, score: float, timestamp=None) -> Optional[Dict[str, Any]]:
+        """Add one risk score; returns a change point dict when one is detected."""
+        score = float(score)
+        self.count += 1
+        self.since_change += 1
+        if timestamp is not None:
+            self.last_timestamp = to_epoch_ns(timestamp)
+
+        if self.count <= self.warmup:
+            # Running mean until the baseline is meaningful
+            self.level = self.baseline = self.baseline + (score - self.baseline) / self.count
+            return None
+
+        self.cusum_up = max(0.0, self.cusum_up + score - self.baseline - self.slack)
+        self.cusum_down = max(0.0, self.cusum_down + self.baseline - score - self.slack)
+        self.level += self.fast_alpha * (score - self.level)
+        self.baseline += self.slow_alpha * (score - self.baseline)
+
+        direction = None
+        if self.cusum_up > self.threshold:
+            direction = 'ESCALATING'
+        elif self.cusum_down > self.threshold:
+            direction = 'IMPROVING'
+        if direction is None:
+            return None
+
+        change = {
+            'direction': direction,
+            'timestamp': (str(np.datetime_as_string(np.datetime64(self.last_timestamp, 'ns'), unit='s')) + 'Z'
+                          if self.last_timestamp is not None else None),
+            'baseline': round(self.baseline, 3),
+            'level': round(self.level, 3),
+            'cusum': round(max(self.cusum_up, self.cusum_down), 3),
+            'messages_seen': self.count
+        }
+        self.cusum_up = self.cusum_down = 0.0
+        self.baseline = self.level
+        self.last_change = change
+        self.since_change = 0
+        return change
+
+    def update_many(self, analyses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Feed time-sorted analyses newer than the last one seen; returns new change points."""
+        changes = []
+        for analysis in analyses:
+            timestamp = to_epoch_ns(analysis['timestamp'])
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                continue
+            change = self.update(analysis['risk_score'], timestamp)
+            if change is not None:
+                changes.append(change)
+        return changes
+
+    def trend(self) -> str:
+        """Direction of a change point within the last ``hold`` messages, else STABLE."""
+        if self.count < self.warmup:
+            return 'INSUFFICIENT_DATA'
+        if self.last_change is not None and self.since_change < self.hold:
+            return self.last_change['direction']
+        return 'STABLE'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'StreamingRiskTrend':
+        tracker = cls()
+        tracker.__dict__.update(state)
+        return tracker
+
+    @staticmethod
+    def path_for(state_dir: str, user_id) -> str:
+        return os.path.join(state_dir, f'risk_trend_user_{user_id}.json')
+
+    @classmethod
+    def load(cls, state_dir: str, user_id) -> 'StreamingRiskTrend':
+        """The tracker saved for ``user_id`` in ``state_dir``, or a fresh one."""
+        path = cls.path_for(state_dir, user_id)
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, state_dir: str, user_id):
+        os.makedirs(state_dir, exist_ok=True)
+        write_json_atomic(self.path_for(state_dir, user_id), self.to_dict(), indent=None)
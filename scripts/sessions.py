@@ -0,0 +1,126 @@
+from typing import Dict, List, Any
+import numpy as np
+
+from time_index import to_epoch_ns
+
+DEFAULT_GAP_MINUTES = 30
+WEEK_SECONDS = 7 * 86400
+
+
+def _group_means(groups: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """Mean of ``values`` per group id, NaN for groups without values."""
+    counts = np.bincount(groups, minlength=size)
+    sums = np.bincount(groups, weights=values, minlength=size)
+    return np.divide(sums, counts, out=np.full(size, np.nan), where=counts > 0)
+
+
+def _latency_minutes(func, seconds: np.ndarray):
+    """Rounded statistic in minutes over sessions with a latency, or None if there are none."""
+    seconds = seconds[~np.isnan(seconds)]
+    return round(float(func(seconds)) / 60, 2) if len(seconds) else None
+
+
+class SessionSegmenter:
+    """Splits chat history into sessions separated by an inactivity gap.
+
+    Works on whole arrays: messages sorted by (user, timestamp) start a new
+    session wherever the user changes or the gap to the previous message
+    exceeds ``gap_minutes``, and session ids are the cumulative sum of those
+    breaks. Per-session metrics are bincounts over the session ids, so one
+    pass covers any number of users and messages.
+    """
+
+    def __init__(self, gap_minutes: float = DEFAULT_GAP_MINUTES):
+        self.gap_minutes = gap_minutes
+        self.gap_ns = int(gap_minutes * 60 * 10**9)
+
+    def segment(self, timestamps, from_user, user_ids=None) -> Dict[str, np.ndarray]:
+        """Session table for messages; ``from_user`` is True for user messages and False for Ana.
+
+        Returns one entry per session: user_id, start/end (epoch ns), duration
+        and latencies in seconds, message and turn counts. A turn is a run of
+        consecutive messages by the same sender. ``user_latency_s`` is how long
+        the user took to answer Ana; ``ana_latency_s`` the reverse (NaN when a
+        session has no such exchange).
+        """
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]').astype(np.int64)
+        from_user = np.asarray(from_user, dtype=bool)
+        user_ids = (np.zeros(len(timestamps), dtype=np.int64) if user_ids is None
+                    else np.asarray(user_ids, dtype=np.int64))
+        n = len(timestamps)
+        if not n:
+            empty_i, empty_f = np.empty(0, dtype=np.int64), np.empty(0)
+            return {'user_id': empty_i, 'start': empty_i, 'end': empty_i, 'duration_s': empty_f,
+                    'messages': empty_i, 'user_messages': empty_i, 'turns': empty_i,
+                    'user_latency_s': empty_f, 'ana_latency_s': empty_f}
+
+        order = np.lexsort((timestamps, user_ids))
+        timestamps, from_user, user_ids = timestamps[order], from_user[order], user_ids[order]
+
+        gaps = np.diff(timestamps)
+        same_user = user_ids[1:] == user_ids[:-1]
+        breaks = np.r_[True, ~same_user | (gaps > self.gap_ns)]
+        session_ids = np.cumsum(breaks) - 1
+        starts = np.flatnonzero(breaks)
+        ends = np.r_[starts[1:], n] - 1
+        size = len(starts)
+
+        # Sender changes inside a session: each one starts a new turn and measures a reply latency
+        switch = ~breaks[1:] & (from_user[1:] != from_user[:-1])
+        turn_starts = np.r_[True, breaks[1:] | switch]
+        turns = np.bincount(session_ids, weights=turn_starts, minlength=size).astype(np.int64)
+
+        reply_sessions = session_ids[1:][switch]
+        reply_gaps = gaps[switch] / 1e9
+        user_replies = from_user[1:][switch]
+
+        return {
+            'user_id': user_ids[starts],
+            'start': timestamps[starts],
+            'end': timestamps[ends],
+            'duration_s': (timestamps[ends] - timestamps[starts]) / 1e9,
+            'messages': np.diff(np.r_[starts, n]),
+            'user_messages': np.bincount(session_ids, weights=from_user, minlength=size).astype(np.int64),
+            'turns': turns,
+            'user_latency_s': _group_means(reply_sessions[user_replies], reply_gaps[user_replies], size),
+            'ana_latency_s': _group_means(reply_sessions[~user_replies], reply_gaps[~user_replies], size)
+        }
+
+    def segment_messages(self, messages: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Session table for message dicts (timestamp, sender, optional user_id)."""
+        timestamps = np.fromiter((to_epoch_ns(m['timestamp']) for m in messages), dtype=np.int64,
+                                 count=len(messages))
+        from_user = np.fromiter((m.get('sender') == 'user' for m in messages), dtype=bool, count=len(messages))
+        user_ids = np.fromiter((int(m.get('user_id', 0) or 0) for m in messages), dtype=np.int64,
+                               count=len(messages))
+        return self.segment(timestamps, from_user, user_ids)
+
+    @staticmethod
+    def sessions_per_week(sessions: Dict[str, np.ndarray]) -> Dict[int, float]:
+        """Sessions per week for each user, over the span from their first to last session (at least a week)."""
+        users, first = np.unique(sessions['user_id'], return_index=True)
+        if not len(users):
+            return {}
+        last = np.r_[first[1:], len(sessions['user_id'])] - 1
+        counts = last - first + 1
+        span_weeks = np.maximum((sessions['start'][last] - sessions['start'][first]) / 1e9 / WEEK_SECONDS, 1.0)
+        return dict(zip(users.tolist(), (counts / span_weeks).tolist()))
+
+    def summarize(self, sessions: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        """Aggregate session metrics, in minutes, for reports and engagement insights."""
+        if not len(sessions['start']):
+            return {'total_sessions': 0}
+        per_week = self.sessions_per_week(sessions)
+        duration_min = sessions['duration_s'] / 60
+        return {
+            'gap_minutes': self.gap_minutes,
+            'total_sessions': int(len(sessions['start'])),
+            'sessions_per_week': round(float(np.mean(list(per_week.values()))), 2),
+            'avg_session_minutes': round(float(np.mean(duration_min)), 2),
+            'median_session_minutes': round(float(np.median(duration_min)), 2),
+            'avg_messages_per_session': round(float(np.mean(sessions['messages'])), 2),
+            'avg_turns_per_session': round(float(np.mean(sessions['turns'])), 2),
+            'avg_user_latency_minutes': _latency_minutes(np.mean, sessions['user_latency_s']),
+            'median_user_latency_minutes': _latency_minutes(np.median, sessions['user_latency_s']),
+            'avg_ana_latency_minutes': _latency_minutes(np.mean, sessions['ana_latency_s'])
+        }
@@ -0,0 +1,196 @@
+import os
+from multiprocessing import shared_memory, get_context
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+
+from instrumentation import metrics
+
+# Risk levels as small integer codes in shared output arrays
+RISK_LEVELS = ['BAJO', 'MEDIO', 'ALTO', 'CRÍTICO']
+
+# Output columns each task writes, by dtype
+TASK_OUTPUTS = {
+    'crisis': {'risk_score': 'f8', 'risk_level': 'i1', 'sentiment_polarity': 'f8',
+               'requires_immediate_attention': '?'},
+    'sentiment': {'polarity': 'f8', 'keyword_score': 'f8', 'combined_score': 'f8'}
+}
+
+
+class SharedArray:
+    """A NumPy array backed by a named shared-memory block."""
+
+    def __init__(self, shape, dtype, name: Optional[str] = None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        return {'name': self.shm.name, 'shape': self.shape, 'dtype': self.dtype.str}
+
+    @classmethod
+    def attach(cls, spec: Dict[str, Any]) -> 'SharedArray':
+        return cls(spec['shape'], spec['dtype'], name=spec['name'])
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedCorpus:
+    """Message texts and timestamps laid out once in shared memory.
+
+    Texts are concatenated as UTF-8 into one byte buffer with an offsets
+    array, so a worker reads message ``i`` as a slice of ``text`` between
+    ``offsets[i]`` and ``offsets[i + 1]``. Workers attach by name and receive
+    only (start, stop) index ranges; nothing per message is pickled.
+    """
+
+    def __init__(self, arrays: Dict[str, SharedArray]):
+        self.arrays = arrays
+        self.text = arrays['text'].array
+        self.offsets = arrays['offsets'].array
+        self.timestamps = arrays['timestamps'].array
+        self.user_ids = arrays['user_ids'].array
+
+    @classmethod
+    def create(cls, texts: List[str], timestamps=None, user_ids=None) -> 'SharedCorpus':
+        encoded = [t.encode('utf-8') for t in texts]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+
+        arrays = {
+            'text': SharedArray((int(lengths.sum()),), np.uint8),
+            'offsets': SharedArray((len(texts) + 1,), np.int64),
+            'timestamps': SharedArray((len(texts),), np.int64),
+            'user_ids': SharedArray((len(texts),), np.int64)
+        }
+        arrays['offsets'].array[0] = 0
+        np.cumsum(lengths, out=arrays['offsets'].array[1:])
+        arrays['text'].array[:] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        arrays['timestamps'].array[:] = (np.asarray(timestamps).astype('datetime64[ns]').astype(np.int64)
+                                         if timestamps is not None else 0)
+        arrays['user_ids'].array[:] = np.asarray(user_ids, dtype=np.int64) if user_ids is not None else 0
+        return cls(arrays)
+
+    @classmethod
+    def from_messages(cls, messages: List[Dict[str, Any]], text_key: str = 'content') -> 'SharedCorpus':
+        """Build from message dicts such as build_chat_corpus output."""
+        return cls.create(
+            [m.get(text_key, '') for m in messages],
+            np.array([m['timestamp'].replace('Z', '') for m in messages], dtype='datetime64[ns]'),
+            [m.get('user_id', 0) for m in messages]
+        )
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        return {key: array.spec for key, array in self.arrays.items()}
+
+    @classmethod
+    def attach(cls, spec: Dict[str, Any]) -> 'SharedCorpus':
+        return cls({key: SharedArray.attach(s) for key, s in spec.items()})
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def get_text(self, i: int) -> str:
+        return self.text[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def user_ranges(self) -> Dict[int, Tuple[int, int]]:
+        """(start, stop) per user, for a corpus laid out grouped by user."""
+        if not len(self):
+            return {}
+        starts = np.flatnonzero(np.r_[True, self.user_ids[1:] != self.user_ids[:-1]])
+        stops = np.r_[starts[1:], len(self)]
+        return {int(self.user_ids[s]): (int(s), int(e)) for s, e in zip(starts, stops)}
+
+    def close(self):
+        self.text = self.offsets = self.timestamps = self.user_ids = None
+        for array in self.arrays.values():
+            array.close()
+
+
+# Per-process worker state, set once by the pool initializer
+_worker = {}
+
+
+def _init_worker(task: str, corpus_spec: Dict[str, Any], output_specs: Dict[str, Any]):
+    _worker['task'] = task
+    _worker['corpus'] = SharedCorpus.attach(corpus_spec)
+    _worker['outputs'] = {key: SharedArray.attach(spec) for key, spec in output_specs.items()}
+    if task == 'crisis':
+        from crisis_detection import CrisisDetectionSystem
+        _worker['analyzer'] = CrisisDetectionSystem()
+    else:
+        from analyze_chat_data import MentalHealthAnalyzer
+        _worker['analyzer'] = MentalHealthAnalyzer()
+
+
+def _run_range(bounds: Tuple[int, int]) -> int:
+    start, stop = bounds
+    corpus = _worker['corpus']
+    out = {key: array.array for key, array in _worker['outputs'].items()}
+    analyzer = _worker['analyzer']
+
+    if _worker['task'] == 'crisis':
+        level_codes = {level: code for code, level in enumerate(RISK_LEVELS)}
+        for i in range(start, stop):
+            result = analyzer.analyze_text_for_crisis(corpus.get_text(i))
+            out['risk_score'][i] = result['risk_score']
+            out['risk_level'][i] = level_codes[result['risk_level']]
+            out['sentiment_polarity'][i] = result['sentiment_polarity']
+            out['requires_immediate_attention'][i] = result['requires_immediate_attention']
+    else:
+        for i in range(start, stop):
+            result = analyzer.analyze_sentiment(corpus.get_text(i))
+            out['polarity'][i] = result['polarity']
+            out['keyword_score'][i] = result['keyword_score']
+            out['combined_score'][i] = result['combined_score']
+    return stop - start
+
+
+def split_ranges(n: int, chunk_size: int, boundaries=None) -> List[Tuple[int, int]]:
+    """Index ranges of about chunk_size; with boundaries (e.g. user starts), never split inside one."""
+    if boundaries is None:
+        return [(s, min(s + chunk_size, n)) for s in range(0, n, chunk_size)]
+    ranges = []
+    start = 0
+    for boundary in list(boundaries) + [n]:
+        if boundary - start >= chunk_size or (boundary == n and boundary > start):
+            ranges.append((start, boundary))
+            start = boundary
+    return ranges
+
+
+def run_parallel(corpus: SharedCorpus, task: str = 'crisis', workers: Optional[int] = None,
+                 chunk_size: int = 2000, by_user: bool = False) -> Dict[str, np.ndarray]:
+    """Score every message of a shared corpus in a process pool.
+
+    Workers write straight into preallocated shared output arrays; the
+    returned dict holds private copies, so the shared blocks can be freed.
+    """
+    if task not in TASK_OUTPUTS:
+        raise ValueError(f"Tarea desconocida: {task}")
+    workers = workers or os.cpu_count() or 1
+    n = len(corpus)
+
+    outputs = {key: SharedArray((n,), dtype) for key, dtype in TASK_OUTPUTS[task].items()}
+    try:
+        boundaries = [start for start, _ in corpus.user_ranges().values()] if by_user else None
+        ranges = split_ranges(n, chunk_size, boundaries)
+
+        with metrics.stage(f'parallel.{task}'):
+            ctx = get_context()
+            with ctx.Pool(workers, initializer=_init_worker,
+                          initargs=(task, corpus.spec, {k: a.spec for k, a in outputs.items()})) as pool:
+                processed = sum(pool.imap_unordered(_run_range, ranges))
+        metrics.count(f'parallel.{task}_messages', processed)
+
+        return {key: array.array.copy() for key, array in outputs.items()}
+    finally:
+        for array in outputs.values():
+            array.close()
@@ -0,0 +1,266 @@
+import time
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterator, Optional
+import numpy as np
+import pandas as pd
+
+# Spanish message fragments for synthetic chat traffic
+OPENERS = np.array([
+    'Hola Ana, ', 'Buenas noches, ', 'Hoy ', 'La verdad es que ', 'Quería contarte que ',
+    'No sé, ', 'Últimamente ', 'Esta semana ', ''
+], dtype=object)
+
+BENIGN_BODIES = np.array([
+    'fue un día normal en el trabajo',
+    'me siento bien, salí a caminar con mis amigos',
+    'estoy un poco preocupado por los exámenes',
+    'dormí mal anoche y estoy cansado',
+    'me siento feliz y tranquilo',
+    'tuve una discusión con mi familia y estoy molesto',
+    'me siento mejor, gracias por la ayuda de ayer',
+    'estoy ansioso por la entrevista de mañana',
+    'fui al psicólogo y hablamos de mis metas',
+    'me siento triste y vacío sin razón aparente',
+    'estoy estresado con tantas tareas',
+    'hice ejercicio y me siento relajado',
+    'extraño a mis amigos, me siento solo',
+    'estoy nervioso por lo que pueda pasar',
+    'hoy estoy contento y optimista'
+], dtype=object)
+
+CRISIS_BODIES = np.array([
+    'no puedo más con esta situación, todo parece sin esperanza',
+    'he pensado en hacerme daño, el dolor es insoportable',
+    'no quiero vivir así, nadie me entiende',
+    'me siento completamente solo y desesperado',
+    'a veces pienso en el suicidio',
+    'no hay salida, es inútil seguir intentando'
+], dtype=object)
+
+ANA_RESPONSES = np.array([
+    'Entiendo cómo te sientes. ¿Quieres contarme más?',
+    'Gracias por compartirlo conmigo. ¿Has probado respirar profundo?',
+    'Es importante que busques apoyo. Estoy aquí para ayudarte.',
+    '¿Qué crees que podría ayudarte a sentirte un poco mejor hoy?',
+    'Lo que sientes es válido. Vamos paso a paso.'
+], dtype=object)
+
+MOOD_COLUMNS = ['user_id', 'date', 'mood_score', 'anxiety_level', 'sleep_quality', 'energy_level',
+                'social_interaction', 'exercise', 'medication_taken']
+CHAT_COLUMNS = ['user_id', 'timestamp', 'sender', 'message']
+
+
+class SyntheticDataGenerator:
+    """Vectorized generator of mood check-ins and Spanish chat messages for load tests.
+
+    Every user draws from its own ``np.random.Generator`` seeded with
+    ``(seed, user_id)``, so a user's data is reproducible no matter how the
+    population is chunked or which other users are generated alongside it.
+    """
+
+    def __init__(self, seed: int = 42, crisis_rate: float = 0.02, activity_skew: float = 0.8,
+                 mood_entries_per_day: float = 1.5, messages_per_day: float = 3.0,
+                 ana_reply_rate: float = 0.9):
+        self.seed = seed
+        self.crisis_rate = crisis_rate
+        # Sigma of the lognormal per-user activity multiplier: 0 gives uniform users,
+        # larger values give a few heavy users and a long tail of occasional ones.
+        self.activity_skew = activity_skew
+        self.mood_entries_per_day = mood_entries_per_day
+        self.messages_per_day = messages_per_day
+        self.ana_reply_rate = ana_reply_rate
+
+    def user_rng(self, user_id: int) -> np.random.Generator:
+        """Independent random stream for one user"""
+        return np.random.default_rng([self.seed, int(user_id)])
+
+    def _activity(self, rng: np.random.Generator) -> float:
+        """Per-user activity multiplier with mean 1."""
+        sigma = self.activity_skew
+        return float(rng.lognormal(-0.5 * sigma ** 2, sigma)) if sigma > 0 else 1.0
+
+    def generate_mood_checkins(self, user_id: int, days: int,
+                               end: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """Generate one user's mood check-ins as column arrays."""
+        rng = self.user_rng(user_id)
+        end = end or datetime.now()
+        n_days = days + 1
+        dates = np.datetime64(end - timedelta(days=days), 'us') + np.arange(n_days) * np.timedelta64(1, 'D')
+
+        # Daily mood: noise + weekly cycle + slow trend, as in the original sample data
+        base_mood = rng.normal(0, 0.3, n_days)
+        weekly_pattern = np.sin(np.arange(n_days) * 2 * np.pi / 7) * 0.2
+        trend = np.linspace(-0.1, 0.1, n_days)
+        mood_scores = np.clip(base_mood + weekly_pattern + trend, -1, 1)
+
+        # At least one entry per day, more for active users
+        rate = self.mood_entries_per_day * self._activity(rng)
+        entries = np.maximum(1, rng.poisson(rate, n_days))
+        day_index = np.repeat(np.arange(n_days), entries)
+        n = len(day_index)
+
+        return {
+            'user_id': np.full(n, user_id, dtype=np.int64),
+            'date': dates[day_index],
+            'mood_score': mood_scores[day_index] + rng.normal(0, 0.1, n),
+            'anxiety_level': np.clip(rng.normal(5, 2, n), 0, 10),
+            'sleep_quality': np.clip(rng.normal(7, 1.5, n), 1, 10),
+            'energy_level': np.clip(rng.normal(6, 2, n), 1, 10),
+            'social_interaction': (rng.random(n) < 0.7).astype(np.int64),
+            'exercise': (rng.random(n) < 0.4).astype(np.int64),
+            'medication_taken': (rng.random(n) < 0.8).astype(np.int64)
+        }
+
+    def generate_chat_messages(self, user_id: int, days: int,
+                               end: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """Generate one user's chat history with Ana as column arrays, sorted by time."""
+        rng = self.user_rng(user_id)
+        end = end or datetime.now()
+        start = np.datetime64(end - timedelta(days=days), 's')
+
+        n_user = int(rng.poisson(self.messages_per_day * self._activity(rng) * days))
+        # Conversations cluster in the evening: hour of day ~ N(20, 4) wrapped to 0-23
+        day_offsets = rng.integers(0, max(days, 1), n_user) * 86400
+        hour_offsets = (np.round(rng.normal(20, 4, n_user)).astype(np.int64) % 24) * 3600
+        user_times = day_offsets + hour_offsets + rng.integers(0, 3600, n_user)
+
+        is_crisis = rng.random(n_user) < self.crisis_rate
+        bodies = BENIGN_BODIES[rng.integers(0, len(BENIGN_BODIES), n_user)]
+        bodies[is_crisis] = CRISIS_BODIES[rng.integers(0, len(CRISIS_BODIES), int(is_crisis.sum()))]
+        user_texts = OPENERS[rng.integers(0, len(OPENERS), n_user)] + bodies
+
+        replied = rng.random(n_user) < self.ana_reply_rate
+        n_ana = int(replied.sum())
+        ana_times = user_times[replied] + rng.integers(5, 120, n_ana)
+        ana_texts = ANA_RESPONSES[rng.integers(0, len(ANA_RESPONSES), n_ana)]
+
+        times = np.concatenate([user_times, ana_times])
+        order = np.argsort(times, kind='stable')
+        n = len(times)
+
+        return {
+            'user_id': np.full(n, user_id, dtype=np.int64),
+            'timestamp': (start + times.astype('timedelta64[s]'))[order],
+            'sender': np.concatenate([np.full(n_user, 'user', dtype=object),
+                                      np.full(n_ana, 'ana', dtype=object)])[order],
+            'message': np.concatenate([user_texts, ana_texts])[order]
+        }
+
+    def iter_chunks(self, kind: str, user_ids, days: int, chunk_rows: int = 1_000_000,
+                    end: Optional[datetime] = None) -> Iterator[pd.DataFrame]:
+        """Yield DataFrames of roughly ``chunk_rows`` rows covering all users."""
+        generate = self.generate_mood_checkins if kind == 'mood' else self.generate_chat_messages
+        columns = MOOD_COLUMNS if kind == 'mood' else CHAT_COLUMNS
+        end = end or datetime.now()
+
+        pending = []
+        pending_rows = 0
+        for user_id in user_ids:
+            data = generate(user_id, days, end)
+            pending.append(data)
+            pending_rows += len(data['user_id'])
+            if pending_rows >= chunk_rows:
+                yield _concat_columns(pending, columns)
+                pending, pending_rows = [], 0
+
+        if pending:
+            yield _concat_columns(pending, columns)
+
+    def write(self, path: str, kind: str, n_users: int, days: int, fmt: str = None,
+              chunk_rows: int = 1_000_000, first_user_id: int = 1) -> Dict[str, Any]:
+        """Write a synthetic dataset to Parquet or JSONL in chunks."""
+        fmt = fmt or ('parquet' if path.endswith('.parquet') else 'jsonl')
+        user_ids = range(first_user_id, first_user_id + n_users)
+        end = datetime.now()
+
+        start_time = time.perf_counter()
+        total_rows = 0
+        writer = None
+
+        try:
+            if fmt == 'parquet':
+                try:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                except ImportError:
+                    raise RuntimeError("pyarrow no disponible. Usa --format jsonl o instala pyarrow.")
+
+                for chunk in self.iter_chunks(kind, user_ids, days, chunk_rows, end):
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table)
+                    total_rows += len(chunk)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    for chunk in self.iter_chunks(kind, user_ids, days, chunk_rows, end):
+                        chunk = _to_json_columns(chunk)
+                        f.write(chunk.to_json(orient='records', lines=True, force_ascii=False))
+                        total_rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        elapsed = time.perf_counter() - start_time
+        return {
+            'path': path,
+            'format': fmt,
+            'kind': kind,
+            'users': n_users,
+            'days': days,
+            'rows': total_rows,
+            'seconds': elapsed,
+            'rows_per_second': total_rows / elapsed if elapsed > 0 else 0.0
+        }
+
+
+def _concat_columns(parts: List[Dict[str, np.ndarray]], columns: List[str]) -> pd.DataFrame:
+    """Concatenate per-user column arrays into one DataFrame."""
+    return pd.DataFrame({col: np.concatenate([p[col] for p in parts]) for col in columns})
+
+
+def _to_json_columns(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Render datetime columns as the ISO strings the analyzers parse."""
+    chunk = chunk.copy()
+    if 'timestamp' in chunk:
+        chunk['timestamp'] = chunk['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    if 'date' in chunk:
+        chunk['date'] = chunk['date'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    return chunk
+
+
+def main(argv=None):
+    """Main function to generate synthetic load-test data."""
+    parser = argparse.ArgumentParser(description='Generador de datos sintéticos para pruebas de carga')
+    parser.add_argument('--kind', choices=['mood', 'chat'], default='chat')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--format', choices=['parquet', 'jsonl'], default=None)
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--crisis-rate', type=float, default=0.02)
+    parser.add_argument('--activity-skew', type=float, default=0.8)
+    parser.add_argument('--messages-per-day', type=float, default=3.0)
+    parser.add_argument('--mood-entries-per-day', type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    output = args.output or f"synthetic_{args.kind}.{args.format or 'jsonl'}"
+    generator = SyntheticDataGenerator(
+        seed=args.seed,
+        crisis_rate=args.crisis_rate,
+        activity_skew=args.activity_skew,
+        mood_entries_per_day=args.mood_entries_per_day,
+        messages_per_day=args.messages_per_day
+    )
+
+    print(f"🧪 Generando datos '{args.kind}' para {args.users:,} usuarios y {args.days} días...")
+    stats = generator.write(output, args.kind, args.users, args.days, args.format, args.chunk_rows)
+    print(f"✅ {stats['rows']:,} filas escritas en {stats['path']} "
+          f"({stats['rows_per_second']:,.0f} filas/s)")
+    return stats
+
+
+if __name__ == "__main__":
+    main()
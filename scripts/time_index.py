@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Iterable, Optional
+import numpy as np
+
+
+def to_epoch_ns(value) -> int:
+    """Convert a datetime, ISO string or numpy datetime64 to int64 nanoseconds.
+
+    Aware datetimes are converted to UTC; naive ones are taken as UTC.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        return int(np.datetime64(value, 'ns').astype(np.int64))
+    return int(np.datetime64(value, 'ns').astype(np.int64))
+
+
+class UserTimeSeriesIndex:
+    """Sorted timestamps with prefix sums for one user's scored events.
+
+    ``prefix[field][i]`` holds the sum of the first ``i`` values, so the sum,
+    count and mean over any time range cost two binary searches and no scan.
+    In-order appends are amortized O(1); an out-of-order append re-sorts.
+    """
+
+    def __init__(self, fields: List[str], capacity: int = 64):
+        self.fields = list(fields)
+        self.size = 0
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.prefix = {field: np.zeros(capacity + 1) for field in self.fields}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]], fields: List[str],
+                     timestamp_key: str = 'timestamp') -> 'UserTimeSeriesIndex':
+        """Build an index from dicts such as a mood timeline or crisis analyses."""
+        records = list(records)
+        timestamps = np.fromiter((to_epoch_ns(r[timestamp_key]) for r in records), dtype=np.int64,
+                                 count=len(records))
+        values = {field: np.fromiter((float(r.get(field, 0) or 0) for r in records), dtype=np.float64,
+                                     count=len(records))
+                  for field in fields}
+        return cls.from_arrays(timestamps, values)
+
+    @classmethod
+    def from_arrays(cls, timestamps, values: Dict[str, np.ndarray]) -> 'UserTimeSeriesIndex':
+        """Build an index from a timestamp array and one value array per field."""
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]').astype(np.int64)
+        order = np.argsort(timestamps, kind='stable')
+        index = cls(list(values.keys()), capacity=max(len(timestamps), 1))
+        index.size = len(timestamps)
+        index.timestamps[:index.size] = timestamps[order]
+        for field, vals in values.items():
+            index.prefix[field][1:index.size + 1] = np.cumsum(np.asarray(vals, dtype=np.float64)[order])
+        return index
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = len(self.timestamps) * 2
+        timestamps = np.empty(capacity, dtype=np.int64)
+        timestamps[:self.size] = self.timestamps[:self.size]
+        self.timestamps = timestamps
+        for field in self.fields:
+            prefix = np.zeros(capacity + 1)
+            prefix[:self.size + 1] = self.prefix[field][:self.size + 1]
+            self.prefix[field] = prefix
+
+    def append(self, timestamp, **values):
+        """Add one event; fields not given count as 0."""
+        ts = to_epoch_ns(timestamp)
+        if self.size and ts < self.timestamps[self.size - 1]:
+            # Late event: rebuild in sorted order
+            timestamps = np.append(self.timestamps[:self.size], ts)
+            arrays = {field: np.append(np.diff(self.prefix[field][:self.size + 1]), values.get(field, 0.0))
+                      for field in self.fields}
+            rebuilt = UserTimeSeriesIndex.from_arrays(timestamps.astype('datetime64[ns]'), arrays)
+            self.__dict__.update(rebuilt.__dict__)
+            return
+
+        if self.size == len(self.timestamps):
+            self._grow()
+        self.timestamps[self.size] = ts
+        for field in self.fields:
+            prefix = self.prefix[field]
+            prefix[self.size + 1] = prefix[self.size] + values.get(field, 0.0)
+        self.size += 1
+
+    def _positions(self, start=None, end=None):
+        """Half-open position range [lo, hi) for timestamps in [start, end)."""
+        ts = self.timestamps[:self.size]
+        lo = 0 if start is None else int(np.searchsorted(ts, to_epoch_ns(start), side='left'))
+        hi = self.size if end is None else int(np.searchsorted(ts, to_epoch_ns(end), side='left'))
+        return lo, max(lo, hi)
+
+    def _stats(self, lo: int, hi: int, field: str) -> Dict[str, float]:
+        count = hi - lo
+        total = float(self.prefix[field][hi] - self.prefix[field][lo])
+        return {'count': count, 'sum': total, 'mean': total / count if count else 0.0}
+
+    def range_stats(self, field: str, start=None, end=None) -> Dict[str, float]:
+        """Count, sum and mean of a field for events in [start, end)."""
+        lo, hi = self._positions(start, end)
+        return self._stats(lo, hi, field)
+
+    def position_stats(self, field: str, lo: int, hi: int) -> Dict[str, float]:
+        """Stats over events by position, with slice semantics (negative indices allowed)."""
+        lo, hi, _ = slice(lo, hi).indices(self.size)
+        return self._stats(lo, max(lo, hi), field)
+
+    def last_n(self, field: str, n: int) -> Dict[str, float]:
+        """Stats over the most recent n events."""
+        return self._stats(max(0, self.size - n), self.size, field)
+
+    def since(self, field: str, days: float, now: Optional[datetime] = None) -> Dict[str, float]:
+        """Stats over the last ``days`` days, e.g. "last 3 days"."""
+        now = now or datetime.now(timezone.utc)
+        return self.range_stats(field, now - timedelta(days=days), None)
+
+    def bucket_stats(self, field: str, edges) -> Dict[str, np.ndarray]:
+        """Vectorized stats for consecutive buckets [edges[i], edges[i+1])."""
+        edges = np.asarray(edges).astype('datetime64[ns]').astype(np.int64)
+        positions = np.searchsorted(self.timestamps[:self.size], edges, side='left')
+        prefix = self.prefix[field][positions]
+        counts = np.diff(positions)
+        sums = np.diff(prefix)
+        means = np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0)
+        return {'count': counts, 'sum': sums, 'mean': means}
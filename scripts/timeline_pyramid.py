@@ -0,0 +1,150 @@
+from typing import Dict, List, Any, Iterable, Optional
+import numpy as np
+
+from time_index import to_epoch_ns
+
+# Aggregate levels above the per-message one, coarsest last
+BUCKET_NS = {
+    'hour': 3600 * 10**9,
+    'day': 86400 * 10**9,
+    'week': 7 * 86400 * 10**9
+}
+
+LEVELS = ('message',) + tuple(BUCKET_NS)
+
+# 1970-01-01 was a Thursday; shift by three days so weeks start on Monday
+_WEEK_SHIFT_NS = 3 * 86400 * 10**9
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of at most n points that keep the curve's shape.
+
+    The first and last points are always kept. Each middle bucket keeps the
+    point forming the largest triangle with the previously kept point and
+    the mean of the next bucket, so peaks and dips survive downsampling.
+    """
+    size = len(x)
+    if n >= size or size <= 2:
+        return np.arange(size)
+    if n <= 2:
+        return np.array([0, size - 1])[:max(n, 0)]
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (size - 2) / (n - 2)
+    selected = np.empty(n, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+
+    previous = 0
+    for i in range(n - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_hi = min(max(int((i + 2) * every) + 1, hi + 1), size)
+        next_x = x[hi:next_hi].mean()
+        next_y = y[hi:next_hi].mean()
+        areas = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                       - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+class TimelinePyramid:
+    """A timeline stored at several resolutions: per message, hour, day and week.
+
+    Each aggregate level holds, per bucket, the bucket start, the number of
+    messages and the min/mean/max of every field, built in one vectorized
+    pass with ``reduceat``. A dashboard asks ``select()`` for the finest level
+    that fits its point budget and reads only that level; ``downsample()``
+    picks at most N shape-preserving raw points for any zoom range.
+    """
+
+    def __init__(self, timestamps, values: Dict[str, np.ndarray], order: Optional[np.ndarray] = None):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.values = {field: np.asarray(vals, dtype=np.float64) for field, vals in values.items()}
+        # Position of each sorted point in the caller's original record list
+        self.order = order if order is not None else np.arange(len(self.timestamps))
+        self.levels = {name: self._aggregate(size, _WEEK_SHIFT_NS if name == 'week' else 0)
+                       for name, size in BUCKET_NS.items()}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]], fields: List[str],
+                     timestamp_key: str = 'timestamp') -> 'TimelinePyramid':
+        """Build from dicts such as generate_mood_timeline entries."""
+        records = list(records)
+        timestamps = np.fromiter((to_epoch_ns(r[timestamp_key]) for r in records), dtype=np.int64,
+                                 count=len(records))
+        order = np.argsort(timestamps, kind='stable')
+        values = {field: np.fromiter((float(r.get(field, 0) or 0) for r in records), dtype=np.float64,
+                                     count=len(records))[order]
+                  for field in fields}
+        return cls(timestamps[order], values, order)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _aggregate(self, bucket_ns: int, shift_ns: int) -> Dict[str, Any]:
+        if not len(self.timestamps):
+            empty = np.empty(0)
+            return {'start': np.empty(0, dtype=np.int64), 'count': np.empty(0, dtype=np.int64),
+                    **{field: {'min': empty, 'mean': empty, 'max': empty} for field in self.values}}
+
+        keys = (self.timestamps + shift_ns) // bucket_ns
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        level = {'start': keys[starts] * bucket_ns - shift_ns, 'count': counts}
+        for field, vals in self.values.items():
+            level[field] = {
+                'min': np.minimum.reduceat(vals, starts),
+                'mean': np.add.reduceat(vals, starts) / counts,
+                'max': np.maximum.reduceat(vals, starts)
+            }
+        return level
+
+    def _bucket_range(self, name: str, start=None, end=None):
+        starts = self.timestamps if name == 'message' else self.levels[name]['start']
+        lo = 0 if start is None else int(np.searchsorted(starts, to_epoch_ns(start), side='left'))
+        hi = len(starts) if end is None else int(np.searchsorted(starts, to_epoch_ns(end), side='left'))
+        return lo, max(lo, hi)
+
+    def select(self, max_points: int, start=None, end=None) -> str:
+        """Finest level with at most max_points buckets in [start, end); 'week' if none fits."""
+        for name in LEVELS:
+            lo, hi = self._bucket_range(name, start, end)
+            if hi - lo <= max_points:
+                return name
+        return LEVELS[-1]
+
+    def level(self, name: str, start=None, end=None, last: Optional[int] = None) -> Dict[str, Any]:
+        """Buckets of one aggregate level in [start, end), optionally only the last N."""
+        lo, hi = self._bucket_range(name, start, end)
+        if last is not None:
+            lo = max(lo, hi - last)
+        data = self.levels[name]
+        return {
+            'start': data['start'][lo:hi],
+            'count': data['count'][lo:hi],
+            **{field: {stat: arr[lo:hi] for stat, arr in data[field].items()} for field in self.values}
+        }
+
+    def downsample(self, field: str, max_points: int, start=None, end=None) -> np.ndarray:
+        """Original record positions of at most max_points LTTB-selected points in [start, end)."""
+        lo, hi = self._bucket_range('message', start, end)
+        # Offsets from the first point keep the triangle areas well within float precision
+        times = self.timestamps[lo:hi]
+        picked = lttb(times - (times[0] if len(times) else 0), self.values[field][lo:hi], max_points)
+        return self.order[lo + picked]
+
+    def to_dict(self, max_points: int = 500) -> Dict[str, Any]:
+        """JSON-ready aggregate levels, each capped at its most recent max_points buckets."""
+        result = {}
+        for name in BUCKET_NS:
+            data = self.level(name, last=max_points)
+            result[name] = {
+                'start': np.datetime_as_string(data['start'].astype('datetime64[ns]'), unit='s').tolist(),
+                'count': data['count'].tolist(),
+                **{field: {stat: np.round(arr, 4).tolist() for stat, arr in data[field].items()}
+                   for field in self.values}
+            }
+        return result
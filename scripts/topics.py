@@ -0,0 +1,121 @@
+import re
+import heapq
+import itertools
+from typing import Dict, List, Iterable, Tuple
+
+# Compiled once; same pattern analyze_message_patterns has always used
+TOKEN_RE = re.compile(r'\b\w+\b')
+
+STOP_WORDS = frozenset({
+    'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'es', 'se', 'no', 'te', 'lo', 'le', 'da', 'su', 'por',
+    'son', 'con', 'para', 'al', 'del', 'los', 'las', 'me', 'mi', 'tu', 'si', 'yo', 'he', 'ha', 'muy', 'más',
+    'pero', 'como', 'todo', 'una', 'está', 'ser', 'hacer', 'puede', 'bien', 'ya', 'vez', 'día', 'vida', 'tiempo'
+})
+
+MIN_TOPIC_LENGTH = 4
+
+
+def topic_words(text: str) -> List[str]:
+    """Meaningful words of a message: lowercased, longer than 3 characters, no stop words."""
+    return [word for word in TOKEN_RE.findall(text.lower())
+            if len(word) >= MIN_TOPIC_LENGTH and word not in STOP_WORDS]
+
+
+class SpaceSavingTopK:
+    """Space-Saving heavy-hitter summary over a stream of words.
+
+    Keeps at most ``capacity`` counters. When a new word arrives and the
+    summary is full, it takes over the smallest counter and inherits its
+    count as error. For every tracked word, ``count - error <= true count
+    <= count``. Any word seen more than N / capacity times is guaranteed to
+    be tracked. Memory is fixed no matter how large the vocabulary grows.
+    While fewer than ``capacity`` distinct words have been seen, counts are
+    exact and ``top()`` matches ``Counter.most_common()``.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.total = 0
+        self._counters = {}
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._counters)
+
+    def _pop_min(self) -> Tuple[str, List]:
+        # Skip heap entries made stale by later increments
+        while True:
+            count, _, word = heapq.heappop(self._heap)
+            counter = self._counters.get(word)
+            if counter is not None and counter[0] == count:
+                return word, counter
+
+    def _compact_heap(self):
+        self._heap = [(c[0], c[2], w) for w, c in self._counters.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, word: str, weight: int = 1):
+        self.total += weight
+        counter = self._counters.get(word)
+        if counter is None:
+            if len(self._counters) < self.capacity:
+                counter = self._counters[word] = [0, 0, next(self._sequence)]
+            else:
+                evicted, old = self._pop_min()
+                del self._counters[evicted]
+                # The newcomer may have been seen up to old[0] times before
+                counter = self._counters[word] = [old[0], old[0], next(self._sequence)]
+        counter[0] += weight
+        heapq.heappush(self._heap, (counter[0], counter[2], word))
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._compact_heap()
+
+    def update(self, words: Iterable[str]):
+        for word in words:
+            self.add(word)
+
+    def top(self, k: int = 10) -> List[Tuple[str, int, int]]:
+        """(word, count, error) for the k largest counters, largest first."""
+        ranked = sorted(self._counters.items(), key=lambda item: (-item[1][0], item[1][2]))
+        return [(word, counter[0], counter[1]) for word, counter in ranked[:k]]
+
+    def most_common(self, k: int = 10) -> Dict[str, int]:
+        return {word: count for word, count, _ in self.top(k)}
+
+    def guaranteed_top(self, k: int = 10) -> List[Tuple[str, int, int]]:
+        """Top entries whose lower bound beats the (k+1)-th count, so they are truly top-k."""
+        ranked = self.top(k + 1)
+        threshold = ranked[k][1] if len(ranked) > k else 0
+        return [entry for entry in ranked[:k] if entry[1] - entry[2] >= threshold]
+
+    @property
+    def max_error(self) -> float:
+        """Upper bound on any counter's overestimate: N / capacity."""
+        return self.total / self.capacity
+
+    def merge(self, other: 'SpaceSavingTopK') -> 'SpaceSavingTopK':
+        """Combine two summaries (e.g. from different workers) into this one.
+
+        A word missing from a full summary may have been seen up to that
+        summary's minimum count, which is added to both its count and error.
+        """
+        def floor(summary):
+            if len(summary._counters) < summary.capacity or not summary._counters:
+                return 0
+            return min(counter[0] for counter in summary._counters.values())
+
+        own_floor, other_floor = floor(self), floor(other)
+        merged = {}
+        for word in itertools.chain(self._counters, (w for w in other._counters if w not in self._counters)):
+            a = self._counters.get(word)
+            b = other._counters.get(word)
+            count = (a[0] if a else own_floor) + (b[0] if b else other_floor)
+            error = (a[1] if a else own_floor) + (b[1] if b else other_floor)
+            merged[word] = [count, error, a[2] if a else next(self._sequence)]
+
+        ranked = sorted(merged.items(), key=lambda item: (-item[1][0], item[1][2]))[:self.capacity]
+        self._counters = dict(ranked)
+        self.total += other.total
+        self._compact_heap()
+        return self
@@ -0,0 +1,238 @@
+import os
+import math
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Iterable
+import numpy as np
+
+from instrumentation import metrics
+from time_index import to_epoch_ns
+from topics import SpaceSavingTopK, topic_words
+
+DAY_SECONDS = 86400.0
+
+# Rescale forward-decay weights before exp() gets anywhere near overflow
+_MAX_EXPONENT = 50.0
+
+
+def _epoch_seconds(timestamp) -> float:
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    return to_epoch_ns(timestamp) / 1e9
+
+
+class DecayedCountMinSketch:
+    """Count-Min sketch whose counts decay exponentially with time.
+
+    Uses forward decay: an event at time t is added with weight
+    exp((t - landmark) / tau), and a query at time `now` multiplies by
+    exp(-(now - landmark) / tau). Updates are O(depth) and never touch the
+    rest of the table. Hashing is stable across processes (blake2b), so
+    sketches built by different workers with the same shape merge by adding
+    tables.
+    """
+
+    def __init__(self, tau_days: float, width: int = 2048, depth: int = 4, landmark: float = 0.0):
+        self.tau = tau_days * DAY_SECONDS
+        self.width = width
+        self.depth = depth
+        self.landmark = landmark
+        self.table = np.zeros((depth, width))
+        self.total = 0.0
+        self._rows = np.arange(depth)
+        self._bucket_cache = {}
+
+    def buckets(self, term: str) -> np.ndarray:
+        cached = self._bucket_cache.get(term)
+        if cached is not None:
+            return cached
+        digest = hashlib.blake2b(term.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        buckets = np.array([(h1 + i * h2) % self.width for i in range(self.depth)], dtype=np.int64)
+        if len(self._bucket_cache) > 100_000:
+            self._bucket_cache.clear()
+        self._bucket_cache[term] = buckets
+        return buckets
+
+    def _rescale(self, landmark: float):
+        factor = math.exp(-(landmark - self.landmark) / self.tau)
+        self.table *= factor
+        self.total *= factor
+        self.landmark = landmark
+
+    def add_many(self, terms: List[str], timestamp: float):
+        """Add one occurrence of each term at a single timestamp."""
+        if not terms:
+            return
+        exponent = (timestamp - self.landmark) / self.tau
+        if exponent > _MAX_EXPONENT:
+            self._rescale(timestamp)
+            exponent = 0.0
+        weight = math.exp(exponent)
+        for term in terms:
+            self.table[self._rows, self.buckets(term)] += weight
+        self.total += weight * len(terms)
+
+    def estimate(self, terms: Iterable[str], now: float) -> np.ndarray:
+        """Decayed count estimate for each term at time ``now`` (never underestimates)."""
+        terms = list(terms)
+        if not terms:
+            return np.zeros(0)
+        buckets = np.stack([self.buckets(t) for t in terms])
+        estimates = self.table[self._rows[None, :], buckets].min(axis=1)
+        return estimates * math.exp(-(now - self.landmark) / self.tau)
+
+    def decayed_total(self, now: float) -> float:
+        return self.total * math.exp(-(now - self.landmark) / self.tau)
+
+    def merge(self, other: 'DecayedCountMinSketch') -> 'DecayedCountMinSketch':
+        if (self.width, self.depth, self.tau) != (other.width, other.depth, other.tau):
+            raise ValueError("Solo se pueden combinar sketches con la misma forma y decaimiento")
+        landmark = max(self.landmark, other.landmark)
+        self._rescale(landmark)
+        factor = math.exp(-(landmark - other.landmark) / other.tau)
+        self.table += other.table * factor
+        self.total += other.total * factor
+        return self
+
+
+class TrendingTopicTracker:
+    """Platform-wide rising topics from two decayed Count-Min sketches.
+
+    The recent sketch decays with a time constant of ``window_days``. The
+    baseline sketch decays over ``baseline_days``. A term is rising when its
+    share of the recent mass beats its share of the baseline mass. Candidate
+    terms come from a Space-Saving summary, so memory stays fixed: two
+    depth x width tables plus ``candidates`` counters.
+    """
+
+    def __init__(self, window_days: float = 7, baseline_days: float = 60, width: int = 2048, depth: int = 4,
+                 candidates: int = 500):
+        self.window_days = window_days
+        self.baseline_days = baseline_days
+        self.recent = DecayedCountMinSketch(window_days, width, depth)
+        self.baseline = DecayedCountMinSketch(baseline_days, width, depth)
+        self.candidates = SpaceSavingTopK(candidates)
+        self.last_seen = 0.0
+
+    def add_terms(self, terms: List[str], timestamp):
+        t = _epoch_seconds(timestamp)
+        self.recent.add_many(terms, t)
+        self.baseline.add_many(terms, t)
+        self.candidates.update(terms)
+        self.last_seen = max(self.last_seen, t)
+
+    def add_message(self, text: str, timestamp):
+        """Feed one user message with the analyze_message_patterns tokenization."""
+        self.add_terms(topic_words(text), timestamp)
+
+    def add_messages(self, messages: Iterable[Dict[str, Any]]) -> int:
+        added = 0
+        for msg in messages:
+            if msg.get('sender', 'user') != 'user':
+                continue
+            self.add_message(msg.get('message') or msg.get('content', ''), msg['timestamp'])
+            added += 1
+        metrics.count('trending.messages', added)
+        return added
+
+    def top_rising(self, k: int = 10, now=None, min_recent: float = 3.0) -> List[Dict[str, Any]]:
+        """Terms whose recent share most exceeds their baseline share."""
+        with metrics.stage('trending.query'):
+            now = _epoch_seconds(now) if now is not None else (
+                self.last_seen or datetime.now(timezone.utc).timestamp())
+            terms = [word for word, _, _ in self.candidates.top(self.candidates.capacity)]
+            if not terms:
+                return []
+
+            recent = self.recent.estimate(terms, now)
+            baseline = self.baseline.estimate(terms, now)
+            recent_total = max(self.recent.decayed_total(now), 1e-12)
+            baseline_total = max(self.baseline.decayed_total(now), 1e-12)
+
+            # Additive smoothing of one occurrence keeps rare terms from dominating
+            recent_share = (recent + 1) / (recent_total + len(terms))
+            baseline_share = (baseline + 1) / (baseline_total + len(terms))
+            lift = recent_share / baseline_share
+
+            eligible = np.flatnonzero(recent >= min_recent)
+            ranked = eligible[np.argsort(-lift[eligible], kind='stable')][:k]
+            return [{'term': terms[i], 'recent': float(recent[i]), 'baseline': float(baseline[i]),
+                     'lift': float(lift[i])} for i in ranked]
+
+    def merge(self, other: 'TrendingTopicTracker') -> 'TrendingTopicTracker':
+        """Fold in a tracker built by another worker (same configuration)."""
+        self.recent.merge(other.recent)
+        self.baseline.merge(other.baseline)
+        self.candidates.merge(other.candidates)
+        self.last_seen = max(self.last_seen, other.last_seen)
+        return self
+
+    def save(self, path: str):
+        candidates = self.candidates.top(self.candidates.capacity)
+        tmp_path = f'{path}.tmp.npz'
+        np.savez_compressed(
+            tmp_path,
+            config=np.array([self.window_days, self.baseline_days, self.recent.width, self.recent.depth,
+                             self.candidates.capacity, self.last_seen, self.candidates.total]),
+            recent=self.recent.table, recent_meta=np.array([self.recent.landmark, self.recent.total]),
+            baseline=self.baseline.table, baseline_meta=np.array([self.baseline.landmark, self.baseline.total]),
+            candidate_terms=np.array([c[0] for c in candidates], dtype=str),
+            candidate_counts=np.array([[c[1], c[2]] for c in candidates], dtype=np.int64).reshape(-1, 2)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TrendingTopicTracker':
+        data = np.load(path)
+        window, baseline, width, depth, capacity, last_seen, total = data['config']
+        tracker = cls(window, baseline, int(width), int(depth), int(capacity))
+        tracker.last_seen = float(last_seen)
+        tracker.recent.table = data['recent']
+        tracker.recent.landmark, tracker.recent.total = data['recent_meta']
+        tracker.baseline.table = data['baseline']
+        tracker.baseline.landmark, tracker.baseline.total = data['baseline_meta']
+        for term, (count, error) in zip(data['candidate_terms'], data['candidate_counts']):
+            tracker.candidates._counters[str(term)] = [int(count), int(error), next(tracker.candidates._sequence)]
+        tracker.candidates.total = int(total)
+        tracker.candidates._compact_heap()
+        return tracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Temas en tendencia en toda la plataforma')
+    parser.add_argument('--store', default='trending_topics.npz', help='Archivo del tracker')
+    parser.add_argument('--input', help='Dataset de chat a ingerir (JSONL, Parquet o log .mhlog)')
+    parser.add_argument('--merge', nargs='*', default=[], help='Trackers de otros workers a combinar')
+    parser.add_argument('--days', type=float, default=7, help='Ventana reciente en días (al crear el tracker)')
+    parser.add_argument('--baseline-days', type=float, default=60, help='Ventana de referencia en días')
+    parser.add_argument('--top', type=int, default=10, help='Número de temas a mostrar')
+    args = parser.parse_args()
+
+    if os.path.exists(args.store):
+        tracker = TrendingTopicTracker.load(args.store)
+    else:
+        tracker = TrendingTopicTracker(args.days, args.baseline_days)
+
+    if args.input:
+        from checkpoint import load_messages_by_user
+        with metrics.stage('trending.ingest'):
+            added = sum(tracker.add_messages(messages) for messages in load_messages_by_user(args.input).values())
+        print(f"📥 {added:,} mensajes ingeridos")
+
+    for path in args.merge:
+        tracker.merge(TrendingTopicTracker.load(path))
+        print(f"🔗 Combinado: {path}")
+
+    tracker.save(args.store)
+
+    print(f"\n📈 TEMAS EN ASCENSO (últimos {tracker.window_days:g} días vs. {tracker.baseline_days:g} días)")
+    for i, item in enumerate(tracker.top_rising(args.top), 1):
+        print(f"  {i}. {item['term']}: x{item['lift']:.2f} (reciente {item['recent']:.1f}, "
+              f"referencia {item['baseline']:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import os
+import json
+import heapq
+import argparse
+import itertools
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from instrumentation import metrics
+
+# Higher rank is more urgent
+RISK_LEVEL_RANK = {'CRÍTICO': 3, 'ALTO': 2, 'MEDIO': 1, 'BAJO': 0}
+
+# Levels that produce a crisis alert and therefore enter the queue
+ALERT_LEVELS = ('CRÍTICO', 'ALTO')
+
+_queues = {}
+
+
+def _epoch(timestamp) -> float:
+    if not timestamp:
+        return 0.0
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return timestamp.timestamp()
+
+
+class CrisisTriageQueue:
+    """Cross-user crisis triage queue ordered by urgency.
+
+    Ordering: risk level, then escalation, then risk score, then the most
+    recent assessment. Backed by a binary heap with lazy invalidation: each
+    user has at most one live entry, and re-alerting a user replaces that
+    entry, so push, update and pop are O(log n).
+
+    Like the cohort store, it persists as a snapshot plus an append-only
+    journal of pushes and removals.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        if path:
+            self._load()
+
+    @property
+    def journal_path(self) -> str:
+        return f'{self.path}.journal'
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._entries
+
+    def _priority(self, alert: Dict[str, Any]):
+        return (
+            -RISK_LEVEL_RANK.get(alert['risk_level'], 0),
+            -int(bool(alert.get('escalation_detected'))),
+            -float(alert.get('risk_score', 0)),
+            -_epoch(alert.get('assessed_at'))
+        )
+
+    def _push(self, alert: Dict[str, Any]):
+        user_id = alert['user_id']
+        previous = self._entries.pop(user_id, None)
+        if previous is not None:
+            previous[-1] = None  # Invalidate the old heap entry
+        entry = [self._priority(alert), next(self._counter), alert]
+        self._entries[user_id] = entry
+        heapq.heappush(self._heap, entry)
+        return previous is not None
+
+    def _remove(self, user_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return None
+        alert = entry[-1]
+        entry[-1] = None
+        return alert
+
+    def _pop_live(self) -> Optional[Dict[str, Any]]:
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            alert = entry[-1]
+            if alert is not None:
+                del self._entries[alert['user_id']]
+                return alert
+        return None
+
+    def _journal(self, op: str, payload: Dict[str, Any]):
+        if self.path:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'op': op, **payload}, ensure_ascii=False, default=str) + '\n')
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for alert in json.load(f).get('alerts', []):
+                    self._push(alert)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line from an interrupted write
+                        continue
+                    if entry['op'] == 'push':
+                        self._push(entry['alert'])
+                    else:
+                        self._remove(entry['user_id'])
+
+    def push(self, user_id, risk_level: str, risk_score: float, escalation_detected: bool = False,
+             assessed_at=None, **details) -> bool:
+        """Add or re-prioritize a user's alert; returns True if it replaced an earlier one."""
+        alert = {
+            'user_id': str(user_id),
+            'risk_level': risk_level,
+            'risk_score': float(risk_score),
+            'escalation_detected': bool(escalation_detected),
+            'assessed_at': assessed_at or datetime.now().isoformat(),
+            **details
+        }
+        replaced = self._push(alert)
+        self._journal('push', {'alert': alert})
+        metrics.count('triage.deduplicated' if replaced else 'triage.enqueued')
+        return replaced
+
+    def remove(self, user_id) -> Optional[Dict[str, Any]]:
+        """Drop a user's alert (e.g. once a new assessment no longer requires one)."""
+        alert = self._remove(str(user_id))
+        if alert is not None:
+            self._journal('remove', {'user_id': alert['user_id']})
+        return alert
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """Take the most urgent alert off the queue."""
+        alert = self._pop_live()
+        if alert is not None:
+            self._journal('remove', {'user_id': alert['user_id']})
+            metrics.count('triage.popped')
+        return alert
+
+    def peek(self) -> Optional[Dict[str, Any]]:
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+        return self._heap[0][-1] if self._heap else None
+
+    def top_k(self, k: int) -> List[Dict[str, Any]]:
+        """The k most urgent alerts without removing them (O(k log n)).
+
+        Live entries are popped and pushed back unchanged, original counters
+        included, so ties keep their order; only invalidated entries are dropped.
+        """
+        live = []
+        while self._heap and len(live) < k:
+            entry = heapq.heappop(self._heap)
+            if entry[-1] is not None:
+                live.append(entry)
+        for entry in live:
+            heapq.heappush(self._heap, entry)
+        return [entry[-1] for entry in live]
+
+    def record_assessment(self, assessment: Dict[str, Any]) -> bool:
+        """Queue, re-prioritize or clear a user from a comprehensive_crisis_assessment result."""
+        if assessment['final_risk_level'] not in ALERT_LEVELS:
+            self.remove(assessment['user_id'])
+            return False
+        alert = assessment.get('crisis_alert', {})
+        self.push(assessment['user_id'],
+                  risk_level=assessment['final_risk_level'],
+                  risk_score=assessment.get('max_risk_score', 0),
+                  escalation_detected=assessment.get('escalation_detected', False),
+                  assessed_at=assessment.get('assessment_timestamp'),
+                  requires_immediate_attention=alert.get('requires_immediate_attention', False))
+        return True
+
+    def compact(self):
+        """Write live alerts as a snapshot atomically and clear the journal."""
+        if not self.path:
+            return
+        live = sorted(self._entries.values())
+        # Rebuild the heap without invalidated entries
+        self._heap = live
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'alerts': [entry[-1] for entry in live]}, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+def triage_queue_from_env() -> Optional[CrisisTriageQueue]:
+    """Shared queue at ANALYTICS_TRIAGE_QUEUE, or None when triage is off."""
+    path = os.environ.get('ANALYTICS_TRIAGE_QUEUE')
+    if not path:
+        return None
+    if path not in _queues:
+        _queues[path] = CrisisTriageQueue(path)
+    return _queues[path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cola de triaje de crisis entre usuarios')
+    parser.add_argument('--queue', default=os.environ.get('ANALYTICS_TRIAGE_QUEUE', 'triage_queue.json'),
+                        help='Archivo de la cola de triaje')
+    parser.add_argument('--top', type=int, default=10, help='Número de pacientes a mostrar')
+    parser.add_argument('--pop', action='store_true', help='Atender (retirar) al paciente más urgente')
+    parser.add_argument('--compact', action='store_true', help='Consolidar el journal en el snapshot')
+    args = parser.parse_args()
+
+    queue = CrisisTriageQueue(args.queue)
+
+    if args.pop:
+        alert = queue.pop()
+        if alert is None:
+            print("✅ No hay pacientes en la cola de triaje")
+        else:
+            print(f"🚨 Siguiente paciente: usuario {alert['user_id']} "
+                  f"({alert['risk_level']}, puntuación {alert['risk_score']:.2f})")
+    else:
+        print(f"🚨 COLA DE TRIAJE ({len(queue)} pacientes)")
+        print("=" * 40)
+        for position, alert in enumerate(queue.top_k(args.top), 1):
+            escalation = ' ⬆️ escalación' if alert['escalation_detected'] else ''
+            print(f"{position}. Usuario {alert['user_id']} - {alert['risk_level']} "
+                  f"(puntuación {alert['risk_score']:.2f}){escalation} - {alert['assessed_at']}")
+
+    if args.compact:
+        queue.compact()
+        print(f"🗜️ Cola consolidada: {args.queue}")
+
+
+if __name__ == "__main__":
+    main()